@@ -0,0 +1,47 @@
+"""create price_history table
+
+Revision ID: 7c4e1b9d2f10
+Revises: 2a18839a71e1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e1b9d2f10'
+down_revision: Union[str, Sequence[str], None] = '2a18839a71e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'price_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('asset_id', sa.Integer(), nullable=True),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('open_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('high_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('low_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('close_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('volume', sa.BigInteger(), nullable=True),
+        sa.Column('dividend', sa.Numeric(precision=10, scale=4), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['asset_id'],
+            ['assets.id'],
+        ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('asset_id', 'date', name='uq_price_history_asset_date'),
+    )
+    op.create_index(op.f('ix_price_history_id'), 'price_history', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_price_history_id'), table_name='price_history')
+    op.drop_table('price_history')
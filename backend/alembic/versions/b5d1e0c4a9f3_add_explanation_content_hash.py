@@ -0,0 +1,31 @@
+"""add content_hash to portfolio_calculation_explanations
+
+Revision ID: b5d1e0c4a9f3
+Revises: 7c4e1b9d2f10
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d1e0c4a9f3'
+down_revision: Union[str, Sequence[str], None] = '7c4e1b9d2f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'portfolio_calculation_explanations',
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('portfolio_calculation_explanations', 'content_hash')
@@ -1,17 +1,113 @@
+import json
 import os
 from typing import Optional
 
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from app.core.redis_cache import cache
+from app.core.redis_cache import async_cache
 from app.schemas.chat import ChatResponse
 from app.schemas.risk_profile import LLMGoalData
-from app.services.llm_service import send_to_llm_async
-from app.services.whisper_processor import whisper_processor
+from app.services.llm_response_cache import response_cache
+from app.services.llm_service import send_to_llm, stream_llm
+from app.services.whisper_processor import spool_upload, whisper_processor
 
 router = APIRouter(prefix="/dialog", tags=["dialog"])
 
 
+ALLOWED_AUDIO_EXTENSIONS = ['.mp3', '.wav', '.m4a', '.flac', '.ogg', '.mp4']
+
+
+def _check_audio_file(audio_file: UploadFile):
+    file_extension = os.path.splitext(audio_file.filename)[1].lower()
+    if file_extension not in ALLOWED_AUDIO_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неподдерживаемый формат файла. "
+            f"Разрешены: {', '.join(ALLOWED_AUDIO_EXTENSIONS)}",
+        )
+
+
+async def _read_user_message(
+    message: Optional[str], audio_file: Optional[UploadFile]
+) -> str:
+    """Текст сообщения: как есть либо расшифровка аудио через Whisper"""
+    if audio_file:
+        _check_audio_file(audio_file)
+        result = await whisper_processor.transcribe_audio_file(audio_file)
+        return result["text"].strip()
+
+    if message:
+        return message.strip()
+
+    raise HTTPException(status_code=400, detail="Нужно передать либо текст, либо аудио")
+
+
+async def _build_chat_response(
+    user_id: str, llm_response_text: str, extracted_json: Optional[dict]
+) -> ChatResponse:
+    """Флаги собранных полей цели; при полной цели сохраняет ее в кеш"""
+    # По умолчанию все поля False
+    term_bool = False
+    sum_bool = False
+    reason_bool = False
+    capital_bool = False
+    friendly_response = llm_response_text
+
+    # Проверяем, есть ли JSON данные
+    if extracted_json:
+        # Проверяем каждое поле: если есть значение и оно не "False", то True
+        term_val = extracted_json.get("term")
+        sum_val = extracted_json.get("sum")
+        reason_val = extracted_json.get("reason")
+        capital_val = extracted_json.get("capital")
+
+        term_bool = term_val is not None and str(term_val).lower() != "false"
+        sum_bool = sum_val is not None and str(sum_val).lower() != "false"
+        reason_bool = reason_val is not None and str(reason_val).lower() != "false"
+        capital_bool = capital_val is not None and str(capital_val).lower() != "false"
+
+        # Если все поля True, то парсим goal_data
+        if all([term_bool, sum_bool, reason_bool, capital_bool]):
+            try:
+                term = float(term_val)
+                sum_val_float = float(sum_val)
+                capital = float(capital_val)
+                reason = str(reason_val)
+
+                goal_data = LLMGoalData(
+                    term=term,
+                    sum=sum_val_float,
+                    reason=reason,
+                    capital=capital,
+                )
+
+                await async_cache.set_json(f"user:{user_id}:llm_goal", goal_data.dict())
+
+                friendly_response = (
+                    f"Отлично! Я понял вашу цель: {goal_data.reason}. "
+                    f"Срок: {goal_data.term} месяцев, "
+                    f"Сумма: {goal_data.sum:,} ₽, "
+                    f"Капитал: {goal_data.capital:,} ₽. "
+                    f"Теперь перейдем к определению вашего риск-профиля."
+                )
+            except Exception as e:
+                print(f"Ошибка при создании goal_data: {e}")
+
+    return ChatResponse(
+        response=friendly_response,
+        term=term_bool,
+        sum=sum_bool,
+        reason=reason_bool,
+        capital=capital_bool,
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def dialog_chat(
     user_id: str = Form(..., description="ID пользователя"),
@@ -27,90 +123,96 @@ async def dialog_chat(
     """
     print("Начал")
     try:
-        if audio_file:
-            allowed_extensions = ['.mp3', '.wav', '.m4a', '.flac', '.ogg', '.mp4']
-            file_extension = os.path.splitext(audio_file.filename)[1].lower()
-            if file_extension not in allowed_extensions:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Неподдерживаемый формат файла. "
-                    f"Разрешены: {', '.join(allowed_extensions)}",
-                )
-
-            result = await whisper_processor.transcribe_audio_file(audio_file)
-            user_message = result["text"].strip()
-
-        elif message:
-            user_message = message.strip()
-
-        else:
-            raise HTTPException(
-                status_code=400, detail="Нужно передать либо текст, либо аудио"
-            )
+        user_message = await _read_user_message(message, audio_file)
 
         print("Отправка в LLM")
-        llm_response_text, extracted_json = await send_to_llm_async(user_id, user_message)
+        llm_response_text, extracted_json = await send_to_llm(user_id, user_message)
         print(f"ответ от LLM {llm_response_text}")
         print(f"JSON данные {extracted_json}")
 
-        # По умолчанию все поля False
-        term_bool = False
-        sum_bool = False
-        reason_bool = False
-        capital_bool = False
-        friendly_response = llm_response_text
-
-        # Проверяем, есть ли JSON данные
-        if extracted_json:
-            # Проверяем каждое поле: если есть значение и оно не "False", то True
-            term_val = extracted_json.get("term")
-            sum_val = extracted_json.get("sum")
-            reason_val = extracted_json.get("reason")
-            capital_val = extracted_json.get("capital")
-
-            term_bool = term_val is not None and str(term_val).lower() != "false"
-            sum_bool = sum_val is not None and str(sum_val).lower() != "false"
-            reason_bool = reason_val is not None and str(reason_val).lower() != "false"
-            capital_bool = (
-                capital_val is not None and str(capital_val).lower() != "false"
-            )
-
-            # Если все поля True, то парсим goal_data
-            if all([term_bool, sum_bool, reason_bool, capital_bool]):
-                try:
-                    term = float(term_val)
-                    sum_val_float = float(sum_val)
-                    capital = float(capital_val)
-                    reason = str(reason_val)
-
-                    goal_data = LLMGoalData(
-                        term=term,
-                        sum=sum_val_float,
-                        reason=reason,
-                        capital=capital,
-                    )
-
-                    cache.set_json(f"user:{user_id}:llm_goal", goal_data.dict())
-
-                    friendly_response = (
-                        f"Отлично! Я понял вашу цель: {goal_data.reason}. "
-                        f"Срок: {goal_data.term} месяцев, "
-                        f"Сумма: {goal_data.sum:,} ₽, "
-                        f"Капитал: {goal_data.capital:,} ₽. "
-                        f"Теперь перейдем к определению вашего риск-профиля."
-                    )
-                except Exception as e:
-                    print(f"Ошибка при создании goal_data: {e}")
-
-        return ChatResponse(
-            response=friendly_response,
-            term=term_bool,
-            sum=sum_bool,
-            reason=reason_bool,
-            capital=capital_bool,
-        )
+        return await _build_chat_response(user_id, llm_response_text, extracted_json)
 
+    except HTTPException:
+        # 400 на формат файла и 503 при перегрузке Whisper отдаем как есть
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Ошибка обработки запроса: {str(e)}"
         )
+
+
+@router.post("/chat/stream")
+async def dialog_chat_stream(
+    user_id: str = Form(..., description="ID пользователя"),
+    message: Optional[str] = Form(None, description="Текстовое сообщение пользователя"),
+    audio_file: Optional[UploadFile] = File(
+        None, description="Аудио сообщение пользователя"
+    ),
+):
+    """
+    Потоковый вариант /dialog/chat (Server-Sent Events):
+    - event: transcript — {"text": ...} расшифрованные фразы голосового
+      сообщения по мере распознавания
+    - event: token — {"text": ...} фрагменты ответа по мере генерации,
+      JSON блок цели в них не попадает
+    - event: done — ChatResponse с итоговым текстом и флагами цели
+    - event: error — {"detail": ...}, если LLM упал посреди ответа
+    """
+    audio_path = None
+    if audio_file:
+        _check_audio_file(audio_file)
+        # Файл формы закрывается вместе с запросом, поэтому копируем его до ответа
+        audio_path, audio_hash = await spool_upload(audio_file)
+        # 503 отдаем до начала потока; запись из кеша воркеры не занимает
+        if not await whisper_processor.is_cached(audio_hash):
+            try:
+                whisper_processor.check_capacity()
+            except HTTPException:
+                _remove_file(audio_path)
+                raise
+        filename = audio_file.filename
+        user_message = None
+    else:
+        user_message = await _read_user_message(message, audio_file)
+
+    async def events():
+        nonlocal user_message
+        try:
+            if audio_path:
+                async for kind, payload in whisper_processor.stream_file(
+                    audio_path, filename, audio_hash
+                ):
+                    if kind == "partial":
+                        yield _sse_event("transcript", {"text": payload})
+                    else:
+                        user_message = payload["text"].strip()
+
+            async for kind, payload in stream_llm(user_id, user_message):
+                if kind == "token":
+                    yield _sse_event("token", {"text": payload})
+                else:
+                    response = await _build_chat_response(user_id, *payload)
+                    yield _sse_event("done", response.dict())
+        except Exception as e:
+            print(f"Ошибка потокового ответа LLM: {e}")
+            yield _sse_event("error", {"detail": f"Ошибка обработки запроса: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Отключаем буферизацию в nginx, чтобы токены уходили сразу
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Если клиент отключился до начала потока, файл удалится здесь
+        background=BackgroundTask(_remove_file, audio_path) if audio_path else None,
+    )
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+@router.get("/cache/stats")
+async def dialog_cache_stats():
+    """Попадания и промахи кеша ответов LLM в этом процессе"""
+    return response_cache.stats()
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import json
+import os
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.dependencies import get_current_user, get_db
-from app.core.redis_cache import cache
+from app.core.redis_cache import async_cache
 from app.models.user import User
 from app.schemas.portfolio import (
+    PortfolioAnalysisJob,
     PortfolioAnalysisRequest,
-    PortfolioAnalysisResponse,
     PortfolioCalculationRequest,
     PortfolioCalculationResponse,
     PortfolioListResponse,
@@ -14,11 +20,20 @@ from app.schemas.portfolio import (
     PortfolioSaveResponse,
     PortfolioSummary,
 )
-from app.services.portfolio_analysis_service import PortfolioAnalysisService
+from app.services import analysis_jobs
 from app.services.portfolio_service import PortfolioService
+from app.tasks.analysis_tasks import analyze_portfolio_task
 
 router = APIRouter(prefix="/portfolios", tags=["portfolios"])
 
+# Как часто SSE поток перечитывает статус задачи анализа (с)
+ANALYSIS_JOB_POLL_INTERVAL = float(os.getenv("ANALYSIS_JOB_POLL_INTERVAL", 0.5))
+# Сколько SSE поток ждет задачу сверх лимита Celery: воркер мог упасть,
+# и запись так и останется running до истечения ANALYSIS_JOB_TTL
+ANALYSIS_STREAM_TIMEOUT = float(
+    os.getenv("ANALYSIS_STREAM_TIMEOUT", analysis_jobs.ANALYSIS_TASK_TIME_LIMIT + 30)
+)
+
 
 @router.post("/calculate", response_model=PortfolioCalculationResponse)
 async def calculate_portfolio(
@@ -38,30 +53,95 @@ async def calculate_portfolio(
         raise HTTPException(status_code=500, detail=f"Ошибка при расчете: {str(e)}")
 
 
-@router.post("/analyze", response_model=PortfolioAnalysisResponse)
+@router.post("/analyze", response_model=PortfolioAnalysisJob, status_code=202)
 async def analyze_user_portfolio(
     request: PortfolioAnalysisRequest,
-    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Анализирует портфель пользователя через LLM"""
+    """
+    Ставит анализ портфеля через LLM в очередь Celery и сразу возвращает
+    job_id. Результат — GET /portfolios/analyze/{job_id}
+    или поток GET /portfolios/analyze/{job_id}/events.
+    Анализ неизменившегося портфеля берется из БД, если не передан force
+    """
     try:
-        service = PortfolioAnalysisService()
-
-        analysis_result = await service.analyze_portfolio(
-            user_id=current_user.id, portfolio_id=request.portfolio_id, db_session=db
+        job = await analysis_jobs.create_job(current_user.id, request.portfolio_id)
+        analyze_portfolio_task.delay(
+            current_user.id, request.portfolio_id, job["job_id"], request.force
         )
+        return PortfolioAnalysisJob(**job)
 
-        return PortfolioAnalysisResponse(analysis=analysis_result)
-
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Ошибка при анализе портфеля: {str(e)}"
         )
 
 
+@router.get("/analyze/{job_id}", response_model=PortfolioAnalysisJob)
+async def get_analysis_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Статус и результат задачи анализа портфеля"""
+    job = await analysis_jobs.get_job(current_user.id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача анализа не найдена")
+    return PortfolioAnalysisJob(**job)
+
+
+@router.get("/analyze/{job_id}/events")
+async def stream_analysis_job(
+    job_id: str, request: Request, current_user: User = Depends(get_current_user)
+):
+    """
+    SSE поток задачи анализа: событие status при каждой смене статуса,
+    последним — done с анализом или error (в том числе если задача не
+    завершилась за ANALYSIS_STREAM_TIMEOUT)
+    """
+    job = await analysis_jobs.get_job(current_user.id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача анализа не найдена")
+
+    async def events():
+        current = job
+        last_status = None
+        deadline = time.monotonic() + ANALYSIS_STREAM_TIMEOUT
+        while True:
+            if current is None:
+                yield _sse_event("error", {"detail": "Задача анализа не найдена"})
+                return
+            if current["status"] == "done":
+                yield _sse_event("done", current)
+                return
+            if current["status"] == "failed":
+                yield _sse_event("error", current)
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield _sse_event("status", current)
+            if time.monotonic() >= deadline:
+                yield _sse_event(
+                    "error",
+                    {
+                        **current,
+                        "status": "failed",
+                        "error": "Анализ не завершился вовремя",
+                    },
+                )
+                return
+            await asyncio.sleep(ANALYSIS_JOB_POLL_INTERVAL)
+            if await request.is_disconnected():
+                return
+            current = await analysis_jobs.get_job(current_user.id, job_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.post("/save-to-db", response_model=PortfolioSaveResponse)
 async def save_portfolio_to_db(
     request: PortfolioSaveRequest,
@@ -167,7 +247,7 @@ async def clear_user_cache(current_user: User = Depends(get_current_user)):
         user_id = str(current_user.id)
 
         # Удаляем все ключи, начинающиеся с user:{user_id}:
-        deleted_count = cache.delete_pattern(f"user:{user_id}:*")
+        deleted_count = await async_cache.clear_user_cache(user_id)
 
         return {
             "message": "Весь кеш пользователя успешно очищен",
@@ -9,7 +9,11 @@ celery_app = Celery(
     "background_tasks",
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=["app.tasks.inflation_tasks", "app.tasks.moex_tasks"],
+    include=[
+        "app.tasks.inflation_tasks",
+        "app.tasks.moex_tasks",
+        "app.tasks.analysis_tasks",
+    ],
 )
 
 
@@ -1,90 +1,554 @@
+import asyncio
+import fnmatch
 import json
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
 
 import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# Индекс ключей пользователя живет дольше самих ключей: устаревшие
+# элементы безвредны, UNLINK отсутствующего ключа ничего не делает
+USER_KEY_INDEX_TTL = int(os.getenv("USER_KEY_INDEX_TTL", 7 * 24 * 3600))
+SCAN_BATCH_SIZE = int(os.getenv("REDIS_SCAN_BATCH_SIZE", 1000))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+REDIS_RECONNECT_INTERVAL = float(os.getenv("REDIS_RECONNECT_INTERVAL", 5))
+MEMORY_CACHE_MAX_ITEMS = int(os.getenv("MEMORY_CACHE_MAX_ITEMS", 10000))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Ошибки, после которых кеш переходит в in-memory режим до переподключения
+REDIS_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+def user_index_key(key: str) -> Optional[str]:
+    """
+    Ключ множества, в котором учитываются ключи пользователя
+    user:{id}:*, либо None для прочих ключей
+    """
+    parts = key.split(":", 2)
+    if len(parts) < 3 or parts[0] != "user":
+        return None
+    index_key = f"user:{parts[1]}:keys"
+    return None if key == index_key else index_key
+
+
+def track_user_key(pipe, key: str, expire: int):
+    """Добавляет ключ в индекс пользователя в рамках того же pipeline"""
+    index_key = user_index_key(key)
+    if index_key:
+        pipe.sadd(index_key, key)
+        pipe.expire(index_key, max(expire, USER_KEY_INDEX_TTL))
+
+
+def _lrange(values: list, start: int, end: int) -> list:
+    """Срез списка с семантикой индексов LRANGE/LTRIM (end включительно)"""
+    end = None if end == -1 else end + 1
+    return values[start:end]
+
+
+def _estimate_size(key: str, value: Any) -> int:
+    """Приблизительный размер записи в байтах: ключ + JSON значения"""
+    return len(key) + len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class MemoryStore:
+    """
+    Потокобезопасное in-memory хранилище для работы без Redis.
+    Учитывает TTL каждого ключа и вытесняет давно не использованные
+    записи (LRU), когда превышен лимит числа ключей или байт
+    """
+
+    def __init__(
+        self,
+        max_items: int = MEMORY_CACHE_MAX_ITEMS,
+        max_bytes: int = MEMORY_CACHE_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._clock = clock
+        # key -> (expires_at, value, size)
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: Any, expire: int):
+        size = _estimate_size(key, value)
+        with self._lock:
+            self._store(key, value, expire, size)
+
+    def append(self, key: str, value: Any, expire: int):
+        """Добавляет элемент в список, TTL обновляется как у RPUSH + EXPIRE"""
+        with self._lock:
+            item = self._live(key)
+            values = list(item[1]) if item else []
+            size = item[2] if item else len(key)
+            values.append(value)
+            size += len(json.dumps(value, ensure_ascii=False, default=str))
+            self._store(key, values, expire, size)
+            return len(values)
+
+    def trim(self, key: str, start: int, end: int):
+        """Оставляет в списке только диапазон, как LTRIM; TTL не меняется"""
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                return
+            values = _lrange(item[1], start, end)
+            self._remove(key)
+            if values:
+                size = _estimate_size(key, values)
+                self._items[key] = (item[0], values, size)
+                self._bytes += size
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                if self._live(key) is not None:
+                    self._remove(key)
+                    deleted += 1
+            return deleted
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Удаляет ключи по glob-паттерну, как MATCH в SCAN"""
+        with self._lock:
+            keys = [k for k in self._items if fnmatch.fnmatchcase(k, pattern)]
+            deleted = sum(1 for key in keys if self._live(key) is not None)
+            for key in keys:
+                self._remove(key)
+            return deleted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def _live(self, key: str) -> Optional[tuple]:
+        item = self._items.get(key)
+        if item is not None and item[0] <= self._clock():
+            self._remove(key)
+            return None
+        return item
+
+    def _store(self, key: str, value: Any, expire: int, size: int):
+        self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._items[key] = (self._clock() + expire, value, size)
+        self._bytes += size
+        while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+            _, (_, _, evicted) = self._items.popitem(last=False)
+            self._bytes -= evicted
+
+    def _remove(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
 
 
 class RedisCache:
+    """
+    Синхронный кеш: для Celery задач и синхронных эндпоинтов.
+    Пока Redis недоступен, данные хранятся в ограниченном MemoryStore;
+    не чаще раза в REDIS_RECONNECT_INTERVAL секунд кеш пробует
+    переподключиться и возвращается к Redis
+    """
+
     def __init__(self):
-        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        url = REDIS_URL
+        self.url = url
         self.ttl = int(os.getenv("REDIS_TTL", 3600))
+        self.client = redis.Redis.from_url(
+            url, decode_responses=True, socket_connect_timeout=REDIS_CONNECT_TIMEOUT
+        )
+        self._memory = MemoryStore()
+        self._available: Optional[bool] = None
+        self._next_attempt = 0.0
+        self._connect()
+
+    @property
+    def enabled(self) -> bool:
+        if self.reconnect_due():
+            self._connect()
+        return bool(self._available)
+
+    @property
+    def available(self) -> bool:
+        """Последнее известное состояние, без попытки переподключения"""
+        return bool(self._available)
+
+    def reconnect_due(self) -> bool:
+        return not self._available and time.monotonic() >= self._next_attempt
+
+    def postpone_reconnect(self):
+        """Следующая попытка не раньше чем через REDIS_RECONNECT_INTERVAL"""
+        self._next_attempt = time.monotonic() + REDIS_RECONNECT_INTERVAL
+
+    def mark_unavailable(self, error: Exception):
+        """Переход в in-memory режим после ошибки соединения"""
+        if self._available is not False:
+            print(f"⚠️ Redis не доступен ({error}), используется in-memory режим.")
+        self._available = False
+        self._next_attempt = time.monotonic() + REDIS_RECONNECT_INTERVAL
+
+    def _connect(self) -> bool:
         try:
-            self.client = redis.Redis.from_url(url, decode_responses=True)
             self.client.ping()
-            print(f"✅ Подключен к Redis: {url}")
-            self.enabled = True
         except Exception as e:
-            print(f"⚠️ Redis не доступен ({e}), используется in-memory режим.")
-            self.enabled = False
-            self._memory = {}
+            self.mark_unavailable(e)
+            return False
+        self.mark_available()
+        return True
+
+    def mark_available(self):
+        """Возврат к Redis после успешного PING"""
+        if not self._available:
+            print(f"✅ Подключен к Redis: {self.url}")
+            # Записи, сделанные без Redis, могли устареть к следующему сбою
+            self._memory.clear()
+            self._available = True
 
     def set_json(self, key: str, value: dict, expire: Optional[int] = None):
         expire = expire or self.ttl
         if self.enabled:
-            self.client.set(key, json.dumps(value), ex=expire)
-        else:
-            self._memory[key] = value
+            try:
+                with self.client.pipeline(transaction=True) as pipe:
+                    pipe.set(key, json.dumps(value), ex=expire)
+                    track_user_key(pipe, key, expire)
+                    pipe.execute()
+                return
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        self._memory.set(key, value, expire)
 
     def get_json(self, key: str) -> Optional[dict]:
         if self.enabled:
-            data = self.client.get(key)
-            return json.loads(data) if data else None
+            try:
+                data = self.client.get(key)
+                return json.loads(data) if data else None
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
         return self._memory.get(key)
 
     def set_list(self, key: str, value: list, expire: Optional[int] = None):
         """Сохраняет список в Redis"""
         expire = expire or self.ttl
         if self.enabled:
-            self.client.delete(key)
-            if value:
-                self.client.rpush(key, *[json.dumps(item) for item in value])
-                self.client.expire(key, expire)
+            try:
+                with self.client.pipeline(transaction=True) as pipe:
+                    pipe.delete(key)
+                    if value:
+                        pipe.rpush(key, *[json.dumps(item) for item in value])
+                        pipe.expire(key, expire)
+                        track_user_key(pipe, key, expire)
+                    pipe.execute()
+                return
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        if value:
+            self._memory.set(key, list(value), expire)
         else:
-            self._memory[key] = value
+            self._memory.delete(key)
 
-    def get_list(self, key: str) -> list:
-        """Получает список из Redis"""
+    def get_list(self, key: str, start: int = 0, end: int = -1) -> list:
+        """Получает список (или его диапазон, как LRANGE) из Redis"""
         if self.enabled:
-            data = self.client.lrange(key, 0, -1)
-            return [json.loads(item) for item in data] if data else []
-        return self._memory.get(key, [])
+            try:
+                data = self.client.lrange(key, start, end)
+                return [json.loads(item) for item in data] if data else []
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        return _lrange(self._memory.get(key, []), start, end)
 
-    def append_to_list(self, key: str, value: dict, expire: Optional[int] = None):
-        """Добавляет элемент в список"""
+    def append_to_list(
+        self, key: str, value: dict, expire: Optional[int] = None
+    ) -> int:
+        """Добавляет элемент в список, возвращает новую длину"""
         expire = expire or self.ttl
         if self.enabled:
-            self.client.rpush(key, json.dumps(value))
-            self.client.expire(key, expire)
-        else:
-            if key not in self._memory:
-                self._memory[key] = []
-            self._memory[key].append(value)
+            try:
+                with self.client.pipeline(transaction=True) as pipe:
+                    pipe.rpush(key, json.dumps(value))
+                    pipe.expire(key, expire)
+                    track_user_key(pipe, key, expire)
+                    return pipe.execute()[0]
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        return self._memory.append(key, value, expire)
+
+    def trim_list(self, key: str, start: int, end: int):
+        """Оставляет в списке только диапазон (LTRIM)"""
+        if self.enabled:
+            try:
+                self.client.ltrim(key, start, end)
+                return
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        self._memory.trim(key, start, end)
+
+    def delete(self, *keys: str) -> int:
+        """Удаляет ключи, возвращает число удаленных"""
+        if self.enabled:
+            try:
+                return self.client.delete(*keys)
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        return self._memory.delete(*keys)
 
     def delete_pattern(self, pattern: str):
         """
-        Удаляет все ключи по паттерну
+        Удаляет все ключи по паттерну.
+        Инкрементальный SCAN вместо KEYS: Redis не блокируется на время
+        обхода всего keyspace, ключи освобождаются через UNLINK пачками
         """
         if self.enabled:
-            keys = self.client.keys(pattern)
-            if keys:
-                self.client.delete(*keys)
-            return len(keys)
-        else:
-            # Для in-memory режима
-            keys_to_delete = [
-                k for k in self._memory.keys() if k.startswith(pattern.replace('*', ''))
-            ]
-            for key in keys_to_delete:
-                del self._memory[key]
-            return len(keys_to_delete)
+            try:
+                deleted = 0
+                batch = []
+                for key in self.client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        deleted += self.client.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted += self.client.unlink(*batch)
+                return deleted
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        return self._memory.delete_pattern(pattern)
 
     def clear_user_cache(self, user_id: str):
         """
-        Очищает весь кеш конкретного пользователя
+        Очищает весь кеш конкретного пользователя за O(ключей пользователя)
+        по индексу user:{id}:keys, без обхода всего keyspace
+        """
+        if self.enabled:
+            index_key = f"user:{user_id}:keys"
+            try:
+                keys = self.client.smembers(index_key)
+                with self.client.pipeline(transaction=True) as pipe:
+                    if keys:
+                        pipe.unlink(*keys)
+                    pipe.unlink(index_key)
+                    results = pipe.execute()
+                return results[0] if keys else 0
+            except REDIS_ERRORS as e:
+                self.mark_unavailable(e)
+        return self._memory.delete_pattern(f"user:{user_id}:*")
+
+
+class AsyncRedisCache:
+    """
+    Асинхронный кеш для эндпоинтов FastAPI на redis.asyncio с общим пулом
+    соединений. Составные операции выполняются одним pipeline.
+    Доступность Redis и in-memory хранилище общие с синхронным кешем,
+    чтобы обе стороны видели одни и те же данные и вместе переключались
+    """
+
+    def __init__(self, sync_cache: RedisCache):
+        self._sync = sync_cache
+        self.ttl = sync_cache.ttl
+        self._client = None
+        self._loop = None
+        self._reconnect: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        """
+        Клиент с пулом для текущего event loop. Соединения asyncio привязаны
+        к циклу, поэтому при запуске в новом цикле (asyncio.run в Celery
+        задачах) пул создается заново. Соединения пул открывает лениво
         """
-        pattern = f"user:{user_id}:*"
-        return self.delete_pattern(pattern)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            pool = aioredis.ConnectionPool.from_url(
+                self._sync.url,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            )
+            self._client = aioredis.Redis(connection_pool=pool)
+            self._loop = loop
+        return self._client
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Только читает состояние: PING при переподключении идет фоновой
+        задачей на асинхронном клиенте и не блокирует event loop
+        """
+        if self._sync.reconnect_due():
+            self._start_reconnect()
+        return self._sync.available
+
+    def _start_reconnect(self):
+        if self._reconnect is not None and not self._reconnect.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sync.postpone_reconnect()
+        self._reconnect = loop.create_task(self._ping())
+
+    async def _ping(self):
+        try:
+            await self.client.ping()
+        except Exception as e:
+            self._sync.mark_unavailable(e)
+            return
+        self._sync.mark_available()
+
+    def mark_unavailable(self, error: Exception):
+        self._sync.mark_unavailable(error)
+
+    async def set_json(self, key: str, value: dict, expire: Optional[int] = None):
+        if self.enabled:
+            expire = expire or self.ttl
+            try:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.set(key, json.dumps(value), ex=expire)
+                    track_user_key(pipe, key, expire)
+                    await pipe.execute()
+                return
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        self._sync.set_json(key, value, expire)
+
+    async def get_json(self, key: str) -> Optional[dict]:
+        if self.enabled:
+            try:
+                data = await self.client.get(key)
+                return json.loads(data) if data else None
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.get_json(key)
+
+    async def get_many_json(self, keys: List[str]) -> List[Optional[dict]]:
+        """Несколько JSON значений одним MGET"""
+        if self.enabled:
+            try:
+                values = await self.client.mget(keys)
+                return [json.loads(value) if value else None for value in values]
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return [self._sync.get_json(key) for key in keys]
+
+    async def set_list(self, key: str, value: list, expire: Optional[int] = None):
+        if self.enabled:
+            expire = expire or self.ttl
+            try:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.delete(key)
+                    if value:
+                        pipe.rpush(key, *[json.dumps(item) for item in value])
+                        pipe.expire(key, expire)
+                        track_user_key(pipe, key, expire)
+                    await pipe.execute()
+                return
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        self._sync.set_list(key, value, expire)
+
+    async def get_list(self, key: str, start: int = 0, end: int = -1) -> list:
+        if self.enabled:
+            try:
+                data = await self.client.lrange(key, start, end)
+                return [json.loads(item) for item in data] if data else []
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.get_list(key, start, end)
+
+    async def append_to_list(
+        self, key: str, value: dict, expire: Optional[int] = None
+    ) -> int:
+        """RPUSH и EXPIRE одной транзакцией, возвращает новую длину"""
+        if self.enabled:
+            expire = expire or self.ttl
+            try:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.rpush(key, json.dumps(value))
+                    pipe.expire(key, expire)
+                    track_user_key(pipe, key, expire)
+                    return (await pipe.execute())[0]
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.append_to_list(key, value, expire)
+
+    async def trim_list(self, key: str, start: int, end: int):
+        if self.enabled:
+            try:
+                await self.client.ltrim(key, start, end)
+                return
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        self._sync.trim_list(key, start, end)
+
+    async def delete(self, *keys: str) -> int:
+        if self.enabled:
+            try:
+                return await self.client.delete(*keys)
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.delete(*keys)
+
+    async def delete_pattern(self, pattern: str) -> int:
+        """SCAN + UNLINK пачками, см. RedisCache.delete_pattern"""
+        if self.enabled:
+            try:
+                deleted = 0
+                batch = []
+                async for key in self.client.scan_iter(
+                    match=pattern, count=SCAN_BATCH_SIZE
+                ):
+                    batch.append(key)
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        deleted += await self.client.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted += await self.client.unlink(*batch)
+                return deleted
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.delete_pattern(pattern)
+
+    async def clear_user_cache(self, user_id: str) -> int:
+        """Удаление по индексу ключей пользователя, см. RedisCache.clear_user_cache"""
+        if self.enabled:
+            index_key = f"user:{user_id}:keys"
+            try:
+                keys = await self.client.smembers(index_key)
+                async with self.client.pipeline(transaction=True) as pipe:
+                    if keys:
+                        pipe.unlink(*keys)
+                    pipe.unlink(index_key)
+                    results = await pipe.execute()
+                return results[0] if keys else 0
+            except REDIS_ERRORS as e:
+                self._sync.mark_unavailable(e)
+        return self._sync.clear_user_cache(user_id)
 
 
 cache = RedisCache()
+async_cache = AsyncRedisCache(cache)
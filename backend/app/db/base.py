@@ -10,6 +10,7 @@ from app.models.portfolio import (  # noqa: F401
     StepAction,
     StepByStepPlan,
 )
+from app.models.price_history import PriceHistory  # noqa: F401
 from app.models.user import User  # noqa: F401
 
 # Эти импорты нужны для Alembic чтобы обнаружить модели
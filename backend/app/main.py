@@ -8,6 +8,8 @@ from app.api.routes_portfolios import router as portfolios_router
 from app.api.routes_risk_profile import router as risk_profile_router
 from app.api.routes_user import router as user_router
 from app.core.config import settings
+from app.services.llm_service import close_clients as close_llm_clients
+from app.services.whisper_processor import WHISPER_WARMUP, whisper_processor
 
 app = FastAPI(title="InvestPro", version="0.1.0")
 
@@ -25,3 +27,15 @@ app.include_router(assets_router)
 app.include_router(portfolios_router)
 app.include_router(risk_profile_router)
 app.include_router(dialog_router)
+
+
+@app.on_event("startup")
+async def startup():
+    if WHISPER_WARMUP:
+        whisper_processor.start_warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_llm_clients()
+    whisper_processor.shutdown()
@@ -169,6 +169,8 @@ class PortfolioCalculationExplanation(Base):
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False)
     explanation_text = Column(Text, nullable=False)
+    # Хеш портфеля и модели, по которым получен анализ
+    content_hash = Column(String(64), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -1,10 +1,22 @@
-from sqlalchemy import BigInteger, Column, Date, ForeignKey, Integer, Numeric
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    ForeignKey,
+    Integer,
+    Numeric,
+    UniqueConstraint,
+)
 
 from app.core.database import Base
 
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
+    __table_args__ = (
+        # Одна свеча на актив и день: ключ для upsert и поиска последней даты
+        UniqueConstraint("asset_id", "date", name="uq_price_history_asset_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     asset_id = Column(Integer, ForeignKey("assets.id"))
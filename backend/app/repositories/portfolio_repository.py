@@ -1,4 +1,6 @@
-from sqlalchemy import and_, select
+from datetime import datetime
+
+from sqlalchemy import and_, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -25,9 +27,29 @@ class PortfolioRepository:
         user_id: int,
         portfolio_name: str = "Основной портфель",
     ) -> Portfolio:
-        """Создание портфеля в базе данных"""
+        """
+        Создание портфеля в базе данных.
+
+        Каждая таблица графа (композиции, распределения, план, шаги, действия)
+        пишется одним пакетным INSERT, поэтому число запросов постоянно
+        и не зависит от размера портфеля.
+        """
+        recommendation = portfolio_data.recommendation
+        payment = recommendation.monthly_payment_detail
+
+        # Один запрос IN вместо SELECT на каждый тикер
+        tickers = {
+            asset_alloc.ticker
+            for comp in recommendation.composition
+            for asset_alloc in comp.assets
+        }
+        asset_ids = {}
+        if tickers:
+            result = await self.db_session.execute(
+                select(Asset.ticker, Asset.id).where(Asset.ticker.in_(tickers))
+            )
+            asset_ids = dict(result.all())
 
-        # Создаем основной объект портфеля
         portfolio = Portfolio(
             user_id=user_id,
             portfolio_name=portfolio_name,
@@ -36,107 +58,118 @@ class PortfolioRepository:
             investment_term_months=portfolio_data.investment_term_months,
             annual_inflation_rate=portfolio_data.annual_inflation_rate,
             future_value_with_inflation=portfolio_data.future_value_with_inflation,
-            risk_profile=portfolio_data.recommendation.risk_profile,
-            time_horizon=portfolio_data.recommendation.time_horizon,
-            smart_goal=portfolio_data.recommendation.smart_goal,
-            total_investment=portfolio_data.recommendation.total_investment,
-            expected_portfolio_return=(
-                portfolio_data.recommendation.expected_portfolio_return
-            ),
+            risk_profile=recommendation.risk_profile,
+            time_horizon=recommendation.time_horizon,
+            smart_goal=recommendation.smart_goal,
+            total_investment=recommendation.total_investment,
+            expected_portfolio_return=recommendation.expected_portfolio_return,
         )
-
         self.db_session.add(portfolio)
         await self.db_session.flush()  # Получаем ID портфеля
 
-        # Создаем данные по ежемесячному платежу
-        monthly_payment = MonthlyPayment(
-            portfolio_id=portfolio.id,
-            monthly_payment=(
-                portfolio_data.recommendation.monthly_payment_detail.monthly_payment
-            ),
-            future_capital=(
-                portfolio_data.recommendation.monthly_payment_detail.future_capital
-            ),
-            total_months=(
-                portfolio_data.recommendation.monthly_payment_detail.total_months
-            ),
-            monthly_rate=(
-                portfolio_data.recommendation.monthly_payment_detail.monthly_rate
-            ),
-            annuity_factor=(
-                portfolio_data.recommendation.monthly_payment_detail.annuity_factor
-            ),
+        await self.db_session.execute(
+            insert(MonthlyPayment),
+            [
+                {
+                    "portfolio_id": portfolio.id,
+                    "monthly_payment": payment.monthly_payment,
+                    "future_capital": payment.future_capital,
+                    "total_months": payment.total_months,
+                    "monthly_rate": payment.monthly_rate,
+                    "annuity_factor": payment.annuity_factor,
+                }
+            ],
         )
 
-        self.db_session.add(monthly_payment)
+        compositions = recommendation.composition
+        composition_ids = await self._insert_returning_ids(
+            PortfolioComposition,
+            [
+                {
+                    "portfolio_id": portfolio.id,
+                    "asset_type": comp.asset_type,
+                    "target_weight": comp.target_weight,
+                    "actual_weight": comp.actual_weight,
+                    "amount": comp.amount,
+                }
+                for comp in compositions
+            ],
+        )
+        await self._insert_many(
+            AssetAllocation,
+            [
+                {
+                    "portfolio_composition_id": composition_id,
+                    "asset_id": asset_ids[asset_alloc.ticker],
+                    "quantity": asset_alloc.quantity,
+                    "target_weight": asset_alloc.weight,
+                    "purchase_price": asset_alloc.price,
+                }
+                for comp, composition_id in zip(compositions, composition_ids)
+                for asset_alloc in comp.assets
+                if asset_alloc.ticker in asset_ids
+            ],
+        )
 
-        # Создаем композиции портфеля и распределения активов
-        for comp in portfolio_data.recommendation.composition:
-            portfolio_composition = PortfolioComposition(
-                portfolio_id=portfolio.id,
-                asset_type=comp.asset_type,
-                target_weight=comp.target_weight,
-                actual_weight=comp.actual_weight,
-                amount=comp.amount,
+        plan = recommendation.step_by_step_plan
+        if plan and plan.steps:
+            try:
+                generated_at = datetime.fromisoformat(plan.generated_at)
+            except (ValueError, TypeError):
+                generated_at = datetime.now()
+
+            (plan_id,) = await self._insert_returning_ids(
+                StepByStepPlan,
+                [
+                    {
+                        "portfolio_id": portfolio.id,
+                        "generated_at": generated_at,
+                        "total_steps": len(plan.steps),
+                    }
+                ],
             )
-
-            self.db_session.add(portfolio_composition)
-            await self.db_session.flush()  # Получаем ID композиции
-
-            # Добавляем распределения активов
-            for asset_alloc in comp.assets:
-                # Находим asset_id по тикеру - асинхронно
-                stmt = select(Asset).where(Asset.ticker == asset_alloc.ticker)
-                result = await self.db_session.execute(stmt)
-                asset = result.scalar_one_or_none()
-
-                if asset:
-                    asset_allocation = AssetAllocation(
-                        portfolio_composition_id=portfolio_composition.id,
-                        asset_id=asset.id,
-                        quantity=asset_alloc.quantity,
-                        target_weight=asset_alloc.weight,
-                        purchase_price=asset_alloc.price,
-                    )
-                    self.db_session.add(asset_allocation)
-
-        if portfolio_data.recommendation.step_by_step_plan:
-            step_plan = StepByStepPlan(
-                portfolio_id=portfolio.id,
-                generated_at=(
-                    portfolio_data.recommendation.step_by_step_plan.generated_at
-                ),
-                total_steps=portfolio_data.recommendation.step_by_step_plan.total_steps,
+            step_ids = await self._insert_returning_ids(
+                PlanStep,
+                [
+                    {
+                        "step_by_step_plan_id": plan_id,
+                        "step_number": step.step_number,
+                        "title": step.title,
+                        "description": step.description,
+                    }
+                    for step in plan.steps
+                ],
+            )
+            await self._insert_many(
+                StepAction,
+                [
+                    {
+                        "plan_step_id": step_id,
+                        "action_text": action_text,
+                        "action_order": action_order,
+                    }
+                    for step, step_id in zip(plan.steps, step_ids)
+                    for action_order, action_text in enumerate(step.actions, 1)
+                ],
             )
-
-            self.db_session.add(step_plan)
-            await self.db_session.flush()
-
-            # Добавляем шаги плана
-            for step in portfolio_data.recommendation.step_by_step_plan.steps:
-                plan_step = PlanStep(
-                    step_by_step_plan_id=step_plan.id,
-                    step_number=step.step_number,
-                    title=step.title,
-                    description=step.description,
-                )
-
-                self.db_session.add(plan_step)
-                await self.db_session.flush()
-
-                # Добавляем действия для шага
-                for action_order, action_text in enumerate(step.actions, 1):
-                    step_action = StepAction(
-                        plan_step_id=plan_step.id,
-                        action_text=action_text,
-                        action_order=action_order,
-                    )
-                    self.db_session.add(step_action)
 
         await self.db_session.commit()
-        await self.db_session.refresh(portfolio)
         return portfolio
 
+    async def _insert_returning_ids(self, model, rows: list[dict]) -> list[int]:
+        """Пакетный INSERT ... RETURNING id; id идут в порядке rows"""
+        if not rows:
+            return []
+        result = await self.db_session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        )
+        return list(result.scalars())
+
+    async def _insert_many(self, model, rows: list[dict]):
+        """Пакетный INSERT без возврата значений"""
+        if rows:
+            await self.db_session.execute(insert(model), rows)
+
     async def get_user_portfolios(self, user_id: int) -> list[Portfolio]:
         """Получение всех портфелей пользователя"""
         stmt = select(Portfolio).where(
@@ -0,0 +1,69 @@
+import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.price_history import PriceHistory
+
+# 7 параметров на строку — с запасом ниже лимита asyncpg в 32767
+UPSERT_CHUNK_SIZE = 1000
+
+
+class PriceHistoryRepository:
+    async def get_last_dates(
+        self, session: AsyncSession, asset_ids: List[int]
+    ) -> Dict[int, datetime.date]:
+        """Последняя сохраненная дата по каждому активу одним запросом"""
+        stmt = (
+            select(PriceHistory.asset_id, func.max(PriceHistory.date))
+            .where(PriceHistory.asset_id.in_(asset_ids))
+            .group_by(PriceHistory.asset_id)
+        )
+        result = await session.execute(stmt)
+        return {asset_id: last_date for asset_id, last_date in result}
+
+    async def get_open_series(
+        self,
+        session: AsyncSession,
+        asset_ids: List[int],
+        date_from: datetime.date,
+    ) -> Dict[int, List[Tuple[datetime.date, float]]]:
+        """Ряды цен открытия для нескольких активов начиная с date_from"""
+        stmt = (
+            select(PriceHistory.asset_id, PriceHistory.date, PriceHistory.open_price)
+            .where(
+                PriceHistory.asset_id.in_(asset_ids),
+                PriceHistory.date >= date_from,
+            )
+            .order_by(PriceHistory.asset_id, PriceHistory.date)
+        )
+        result = await session.execute(stmt)
+
+        series: Dict[int, List[Tuple[datetime.date, float]]] = {
+            asset_id: [] for asset_id in asset_ids
+        }
+        for asset_id, day, open_price in result:
+            series[asset_id].append((day, float(open_price or 0)))
+        return series
+
+    async def upsert_many(self, session: AsyncSession, rows: List[dict]) -> int:
+        """Многострочный INSERT ... ON CONFLICT (asset_id, date) DO UPDATE"""
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+            stmt = insert(PriceHistory).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                constraint="uq_price_history_asset_date",
+                set_={
+                    "open_price": stmt.excluded.open_price,
+                    "high_price": stmt.excluded.high_price,
+                    "low_price": stmt.excluded.low_price,
+                    "close_price": stmt.excluded.close_price,
+                    "volume": stmt.excluded.volume,
+                },
+            )
+            await session.execute(stmt)
+
+        await session.commit()
+        return len(rows)
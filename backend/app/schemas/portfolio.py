@@ -86,10 +86,18 @@ class PortfolioCalculationResponse(BaseModel):
 
 class PortfolioAnalysisRequest(BaseModel):
     portfolio_id: str
+    # Анализировать заново, даже если портфель не менялся
+    force: bool = False
 
 
-class PortfolioAnalysisResponse(BaseModel):
-    analysis: str
+class PortfolioAnalysisJob(BaseModel):
+    """Фоновая задача анализа портфеля"""
+
+    job_id: str
+    portfolio_id: str
+    status: str  # queued | running | done | failed
+    analysis: Optional[str] = None
+    error: Optional[str] = None
 
 
 class PortfolioSummary(BaseModel):
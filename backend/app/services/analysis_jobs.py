@@ -0,0 +1,45 @@
+"""
+Состояние фоновых задач анализа портфеля.
+
+Запись задачи хранится в Redis под ключом пользователя, поэтому чужую
+задачу по job_id не прочитать, а очистка кеша пользователя удаляет и ее.
+Статусы: queued → running → done | failed.
+"""
+
+import os
+import uuid
+from typing import Dict, Optional
+
+from app.core.redis_cache import async_cache
+
+ANALYSIS_JOB_TTL = int(os.getenv("ANALYSIS_JOB_TTL", 24 * 3600))
+# Лимит Celery задачи анализа (с): дольше задача не может остаться running
+ANALYSIS_TASK_TIME_LIMIT = int(os.getenv("ANALYSIS_TASK_TIME_LIMIT", 300))
+
+
+def job_key(user_id: int, job_id: str) -> str:
+    return f"user:{user_id}:analysis_job:{job_id}"
+
+
+async def create_job(user_id: int, portfolio_id: str) -> Dict:
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "portfolio_id": str(portfolio_id),
+        "status": "queued",
+        "analysis": None,
+        "error": None,
+    }
+    await async_cache.set_json(job_key(user_id, job["job_id"]), job, ANALYSIS_JOB_TTL)
+    return job
+
+
+async def update_job(user_id: int, job_id: str, **fields) -> Dict:
+    key = job_key(user_id, job_id)
+    job = await async_cache.get_json(key) or {"job_id": job_id}
+    job.update(fields)
+    await async_cache.set_json(key, job, ANALYSIS_JOB_TTL)
+    return job
+
+
+async def get_job(user_id: int, job_id: str) -> Optional[Dict]:
+    return await async_cache.get_json(job_key(user_id, job_id))
@@ -0,0 +1,151 @@
+# services/analytics_service.py
+"""
+Векторные расчеты показателей активов.
+
+Все функции работают с матрицей цен формы (активы × даты), пропуски — NaN.
+Доходности считаются между соседними доступными ценами каждого актива,
+поэтому пропуск в ряду не разрывает расчет.
+"""
+import datetime
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def stack_series(series: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Собрать ряды разной длины в матрицу, выровняв по последнему значению.
+    Неположительные цены считаются пропусками.
+    """
+    width = max((len(s) for s in series), default=0)
+    matrix = np.full((len(series), width), np.nan)
+    for i, values in enumerate(series):
+        if len(values):
+            matrix[i, width - len(values) :] = values
+    matrix[~(matrix > 0)] = np.nan
+    return matrix
+
+
+def align_price_series(
+    series: Dict[str, Sequence[Tuple[datetime.date, float]]],
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Выровнять ряды (дата, цена) по общей оси дат: (тикеры, даты, матрица)"""
+    tickers = list(series)
+    dates = np.array(
+        sorted({day for values in series.values() for day, _ in values}),
+        dtype="datetime64[D]",
+    )
+    matrix = np.full((len(tickers), len(dates)), np.nan)
+
+    for i, ticker in enumerate(tickers):
+        if not series[ticker]:
+            continue
+        days, prices = zip(*series[ticker])
+        columns = np.searchsorted(dates, np.array(days, dtype="datetime64[D]"))
+        matrix[i, columns] = prices
+
+    matrix[~(matrix > 0)] = np.nan
+    return tickers, dates, matrix
+
+
+def forward_fill(prices: np.ndarray) -> np.ndarray:
+    """Протянуть последнюю известную цену вперед вдоль оси дат"""
+    valid = ~np.isnan(prices)
+    index = np.where(valid, np.arange(prices.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = prices[np.arange(prices.shape[0])[:, None], index]
+    # До первой известной цены значение остается NaN
+    filled[np.cumsum(valid, axis=1) == 0] = np.nan
+    return filled
+
+
+def log_returns(prices: np.ndarray) -> np.ndarray:
+    """Лог-доходности между соседними доступными ценами, форма (n, t - 1)"""
+    filled = forward_fill(prices)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = np.log(filled[:, 1:] / filled[:, :-1])
+    returns[np.isnan(prices[:, 1:])] = np.nan
+    return returns
+
+
+def annualised_volatility(
+    returns: np.ndarray, periods: int = TRADING_DAYS, min_returns: int = 2
+) -> np.ndarray:
+    """Годовая волатильность; NaN, если доходностей меньше min_returns"""
+    counts = np.sum(~np.isnan(returns), axis=1)
+    volatility = np.full(returns.shape[0], np.nan)
+    enough = counts >= min_returns
+    volatility[enough] = np.nanstd(returns[enough], axis=1) * np.sqrt(periods)
+    return volatility
+
+
+def cagr(
+    start_prices: np.ndarray,
+    end_prices: np.ndarray,
+    years: np.ndarray,
+    min_years: float = 0.1,
+) -> np.ndarray:
+    """Среднегодовой темп роста; NaN там, где цены не положительны"""
+    start_prices = np.asarray(start_prices, dtype=float)
+    end_prices = np.asarray(end_prices, dtype=float)
+    years = np.maximum(np.asarray(years, dtype=float), min_years)
+    valid = (start_prices > 0) & (end_prices > 0)
+
+    result = np.full(start_prices.shape, np.nan)
+    result[valid] = (end_prices[valid] / start_prices[valid]) ** (1 / years[valid]) - 1
+    return result
+
+
+def cagr_from_matrix(prices: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """CAGR между первой и последней доступной ценой каждого актива"""
+    valid = ~np.isnan(prices)
+    has_data = valid.any(axis=1)
+    first = np.argmax(valid, axis=1)
+    last = prices.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    rows = np.arange(prices.shape[0])
+
+    days = (dates[last] - dates[first]).astype(float)
+    result = cagr(prices[rows, first], prices[rows, last], days / 365.25)
+    result[~has_data] = np.nan
+    return result
+
+
+def max_drawdown(prices: np.ndarray) -> np.ndarray:
+    """Максимальная просадка от предыдущего пика (отрицательное число)"""
+    filled = forward_fill(prices)
+    peaks = np.fmax.accumulate(filled, axis=1)
+    with np.errstate(invalid="ignore"):
+        drawdowns = filled / peaks - 1
+    result = np.full(prices.shape[0], np.nan)
+    has_data = ~np.isnan(drawdowns).all(axis=1)
+    result[has_data] = np.nanmin(drawdowns[has_data], axis=1)
+    return result
+
+
+def covariance_matrix(returns: np.ndarray, periods: int = TRADING_DAYS) -> np.ndarray:
+    """
+    Годовая ковариация по попарно общим наблюдениям.
+    Ряды центрируются по своему среднему, пропуски дают нулевой вклад.
+    """
+    valid = ~np.isnan(returns)
+    weights = valid.astype(float)
+    values = np.where(valid, returns, 0.0)
+    means = values.sum(axis=1) / np.maximum(weights.sum(axis=1), 1)
+    centered = np.where(valid, values - means[:, None], 0.0)
+
+    pair_counts = weights @ weights.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (centered @ centered.T) / (pair_counts - 1)
+    cov[pair_counts < 2] = np.nan
+    return cov * periods
+
+
+def correlation_matrix(returns: np.ndarray) -> np.ndarray:
+    """Корреляционная матрица доходностей"""
+    cov = covariance_matrix(returns, periods=1)
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.outer(std, std)
+    return np.clip(corr, -1.0, 1.0)
@@ -0,0 +1,187 @@
+# services/asset_universe.py
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis_cache import REDIS_ERRORS, async_cache, cache
+from app.models.asset import Asset
+from app.repositories.asset_repository import AssetRepository
+
+ASSET_UNIVERSE_CHANNEL = "assets:universe:updated"
+ASSET_UNIVERSE_VERSION_KEY = "assets:universe:version"
+# Страховка на случай потерянного сообщения pub/sub или работы без Redis
+ASSET_UNIVERSE_MAX_AGE = int(os.getenv("ASSET_UNIVERSE_MAX_AGE", 3600))
+
+BOND_TENORS = ("краткосрочная", "среднесрочная", "долгосрочная")
+
+
+@dataclass(frozen=True)
+class AssetInfo:
+    """Неизменяемая копия строки assets, безопасная для общего доступа"""
+
+    id: int
+    name: str
+    ticker: str
+    type: str
+    price_old: Optional[float]
+    price_now: Optional[float]
+    yield_value: Optional[float]
+    volatility: Optional[float]
+
+    @classmethod
+    def from_model(cls, asset: Asset) -> "AssetInfo":
+        return cls(
+            id=asset.id,
+            name=asset.name,
+            ticker=asset.ticker,
+            type=asset.type,
+            price_old=asset.price_old,
+            price_now=asset.price_now,
+            yield_value=asset.yield_value,
+            volatility=asset.volatility,
+        )
+
+
+@dataclass(frozen=True)
+class AssetSnapshot:
+    """Снимок вселенной активов с индексами по типу, тикеру и сроку облигаций"""
+
+    version: int
+    loaded_at: float
+    assets: Tuple[AssetInfo, ...]
+    by_ticker: Dict[str, AssetInfo]
+    types: Dict[str, Tuple[AssetInfo, ...]]
+    bonds: Tuple[AssetInfo, ...]
+    bonds_by_tenor: Dict[str, Tuple[AssetInfo, ...]]
+
+    @classmethod
+    def build(cls, version: int, assets: List[Asset]) -> "AssetSnapshot":
+        infos = tuple(
+            sorted((AssetInfo.from_model(a) for a in assets), key=lambda a: a.id)
+        )
+
+        types: Dict[str, List[AssetInfo]] = {}
+        for info in infos:
+            types.setdefault(info.type, []).append(info)
+
+        bonds = tuple(info for info in infos if "облигация" in info.type.lower())
+        bonds_by_tenor = {
+            tenor: tuple(b for b in bonds if tenor in b.type) for tenor in BOND_TENORS
+        }
+
+        return cls(
+            version=version,
+            loaded_at=time.monotonic(),
+            assets=infos,
+            by_ticker={info.ticker: info for info in infos},
+            types={key: tuple(value) for key, value in types.items()},
+            bonds=bonds,
+            bonds_by_tenor=bonds_by_tenor,
+        )
+
+    def by_type(self, asset_type: str) -> List[AssetInfo]:
+        """Аналог AssetRepository.get_assets_by_type без запроса в БД"""
+        if asset_type.lower() == 'облигация':
+            return list(self.bonds)
+        return list(self.types.get(asset_type, ()))
+
+    def by_tenor(self, tenor: str) -> List[AssetInfo]:
+        return list(self.bonds_by_tenor.get(tenor, ()))
+
+
+class AssetUniverse:
+    """
+    Общий для всех запросов снимок таблицы assets.
+    Перечитывается после сообщения задачи обновления MOEX в Redis pub/sub
+    или по истечении ASSET_UNIVERSE_MAX_AGE.
+    """
+
+    def __init__(self, repo: AssetRepository = None, max_age: int = None):
+        self.repo = repo or AssetRepository()
+        self.max_age = ASSET_UNIVERSE_MAX_AGE if max_age is None else max_age
+        self._snapshot: Optional[AssetSnapshot] = None
+        self._stale = True
+        self._listener = None
+        self._subscribing = False
+
+    async def get(self, db_session: AsyncSession) -> AssetSnapshot:
+        await self._ensure_listener()
+        snapshot = self._snapshot
+        if (
+            snapshot is None
+            or self._stale
+            or time.monotonic() - snapshot.loaded_at > self.max_age
+        ):
+            # Одновременный холодный старт может прочитать таблицу дважды —
+            # это безвредно, в self._snapshot останется последний снимок
+            snapshot = await self.reload(db_session)
+        return snapshot
+
+    async def reload(self, db_session: AsyncSession) -> AssetSnapshot:
+        # Сбрасываем флаг до чтения, чтобы не потерять инвалидацию во время загрузки
+        self._stale = False
+        try:
+            assets = await self.repo.get_all_assets(db_session)
+        except Exception:
+            self._stale = True
+            raise
+        snapshot = AssetSnapshot.build(self._next_version(), assets)
+        self._snapshot = snapshot
+        print(
+            f"[ASSETS] Загружен снимок активов v{snapshot.version}: "
+            f"{len(snapshot.assets)} шт."
+        )
+        return snapshot
+
+    def invalidate(self):
+        self._stale = True
+
+    def _next_version(self) -> int:
+        return self._snapshot.version + 1 if self._snapshot else 0
+
+    def _on_message(self, message):
+        print(f"[ASSETS] Получено обновление активов v{message.get('data')}")
+        self.invalidate()
+
+    async def _ensure_listener(self):
+        """
+        Подписка на pub/sub. async_cache.enabled только читает флаг, а
+        подключение синхронного клиента идет в потоке, не блокируя event loop
+        """
+        if self._listener is not None or self._subscribing or not async_cache.enabled:
+            return
+        self._subscribing = True
+        try:
+            self._listener = await asyncio.to_thread(self._subscribe)
+        except Exception as e:
+            print(f"⚠️ Подписка на обновления активов недоступна: {e}")
+        finally:
+            self._subscribing = False
+
+    def _subscribe(self):
+        pubsub = cache.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{ASSET_UNIVERSE_CHANNEL: self._on_message})
+        return pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+
+def publish_asset_universe_update() -> Optional[int]:
+    """
+    Сообщить всем процессам API, что таблица assets изменилась.
+    Синхронный вызов Redis: из корутины — через asyncio.to_thread
+    """
+    if not cache.enabled:
+        return None
+    try:
+        version = cache.client.incr(ASSET_UNIVERSE_VERSION_KEY)
+        cache.client.publish(ASSET_UNIVERSE_CHANNEL, version)
+    except REDIS_ERRORS as e:
+        cache.mark_unavailable(e)
+        return None
+    return version
+
+
+asset_universe = AssetUniverse()
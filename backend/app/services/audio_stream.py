@@ -0,0 +1,160 @@
+"""
+Потоковое чтение аудио и нарезка на фразы для Whisper.
+
+read_pcm декодирует файл через ffmpeg в 16 кГц моно и отдает его
+кусками по WHISPER_DECODE_CHUNK_SECONDS, не держа запись целиком.
+VadSegmenter режет поток по паузам (энергетический VAD по кадрам 30 мс):
+фраза заканчивается после WHISPER_VAD_MIN_SILENCE секунд тишины или по
+достижении WHISPER_VAD_MAX_SEGMENT секунд, чтобы поместиться в окно
+Whisper (30 с). Тишина между фразами в модель не попадает.
+iter_segments соединяет их для event loop API: декодер читается в потоке,
+фразы отдаются по мере того, как заканчиваются.
+"""
+
+import asyncio
+import os
+import subprocess
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE * 30 // 1000
+
+WHISPER_DECODE_CHUNK_SECONDS = float(os.getenv("WHISPER_DECODE_CHUNK_SECONDS", 1.0))
+WHISPER_VAD_THRESHOLD_DB = float(os.getenv("WHISPER_VAD_THRESHOLD_DB", -45))
+WHISPER_VAD_MIN_SILENCE = float(os.getenv("WHISPER_VAD_MIN_SILENCE", 0.6))
+WHISPER_VAD_MAX_SEGMENT = float(os.getenv("WHISPER_VAD_MAX_SEGMENT", 28))
+# Тишина, которая остается по краям фразы
+VAD_PADDING_SECONDS = 0.2
+# Более короткие всплески — щелчки и шум, а не речь
+VAD_MIN_SPEECH_SECONDS = 0.2
+
+
+def read_pcm(
+    path: str, chunk_seconds: float = WHISPER_DECODE_CHUNK_SECONDS
+) -> Iterator[np.ndarray]:
+    """Декодирует файл через ffmpeg и отдает float32 отсчеты кусками"""
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-f",
+            "s16le",
+            "-ac",
+            "1",
+            "-acodec",
+            "pcm_s16le",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * 2
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = data[: len(data) - len(data) % 2]
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        error = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg не смог декодировать аудио: {error.strip()}")
+
+
+class VadSegmenter:
+    """Нарезает поток отсчетов на фразы по паузам"""
+
+    def __init__(
+        self,
+        threshold_db: float = WHISPER_VAD_THRESHOLD_DB,
+        min_silence: float = WHISPER_VAD_MIN_SILENCE,
+        max_segment: float = WHISPER_VAD_MAX_SEGMENT,
+    ):
+        self.threshold = 10 ** (threshold_db / 20)
+        self.silence_frames = int(min_silence * SAMPLE_RATE / FRAME_SAMPLES)
+        self.max_frames = int(max_segment * SAMPLE_RATE / FRAME_SAMPLES)
+        self.padding_frames = int(VAD_PADDING_SECONDS * SAMPLE_RATE / FRAME_SAMPLES)
+        self.min_speech_frames = int(
+            VAD_MIN_SPEECH_SECONDS * SAMPLE_RATE / FRAME_SAMPLES
+        )
+        self._rest = np.zeros(0, dtype=np.float32)
+        self._frames: List[np.ndarray] = []
+        self._speech = 0
+        self._silence = 0
+
+    def feed(self, samples: np.ndarray) -> List[np.ndarray]:
+        """Добавляет отсчеты и возвращает законченные фразы"""
+        samples = np.concatenate([self._rest, samples]) if len(self._rest) else samples
+        count = len(samples) // FRAME_SAMPLES
+        self._rest = samples[count * FRAME_SAMPLES :].copy()
+        frames = samples[: count * FRAME_SAMPLES].reshape(count, FRAME_SAMPLES)
+        loud = np.sqrt(np.mean(frames**2, axis=1)) > self.threshold
+
+        segments = []
+        for frame, is_speech in zip(frames, loud):
+            segment = self._push(frame.copy(), bool(is_speech))
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def finish(self) -> List[np.ndarray]:
+        """Последняя фраза, если запись кончилась без паузы"""
+        if len(self._rest):
+            self._frames.append(self._rest)
+            self._rest = np.zeros(0, dtype=np.float32)
+        segment = self._cut()
+        return [segment] if segment is not None else []
+
+    def _push(self, frame: np.ndarray, is_speech: bool) -> Optional[np.ndarray]:
+        self._frames.append(frame)
+        if is_speech:
+            self._speech += 1
+            self._silence = 0
+        else:
+            self._silence += 1
+            if not self._speech:
+                # До начала речи держим только отступ
+                del self._frames[: -self.padding_frames or len(self._frames)]
+                return None
+
+        if self._silence >= self.silence_frames or len(self._frames) >= self.max_frames:
+            return self._cut()
+        return None
+
+    def _cut(self) -> Optional[np.ndarray]:
+        frames, speech = self._frames, self._speech
+        trailing = max(0, self._silence - self.padding_frames)
+        self._frames, self._speech, self._silence = [], 0, 0
+        if speech < self.min_speech_frames:
+            return None
+        if trailing:
+            frames = frames[:-trailing]
+        return np.concatenate(frames)
+
+
+async def iter_segments(
+    path: str, decoder: Callable[[str], Iterator[np.ndarray]] = read_pcm
+) -> AsyncIterator[np.ndarray]:
+    """Фразы файла по мере декодирования, не блокируя event loop"""
+    chunks = decoder(path)
+    segmenter = VadSegmenter()
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            for segment in segmenter.feed(chunk):
+                yield segment
+        for segment in segmenter.finish():
+            yield segment
+    finally:
+        chunks.close()
@@ -0,0 +1,166 @@
+"""
+История диалога с ограниченным размером промпта.
+
+В модель уходит не вся история, а:
+- сжатое состояние: краткое содержание вытесненных сообщений и уже
+  известные поля цели (из JSON блоков прошлых ответов и разобранные
+  goal_extractor из сообщений пользователя);
+- последние сообщения из окна, сколько помещается в бюджет
+  CHAT_HISTORY_TOKEN_BUDGET.
+
+Окно — это весь хранимый список: в нем не больше CHAT_HISTORY_WINDOW
+сообщений. Когда окно переполняется, старшая половина сворачивается
+в краткое содержание и удаляется через LTRIM, так что каждое сообщение
+попадает в промпт либо целиком, либо в кратком содержании.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from app.core.redis_cache import async_cache
+
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", 16))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 1500))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", 1200))
+# Сколько символов одной реплики попадает в краткое содержание
+SUMMARY_LINE_CHARS = 200
+# Служебные токены на роль и разметку каждого сообщения
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "Краткое содержание начала диалога:"
+
+GOAL_FIELDS = ("term", "sum", "reason", "capital")
+GOAL_LABELS = {
+    "term": "срок, мес.",
+    "sum": "сумма, ₽",
+    "reason": "цель",
+    "capital": "стартовый капитал, ₽",
+}
+
+
+def chat_key(user_id: str) -> str:
+    """Генерирует ключ для хранения истории чата"""
+    return f"user:{user_id}:chat_history"
+
+
+def state_key(user_id: str) -> str:
+    """Ключ сжатого состояния диалога"""
+    return f"user:{user_id}:chat_state"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка числа токенов без токенизатора: BPE токенизаторы дают около
+    4 символов на токен для латиницы и около 2.5 для кириллицы
+    """
+    cyrillic = sum(1 for ch in text if "Ѐ" <= ch <= "ӿ")
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _known_goal_fields(data: Dict) -> Dict:
+    """Поля цели, которые модель уже заполнила (не None и не "false")"""
+    return {
+        field: data[field]
+        for field in GOAL_FIELDS
+        if data.get(field) is not None and str(data[field]).lower() != "false"
+    }
+
+
+def _fold_into_summary(summary: str, messages: List[Dict]) -> str:
+    """Дописывает вытесненные сообщения в краткое содержание"""
+    lines = [line for line in summary.split("\n") if line]
+    for message in messages:
+        author = "Пользователь" if message["role"] == "user" else "Ассистент"
+        content = " ".join(message["content"].split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[:SUMMARY_LINE_CHARS].rstrip() + "…"
+        lines.append(f"{author}: {content}")
+
+    # Старейшие строки отбрасываются первыми
+    while lines and sum(len(line) + 1 for line in lines) > CHAT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _state_message(state: Dict) -> Optional[Dict]:
+    parts = []
+    if state.get("summary"):
+        parts.append(f"{SUMMARY_HEADER}\n{state['summary']}")
+    goal = state.get("goal") or {}
+    if goal:
+        known = ", ".join(f"{GOAL_LABELS[field]}: {goal[field]}" for field in goal)
+        parts.append(f"Уже известные параметры цели: {known}")
+    if not parts:
+        return None
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+async def append_message(user_id: str, role: str, content: str):
+    """Добавляет сообщение и сворачивает старые, если список разросся"""
+    length = await async_cache.append_to_list(
+        chat_key(user_id), {"role": role, "content": content}
+    )
+    if length > CHAT_HISTORY_WINDOW:
+        await _compact(user_id, length)
+
+
+async def _compact(user_id: str, length: int):
+    overflow = length - CHAT_HISTORY_WINDOW // 2
+    key = chat_key(user_id)
+    evicted = await async_cache.get_list(key, 0, overflow - 1)
+    await async_cache.trim_list(key, overflow, -1)
+
+    state = await async_cache.get_json(state_key(user_id)) or {}
+    state["summary"] = _fold_into_summary(state.get("summary", ""), evicted)
+    state["compacted"] = state.get("compacted", 0) + len(evicted)
+    await async_cache.set_json(state_key(user_id), state)
+
+
+async def remember_goal(user_id: str, extracted_data: Optional[Dict]) -> Dict:
+    """
+    Запоминает поля цели из JSON блока ответа или сообщения пользователя,
+    чтобы они пережили окно. Возвращает все известные поля цели
+    """
+    known = _known_goal_fields(extracted_data or {})
+    state = await async_cache.get_json(state_key(user_id)) or {}
+    goal = state.get("goal") or {}
+    if all(goal.get(field) == value for field, value in known.items()):
+        return goal
+    goal.update(known)
+    state["goal"] = goal
+    await async_cache.set_json(state_key(user_id), state)
+    return goal
+
+
+async def build_prompt(user_id: str) -> List[Dict]:
+    """
+    Сообщения для модели: сжатое состояние и последние реплики в пределах
+    бюджета токенов. Из Redis читается только окно (один LRANGE)
+    """
+    window = await async_cache.get_list(chat_key(user_id), -CHAT_HISTORY_WINDOW, -1)
+    state = await async_cache.get_json(state_key(user_id)) or {}
+
+    budget = CHAT_HISTORY_TOKEN_BUDGET
+    system = _state_message(state)
+    if system:
+        budget -= estimate_tokens(system["content"])
+
+    selected = []
+    for message in reversed(window):
+        cost = estimate_tokens(message["content"])
+        # Последнее сообщение пользователя уходит всегда
+        if selected and cost > budget:
+            break
+        selected.append(message)
+        budget -= cost
+    selected.reverse()
+
+    return ([system] if system else []) + selected
+
+
+async def get_messages(user_id: str) -> List[Dict]:
+    """Хранимые сообщения (без свернутых в краткое содержание)"""
+    return await async_cache.get_list(chat_key(user_id))
+
+
+async def clear(user_id: str):
+    await async_cache.delete(chat_key(user_id), state_key(user_id))
@@ -0,0 +1,111 @@
+"""
+Правила противоречий анкеты риск-профиля.
+
+Правило — данные: условие "when" (ответы на вопросы и факторы цели, все
+должны совпасть; значение — вариант или кортеж допустимых вариантов),
+уточняющий вопрос и "effects" — как ответ на уточнение меняет ответы
+анкеты перед пересчетом. Противоречия (check_all_contradictions) и
+пересчет с уточнениями (risk_profile_engine) читают одни и те же правила.
+
+ContradictionMatcher компилирует правила в индекс
+(вопрос или фактор, вариант) → правила: проверяются только правила,
+которые затрагивают данные ответы, поэтому время не зависит от числа
+правил. Новое правило — новая запись в CONTRADICTION_RULES.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+CONTRADICTION_RULES: List[Dict] = [
+    {
+        "code": "small_capital_high_return",
+        "when": {"capital_size": "A", 8: "C"},
+        "question": "При небольшом стартовом капитале вы ожидаете высокую доходность. "
+        "Рекомендуем начать с умеренных стратегий. Согласны?",
+        "options": [
+            "A) Да, начну с умеренного риска",
+            "B) Нет, готов к высокому риску",
+        ],
+        "effects": {"A": {10: "B"}},
+    },
+    {
+        "code": "beginner_large_capital",
+        "when": {1: "A", "capital_size": "C"},
+        "question": "Вы начинающий инвестор с крупным капиталом. "
+        "Рекомендуем начать с умеренных стратегий. Согласны?",
+        "options": [
+            "A) Да, начну с умеренного риска",
+            "B) Нет, готов к более агрессивной стратегии",
+        ],
+    },
+    {
+        "code": "low_risk_buy_dip",
+        "when": {6: "A", 7: "C"},
+        "question": "Вы указали низкую терпимость к просадкам, "
+        "но готовы докупать при падении. Что для вас приоритетнее?",
+        "options": [
+            "A) Сохранение капитала важнее",
+            "B) Готов к умеренному риску для роста",
+        ],
+        "effects": {"A": {9: "A"}, "B": {8: "B"}},
+    },
+    {
+        "code": "no_experience_self_management",
+        "when": {1: "A", 2: "C"},
+        "question": "Без опыта вы выбираете самостоятельное управление. "
+        "Рекомендуем начать с ETF. Согласны?",
+        "options": [
+            "A) Да, начну с ETF",
+            "B) Нет, хочу самостоятельное управление",
+        ],
+        "effects": {"A": {3: "B"}},
+    },
+    # Вопросы больше не задаются, но уточнения по этим кодам принимаются
+    {"code": "large_capital_fear", "effects": {"A": {9: "A", 10: "A"}, "B": {11: "B"}}},
+    {"code": "high_investment_low_capital", "effects": {"A": {7: "B"}}},
+]
+
+
+def rule_options(value) -> Tuple[str, ...]:
+    """Допустимые варианты условия: "A" или ("A", "B")"""
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+class ContradictionMatcher:
+    """Правила, скомпилированные в индекс по ответам"""
+
+    def __init__(self, rules: List[Dict] = CONTRADICTION_RULES):
+        self.rules = rules
+        self._index: Dict[Tuple, List[int]] = defaultdict(list)
+        self._required: List[int] = []
+        for i, rule in enumerate(rules):
+            when = rule.get("when") or {}
+            for key, value in when.items():
+                for option in rule_options(value):
+                    self._index[(key, option)].append(i)
+            self._required.append(len(when))
+        self._index = dict(self._index)
+
+    def match(self, answers: Dict, llm_data: Optional[Dict] = None) -> List[Dict]:
+        """
+        Противоречия в порядке правил: {"code", "question", "options"}.
+        answers — {номер вопроса: вариант}, llm_data — факторы цели
+        """
+        counts: Dict[int, int] = {}
+        for items in (answers.items(), llm_data.items() if llm_data else ()):
+            for item in items:
+                for i in self._index.get(item, ()):
+                    counts[i] = counts.get(i, 0) + 1
+
+        return [
+            {
+                "code": self.rules[i]["code"],
+                "question": self.rules[i]["question"],
+                "options": list(self.rules[i]["options"]),
+            }
+            for i in sorted(counts)
+            if counts[i] == self._required[i]
+        ]
+
+
+matcher = ContradictionMatcher()
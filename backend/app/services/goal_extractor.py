@@ -0,0 +1,264 @@
+"""
+Правиловый разбор параметров цели из сообщения пользователя.
+
+Извлекает то, что сказано явно: срок («5 лет», «полтора года»,
+«к 2030 году», «в 2030 г.»), сумму цели и стартовый капитал («3 млн», «500 тыс.»,
+«1 500 000 ₽») и назначение («на квартиру»). Поле заполняется, только если
+трактовка однозначна: сумма без подсказки «накопить»/«есть» или два
+срока без предлога остаются модели.
+
+Срок возвращается в месяцах, суммы — в рублях, как в JSON блоке LLM.
+"""
+
+import datetime
+import re
+from typing import Dict, List, Optional, Tuple
+
+WORD_NUMBERS = {
+    "ноль": 0,
+    "один": 1,
+    "одна": 1,
+    "одну": 1,
+    "одного": 1,
+    "одной": 1,
+    "два": 2,
+    "две": 2,
+    "двух": 2,
+    "три": 3,
+    "трех": 3,
+    "четыре": 4,
+    "четырех": 4,
+    "пять": 5,
+    "пяти": 5,
+    "шесть": 6,
+    "шести": 6,
+    "семь": 7,
+    "семи": 7,
+    "восемь": 8,
+    "восьми": 8,
+    "девять": 9,
+    "девяти": 9,
+    "десять": 10,
+    "десяти": 10,
+    "одиннадцать": 11,
+    "двенадцать": 12,
+    "двенадцати": 12,
+    "пятнадцать": 15,
+    "пятнадцати": 15,
+    "двадцать": 20,
+    "двадцати": 20,
+    "тридцать": 30,
+    "тридцати": 30,
+    "сорок": 40,
+    "пятьдесят": 50,
+    "сто": 100,
+    "двести": 200,
+    "триста": 300,
+    "пятьсот": 500,
+    "полтора": 1.5,
+    "полторы": 1.5,
+}
+
+MULTIPLIERS = [
+    (re.compile(r"млрд|миллиард"), 1_000_000_000),
+    (re.compile(r"млн|миллион|лям"), 1_000_000),
+    (re.compile(r"тыс|тысяч|к$|k$"), 1_000),
+]
+
+_WORDS = "|".join(sorted(WORD_NUMBERS, key=len, reverse=True))
+NUMBER = rf"(?:\d{{1,3}}(?:[  ]\d{{3}})+|\d+(?:[.,]\d+)?|(?:{_WORDS})\b)"
+
+AMOUNT_RE = re.compile(
+    rf"(?<![\w.,])(?:(?P<num>{NUMBER})\s*"
+    r"(?P<mult>млрд|миллиард\w*|млн|миллион\w*|лям\w*|тыс\w*|тысяч\w*|к\b|k\b)?"
+    r"|(?P<word_mult>миллиард\w*|миллион\w*|тысяч\w*))\.?\s*"
+    r"(?P<cur>руб\w*|р\b\.?|₽)?"
+)
+DURATION_RE = re.compile(
+    rf"(?<![\w.,])(?:(?P<num>{NUMBER})\s*)?(?P<unit>лет\b|год\w*|месяц\w*|мес\b\.?)"
+)
+HALF_YEAR_RE = re.compile(r"\bполгода\b")
+# «к 2030», «до 2030 года», «в 2030 году», «в 2030 г.»
+TARGET_YEAR_RE = re.compile(
+    r"\b(?:(?:к|до)\s+(?P<year>20\d\d)\s*(?:год\w*|г\b\.?)?"
+    r"|в\s+(?P<in_year>20\d\d)\s*(?:год\w*|г\b\.?))"
+)
+# Год с «году»/«г.» — это дата, а не сумма, даже без предлога
+YEAR_RE = re.compile(r"(?<![\w.,])(?:19|20)\d\d\s*(?:год\w*|г\b\.?)")
+# «40 тысяч в месяц» — регулярный взнос, а не сумма цели или капитал
+PERIODIC_RE = re.compile(
+    r"^\s*(?:в|за|каждый)\s+(?:месяц|мес|год|неделю)|^\s*ежемесячно"
+)
+
+# «2 или 3 года», «3-5 лет» — диапазон, срок не выбран
+RANGE_CUES = re.compile(r"\w\s*(?:или|-|–)\s*$")
+TERM_CUES = re.compile(r"(?:за|через|на|в течение|срок\w*|лет через)\s*$")
+AGE_CUES = re.compile(r"(?:мне|исполнилось|возраст\w*|уже)\s*$")
+# «ипотека на 20 лет», «20 лет кредита» — срок долга, а не накоплений
+LOAN_BEFORE = re.compile(
+    r"(?:ипотек|кредит|займ|заем|рассрочк)\w*\s+(?:сроком\s+|на\s+срок\s+)?(?:на\s+)?$"
+)
+LOAN_AFTER = re.compile(r"^\s*(?:ипотек|кредит|займ|заем|рассрочк)")
+CAPITAL_CUES = re.compile(
+    r"есть|имеется|накоплен|накопил|отложен|отложил|сбережен|стартов|(?<!перво)начальн|"
+    r"капитал|вложить|внести|инвестировать|свободн|на счету|на руках"
+)
+SUM_CUES = re.compile(
+    r"накопить|собрать|нужн|надо|стоит|стоимост|цел|хочу|мечта|сумм|получить|"
+    r"заработать|копить|купить"
+)
+NO_CAPITAL_RE = re.compile(
+    r"нет\s+(?:накоплений|сбережений|денег|капитала)|"
+    r"(?:накоплений|сбережений|капитала)\s+(?:пока\s+)?нет|"
+    r"с нуля|ничего нет|без накоплений"
+)
+
+REASONS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"ипотек|первоначальн\w* взнос"), "первоначальный взнос по ипотеке"),
+    (re.compile(r"квартир"), "покупка квартиры"),
+    (re.compile(r"\bдом\b|\bдомик|коттедж|\bдач[аиу]\b"), "покупка дома"),
+    (re.compile(r"машин|автомобил|\bавто\b"), "покупка автомобиля"),
+    (re.compile(r"пенси"), "пенсия"),
+    (re.compile(r"образован|учеб|обучени|университет|институт"), "образование"),
+    (re.compile(r"свадьб"), "свадьба"),
+    (re.compile(r"путешеств|отпуск|поездк"), "путешествие"),
+    (re.compile(r"ремонт"), "ремонт"),
+    (re.compile(r"подушк\w* безопасност|черный день"), "финансовая подушка"),
+    (re.compile(r"бизнес|сво\w* дел"), "открытие бизнеса"),
+    (re.compile(r"\bдет(?:ей|ям|и)\b|ребен"), "будущее детей"),
+]
+
+
+def _parse_number(token: Optional[str]) -> Optional[float]:
+    if not token:
+        return None
+    if token in WORD_NUMBERS:
+        return float(WORD_NUMBERS[token])
+    token = token.replace(" ", "").replace(" ", "").replace(",", ".")
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _multiplier(word: Optional[str]) -> int:
+    if not word:
+        return 1
+    for pattern, value in MULTIPLIERS:
+        if pattern.match(word):
+            return value
+    return 1
+
+
+def _extract_term(text: str, masked: List[Tuple[int, int]]) -> Optional[float]:
+    candidates = []  # (месяцы, есть ли предлог срока)
+    for match in DURATION_RE.finditer(text):
+        before = text[max(0, match.start() - 15) : match.start()]
+        if AGE_CUES.search(before):
+            continue
+        before_loan = text[max(0, match.start() - 30) : match.start()]
+        if LOAN_BEFORE.search(before_loan) or LOAN_AFTER.search(text[match.end() :]):
+            # Срок цели остается модели, число не должно стать суммой
+            masked.append(match.span())
+            return None
+        if match.group("num") and RANGE_CUES.search(before):
+            return None
+        number = _parse_number(match.group("num"))
+        unit = match.group("unit")
+        has_cue = bool(TERM_CUES.search(before))
+        if number is None:
+            # «через год» без числа; «в год», «в месяц» — это периодичность
+            if not has_cue or re.search(r"\bв\s*$", before):
+                continue
+            number = 1.0
+        if unit.startswith("год") and number > 1900:
+            continue  # «2030 года» разбирается ниже
+        months = number * 12 if unit.startswith(("лет", "год")) else number
+        candidates.append((months, has_cue))
+        masked.append(match.span())
+
+    for match in HALF_YEAR_RE.finditer(text):
+        candidates.append((6.0, True))
+        masked.append(match.span())
+
+    today = datetime.date.today()
+    for match in TARGET_YEAR_RE.finditer(text):
+        year = int(match.group("year") or match.group("in_year"))
+        months = (year - today.year) * 12
+        if months > 0:
+            candidates.append((float(months), True))
+        masked.append(match.span())
+
+    for match in YEAR_RE.finditer(text):
+        masked.append(match.span())
+
+    cued = [months for months, has_cue in candidates if has_cue]
+    pool = cued or [months for months, _ in candidates]
+    if len(set(pool)) == 1:
+        return pool[0]
+    return None
+
+
+def _extract_amounts(text: str, masked: List[Tuple[int, int]]) -> Dict[str, float]:
+    fields: Dict[str, float] = {}
+    ambiguous = set()
+    context_start = 0
+    for match in AMOUNT_RE.finditer(text):
+        if any(start <= match.start() < end for start, end in masked):
+            continue
+        mult = match.group("mult") or match.group("word_mult")
+        # «накопить миллион» — число только в множителе
+        number = _parse_number(match.group("num")) if match.group("num") else 1.0
+        if number is None:
+            continue
+        value = number * _multiplier(mult)
+        # Без множителя и валюты маленькое число — не деньги
+        if not mult and not match.group("cur") and value < 1000:
+            continue
+        if PERIODIC_RE.search(text[match.end() : match.end() + 20]):
+            context_start = match.end()
+            continue
+
+        context = text[context_start : match.start()]
+        context_start = match.end()
+        capital_cue = [m.end() for m in CAPITAL_CUES.finditer(context)]
+        sum_cue = [m.end() for m in SUM_CUES.finditer(context)]
+        if not capital_cue and not sum_cue:
+            continue
+        field = (
+            "capital"
+            if max(capital_cue, default=-1) > max(sum_cue, default=-1)
+            else "sum"
+        )
+        if field in fields and fields[field] != value:
+            ambiguous.add(field)
+        fields[field] = value
+
+    for field in ambiguous:
+        del fields[field]
+    if "capital" not in fields and NO_CAPITAL_RE.search(text):
+        fields["capital"] = 0.0
+    return fields
+
+
+def extract_goal_fields(message: str) -> Dict:
+    """
+    Поля цели, однозначно названные в сообщении:
+    term (месяцы), sum и capital (рубли), reason
+    """
+    text = message.lower().replace("ё", "е")
+    fields: Dict = {}
+    masked: List[Tuple[int, int]] = []
+
+    term = _extract_term(text, masked)
+    if term:
+        fields["term"] = term
+
+    fields.update(_extract_amounts(text, masked))
+
+    for pattern, reason in REASONS:
+        if pattern.search(text):
+            fields["reason"] = reason
+            break
+
+    return fields
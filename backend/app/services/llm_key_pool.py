@@ -0,0 +1,301 @@
+"""
+Общий пул API ключей OpenRouter.
+
+Перед каждым запросом к LLM ключ выбирается заранее, а не после 429:
+у каждого ключа есть token bucket (LLM_KEY_RATE_PER_MINUTE запросов в минуту,
+запас LLM_KEY_BURST) и cooldown после rate limit. Из здоровых ключей
+берется наименее загруженный — с наименьшим числом запросов в работе.
+Состояние хранится в Redis и выбирается атомарно Lua скриптом, поэтому
+бюджет общий для всех воркеров и процессов. Без Redis тот же алгоритм
+работает в памяти процесса.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import dotenv
+from openai import RateLimitError
+
+from app.core.redis_cache import REDIS_ERRORS, async_cache
+
+dotenv.load_dotenv()
+
+LLM_KEY_RATE_PER_MINUTE = float(os.getenv("LLM_KEY_RATE_PER_MINUTE", 20))
+LLM_KEY_BURST = float(os.getenv("LLM_KEY_BURST", 5))
+LLM_KEY_COOLDOWN = float(os.getenv("LLM_KEY_COOLDOWN", 60))
+LLM_KEY_ACQUIRE_TIMEOUT = float(os.getenv("LLM_KEY_ACQUIRE_TIMEOUT", 30))
+# Запрос считается завершенным через столько секунд, даже если процесс
+# упал и не вернул ключ
+LLM_KEY_LEASE_TTL = float(os.getenv("LLM_KEY_LEASE_TTL", 300))
+
+
+def get_api_keys() -> List[str]:
+    """Получает все API ключи из .env"""
+    keys = []
+    i = 1
+    while True:
+        # First key can be stored as OPENROUTER_API_KEY (or _1 for legacy naming)
+        key_name = "OPENROUTER_API_KEY" if i == 1 else f"OPENROUTER_API_KEY_{i}"
+        key_value = os.environ.get(key_name) or (
+            os.environ.get("OPENROUTER_API_KEY_1") if i == 1 else None
+        )
+        if key_value:
+            keys.append(key_value)
+            i += 1
+        else:
+            break
+    return keys
+
+
+class KeyPoolExhausted(Exception):
+    """Ни один ключ не освободился за LLM_KEY_ACQUIRE_TIMEOUT"""
+
+
+def is_rate_limit(e: Exception) -> bool:
+    """Проверяет все возможные признаки rate limit"""
+    if isinstance(e, RateLimitError):
+        return True
+    if isinstance(e, KeyPoolExhausted):
+        # Пул уже ждал LLM_KEY_ACQUIRE_TIMEOUT: повтор не поможет
+        return False
+    error_str = str(e).lower()
+    return (
+        getattr(e, 'status', None) == 429  # Прямой статус 429
+        or getattr(e, 'status_code', None) == 429
+        or '429' in error_str  # Код 429 в тексте ошибки
+        or 'rate limit' in error_str  # Упоминание rate limit
+        or 'ratelimit' in error_str  # Альтернативное написание
+        or 'too many requests' in error_str  # Другая формулировка
+        or 'exceeded' in error_str  # Общее указание на превышение
+    )
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Retry-After из ответа провайдера, если он есть"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# KEYS: пары (bucket, leases) для каждого ключа
+# ARGV: now, rate (запросов/с), burst, lease_ttl, lease_id
+# Возвращает {номер ключа, 0} или {0, секунд до ближайшего готового ключа}
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local lease_ttl = tonumber(ARGV[4])
+local best, best_load, best_tokens
+local wait
+local refilled = {}
+for i = 1, #KEYS / 2 do
+  local bucket = KEYS[2 * i - 1]
+  local leases = KEYS[2 * i]
+  local state = redis.call('HMGET', bucket, 'tokens', 'ts', 'cooldown')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  local cooldown = tonumber(state[3]) or 0
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  refilled[i] = tokens
+  redis.call('ZREMRANGEBYSCORE', leases, '-inf', now)
+  local load = redis.call('ZCARD', leases)
+  local ready_at
+  if cooldown > now then
+    ready_at = cooldown
+  elseif tokens < 1 then
+    ready_at = now + (1 - tokens) / rate
+  end
+  if ready_at then
+    if not wait or ready_at - now < wait then
+      wait = ready_at - now
+    end
+  elseif not best or load < best_load
+      or (load == best_load and tokens > best_tokens) then
+    best, best_load, best_tokens = i, load, tokens
+  end
+end
+if not best then
+  return {0, tostring(wait or 1)}
+end
+local bucket = KEYS[2 * best - 1]
+local leases = KEYS[2 * best]
+redis.call('HSET', bucket, 'tokens', refilled[best] - 1, 'ts', now)
+redis.call('EXPIRE', bucket, 3600)
+redis.call('ZADD', leases, now + lease_ttl, ARGV[5])
+redis.call('EXPIRE', leases, math.ceil(lease_ttl) * 2)
+return {best, 0}
+"""
+
+
+@dataclass
+class _LocalKeyState:
+    tokens: float
+    ts: float
+    cooldown: float = 0.0
+    leases: Dict[str, float] = field(default_factory=dict)
+
+
+class KeyPool:
+    """Выбор API ключа по token bucket, cooldown и текущей загрузке"""
+
+    def __init__(
+        self,
+        keys: List[str],
+        rate_per_minute: float = LLM_KEY_RATE_PER_MINUTE,
+        burst: float = LLM_KEY_BURST,
+        cooldown: float = LLM_KEY_COOLDOWN,
+        acquire_timeout: float = LLM_KEY_ACQUIRE_TIMEOUT,
+        lease_ttl: float = LLM_KEY_LEASE_TTL,
+        use_redis: bool = True,
+    ):
+        self.keys = keys
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.cooldown = cooldown
+        self.acquire_timeout = acquire_timeout
+        self.lease_ttl = lease_ttl
+        self.use_redis = use_redis
+        # В Redis ключи хранятся по отпечатку, сами секреты туда не попадают
+        self._ids = [hashlib.sha256(key.encode()).hexdigest()[:16] for key in keys]
+        self._local: Dict[str, _LocalKeyState] = {}
+
+    def _redis_keys(self, index: int) -> Tuple[str, str]:
+        key_id = self._ids[index]
+        return f"llm:key:{key_id}:bucket", f"llm:key:{key_id}:leases"
+
+    async def acquire(self) -> Tuple[str, str]:
+        """Ждет здоровый ключ и возвращает (api_key, lease_id)"""
+        if not self.keys:
+            raise ValueError("No API keys available")
+
+        lease_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            index, wait = await self._try_acquire(lease_id)
+            if index is not None:
+                return self.keys[index], lease_id
+            if time.monotonic() + wait > deadline:
+                raise KeyPoolExhausted(
+                    f"All {len(self.keys)} API keys are rate limited, "
+                    f"next one is free in {wait:.1f}s"
+                )
+            await asyncio.sleep(wait)
+
+    async def release(self, api_key: str, lease_id: str):
+        index = self.keys.index(api_key)
+        if self.use_redis and async_cache.enabled:
+            try:
+                await async_cache.client.zrem(self._redis_keys(index)[1], lease_id)
+                return
+            except REDIS_ERRORS as e:
+                async_cache.mark_unavailable(e)
+        self._local_state(index, time.time()).leases.pop(lease_id, None)
+
+    async def report_rate_limit(
+        self, api_key: str, retry_after: Optional[float] = None
+    ):
+        """Отправляет ключ в cooldown и обнуляет его бюджет"""
+        index = self.keys.index(api_key)
+        now = time.time()
+        until = now + (retry_after or self.cooldown)
+        print(f"API key index {index + 1} cooling down for {until - now:.0f}s")
+        if self.use_redis and async_cache.enabled:
+            bucket, _ = self._redis_keys(index)
+            try:
+                await async_cache.client.hset(
+                    bucket, mapping={"tokens": 0, "ts": now, "cooldown": until}
+                )
+                return
+            except REDIS_ERRORS as e:
+                async_cache.mark_unavailable(e)
+        state = self._local_state(index, now)
+        state.tokens, state.ts, state.cooldown = 0.0, now, until
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """
+        Ключ на время одного запроса. Rate limit внутри блока отправляет
+        ключ в cooldown, исключение пробрасывается для повтора
+        """
+        api_key, lease_id = await self.acquire()
+        try:
+            yield api_key
+        except Exception as e:
+            if is_rate_limit(e):
+                await self.report_rate_limit(api_key, _retry_after(e))
+            raise
+        finally:
+            await self.release(api_key, lease_id)
+
+    async def _try_acquire(self, lease_id: str) -> Tuple[Optional[int], float]:
+        now = time.time()
+        if self.use_redis and async_cache.enabled:
+            redis_keys = [
+                name for i in range(len(self.keys)) for name in self._redis_keys(i)
+            ]
+            try:
+                script = async_cache.client.register_script(ACQUIRE_SCRIPT)
+                index, wait = await script(
+                    keys=redis_keys,
+                    args=[now, self.rate, self.burst, self.lease_ttl, lease_id],
+                )
+                index = int(index)
+                return (index - 1, 0.0) if index else (None, float(wait))
+            except REDIS_ERRORS as e:
+                async_cache.mark_unavailable(e)
+        return self._try_acquire_local(lease_id, now)
+
+    def _local_state(self, index: int, now: float) -> _LocalKeyState:
+        state = self._local.get(self._ids[index])
+        if state is None:
+            state = _LocalKeyState(tokens=self.burst, ts=now)
+            self._local[self._ids[index]] = state
+        return state
+
+    def _try_acquire_local(
+        self, lease_id: str, now: float
+    ) -> Tuple[Optional[int], float]:
+        """То же, что ACQUIRE_SCRIPT, для работы без Redis"""
+        best, best_load, best_tokens = None, 0, 0.0
+        wait = None
+        for index in range(len(self.keys)):
+            state = self._local_state(index, now)
+            state.tokens = min(
+                self.burst, state.tokens + max(0.0, now - state.ts) * self.rate
+            )
+            state.ts = now
+            state.leases = {k: v for k, v in state.leases.items() if v > now}
+            load = len(state.leases)
+
+            ready_at = None
+            if state.cooldown > now:
+                ready_at = state.cooldown
+            elif state.tokens < 1:
+                ready_at = now + (1 - state.tokens) / self.rate
+            if ready_at is not None:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+            elif (
+                best is None
+                or load < best_load
+                or (load == best_load and state.tokens > best_tokens)
+            ):
+                best, best_load, best_tokens = index, load, state.tokens
+
+        if best is None:
+            return None, wait or 1.0
+        state = self._local_state(best, now)
+        state.tokens -= 1
+        state.leases[lease_id] = now + self.lease_ttl
+        return best, 0.0
+
+
+key_pool = KeyPool(get_api_keys())
@@ -0,0 +1,256 @@
+"""
+Кеш ответов LLM для диалога постановки цели (включается
+LLM_RESPONSE_CACHE_ENABLED).
+
+Ключ — хеш нормализованного промпта: регистр, «ё», пунктуация и лишние
+пробелы не влияют. Для первой реплики диалога дополнительно ищется
+похожий запрос по локальному эмбеддингу (хешированные символьные
+триграммы, без внешних моделей), если задан порог
+LLM_RESPONSE_CACHE_SIMILARITY. Похожим считается только запрос с теми же
+числами: «за 5 лет» и «за 10 лет» (и «за пять лет» и «за десять лет») —
+разные цели.
+
+Записи живут LLM_RESPONSE_CACHE_TTL секунд, сверх
+LLM_RESPONSE_CACHE_MAX_ENTRIES вытесняются давно не использованные.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.redis_cache import REDIS_ERRORS, MemoryStore, async_cache
+from app.services.chat_history import SUMMARY_HEADER
+from app.services.goal_extractor import WORD_NUMBERS
+
+LLM_RESPONSE_CACHE_ENABLED = os.getenv(
+    "LLM_RESPONSE_CACHE_ENABLED", "false"
+).lower() in (
+    "1",
+    "true",
+    "yes",
+)
+LLM_RESPONSE_CACHE_TTL = int(os.getenv("LLM_RESPONSE_CACHE_TTL", 24 * 3600))
+LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", 10000))
+# 0 — только точное совпадение
+LLM_RESPONSE_CACHE_SIMILARITY = float(os.getenv("LLM_RESPONSE_CACHE_SIMILARITY", 0))
+
+EMBEDDING_DIM = 512
+# Сколько первых реплик держим в индексе похожести
+SIMILARITY_INDEX_SIZE = 4096
+
+ENTRY_PREFIX = "llm:response:"
+LRU_KEY = "llm:response:lru"
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+_NUMBERS = re.compile(r"\d+(?:[.,]\d+)?")
+# Числа словами сравниваются как цифры: «пять» — то же, что «5»
+_WORD_VALUES = {**WORD_NUMBERS, "полгода": 0.5}
+_WORD_NUMBERS = re.compile(
+    r"\b(?:" + "|".join(sorted(_WORD_VALUES, key=len, reverse=True)) + r")\b"
+)
+
+
+def normalise_text(text: str) -> str:
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def cache_key(messages: List[Dict], model: str) -> str:
+    """Хеш нормализованного состояния диалога"""
+    state = [model] + [[m["role"], normalise_text(m["content"])] for m in messages]
+    payload = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def embed(text: str) -> np.ndarray:
+    """Нормированный вектор хешированных символьных триграмм"""
+    text = f" {normalise_text(text)} "
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for i in range(len(text) - 2):
+        vector[zlib.crc32(text[i : i + 3].encode()) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _word_to_digits(match: re.Match) -> str:
+    value = _WORD_VALUES[match.group()]
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def _numbers(text: str) -> Tuple[str, ...]:
+    text = _WORD_NUMBERS.sub(_word_to_digits, text.lower().replace("ё", "е"))
+    return tuple(_NUMBERS.findall(text))
+
+
+def _first_turn(messages: List[Dict]) -> Optional[str]:
+    """
+    Текст первой реплики, если промпт — это только она. Сообщение состояния
+    с полями цели не мешает: поля разобраны из этой же реплики, а числа
+    похожих запросов и так должны совпасть. Краткое содержание значит,
+    что диалог начался раньше
+    """
+    turns = [m for m in messages if m["role"] != "system"]
+    if len(turns) != 1 or turns[0]["role"] != "user":
+        return None
+    if any(
+        m["content"].startswith(SUMMARY_HEADER)
+        for m in messages
+        if m["role"] == "system"
+    ):
+        return None
+    return turns[0]["content"]
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        enabled: bool = LLM_RESPONSE_CACHE_ENABLED,
+        ttl: int = LLM_RESPONSE_CACHE_TTL,
+        max_entries: int = LLM_RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = LLM_RESPONSE_CACHE_SIMILARITY,
+        use_redis: bool = True,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.use_redis = use_redis
+        self._memory = MemoryStore(max_items=max_entries)
+        # Кольцевой буфер индекса похожести
+        self._lock = threading.Lock()
+        self._index_keys: List[Optional[str]] = [None] * SIMILARITY_INDEX_SIZE
+        self._index_numbers: List[Tuple[str, ...]] = [()] * SIMILARITY_INDEX_SIZE
+        self._index_vectors = np.zeros(
+            (SIMILARITY_INDEX_SIZE if similarity > 0 else 0, EMBEDDING_DIM),
+            dtype=np.float32,
+        )
+        self._index_slots: Dict[str, int] = {}
+        self._index_filled = 0
+        self._index_next = 0
+        self.metrics = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0}
+
+    def _redis(self) -> bool:
+        return self.use_redis and async_cache.enabled
+
+    async def get(self, messages: List[Dict], model: str) -> Optional[str]:
+        """Ответ из кеша или None"""
+        if not self.enabled:
+            return None
+
+        key = cache_key(messages, model)
+        response = await self._load(key)
+        if response is not None:
+            self.metrics["exact_hits"] += 1
+            return response
+
+        first_turn = _first_turn(messages)
+        if first_turn is not None and self.similarity > 0:
+            similar_key = self._find_similar(first_turn)
+            if similar_key is not None:
+                response = await self._load(similar_key)
+                if response is not None:
+                    self.metrics["similar_hits"] += 1
+                    return response
+
+        self.metrics["misses"] += 1
+        return None
+
+    async def put(self, messages: List[Dict], model: str, response: str):
+        if not self.enabled or not response:
+            return
+
+        key = cache_key(messages, model)
+        await self._store(key, response)
+        self.metrics["stores"] += 1
+
+        first_turn = _first_turn(messages)
+        if first_turn is not None and self.similarity > 0:
+            self._index(key, first_turn)
+
+    def stats(self) -> Dict:
+        lookups = (
+            self.metrics["exact_hits"]
+            + self.metrics["similar_hits"]
+            + self.metrics["misses"]
+        )
+        hits = self.metrics["exact_hits"] + self.metrics["similar_hits"]
+        return {
+            "enabled": self.enabled,
+            **self.metrics,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def _load(self, key: str) -> Optional[str]:
+        if self._redis():
+            try:
+                async with async_cache.client.pipeline(transaction=False) as pipe:
+                    pipe.get(ENTRY_PREFIX + key)
+                    # XX: обновляем время доступа только у существующих записей
+                    pipe.zadd(LRU_KEY, {key: time.time()}, xx=True)
+                    response, _ = await pipe.execute()
+                return response
+            except REDIS_ERRORS as e:
+                async_cache.mark_unavailable(e)
+        return self._memory.get(key)
+
+    async def _store(self, key: str, response: str):
+        if self._redis():
+            try:
+                async with async_cache.client.pipeline(transaction=False) as pipe:
+                    pipe.set(ENTRY_PREFIX + key, response, ex=self.ttl)
+                    pipe.zadd(LRU_KEY, {key: time.time()})
+                    pipe.zcard(LRU_KEY)
+                    size = (await pipe.execute())[-1]
+                if size > self.max_entries:
+                    evicted = await async_cache.client.zpopmin(
+                        LRU_KEY, size - self.max_entries
+                    )
+                    if evicted:
+                        await async_cache.client.unlink(
+                            *[ENTRY_PREFIX + member for member, _ in evicted]
+                        )
+                return
+            except REDIS_ERRORS as e:
+                async_cache.mark_unavailable(e)
+        self._memory.set(key, response, self.ttl)
+
+    def _index(self, key: str, text: str):
+        vector = embed(text)
+        with self._lock:
+            if key in self._index_slots:
+                return
+            slot = self._index_next
+            replaced = self._index_keys[slot]
+            if replaced is not None:
+                del self._index_slots[replaced]
+            self._index_keys[slot] = key
+            self._index_numbers[slot] = _numbers(text)
+            self._index_vectors[slot] = vector
+            self._index_slots[key] = slot
+            self._index_next = (slot + 1) % SIMILARITY_INDEX_SIZE
+            self._index_filled = min(self._index_filled + 1, SIMILARITY_INDEX_SIZE)
+
+    def _find_similar(self, text: str) -> Optional[str]:
+        with self._lock:
+            if not self._index_filled:
+                return None
+            scores = self._index_vectors[: self._index_filled] @ embed(text)
+            numbers = _numbers(text)
+            for i in np.argsort(scores)[::-1]:
+                if scores[i] < self.similarity:
+                    return None
+                if self._index_numbers[i] == numbers:
+                    return self._index_keys[i]
+        return None
+
+
+response_cache = ResponseCache()
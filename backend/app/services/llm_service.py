@@ -1,62 +1,88 @@
+import asyncio
 import json
 import os
-import time
-import asyncio
-from typing import Dict, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import dotenv
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 
-from app.core.redis_cache import cache
 from app.schemas.chat import Message
 from app.schemas.risk_profile import LLMGoalData
+from app.services import chat_history
+from app.services.goal_extractor import extract_goal_fields
+from app.services.llm_key_pool import is_rate_limit, key_pool
+from app.services.llm_response_cache import response_cache
 
 dotenv.load_dotenv()
 
 
-# Получаем все API ключи из .env
-def _get_api_keys():
-    """Получает все API ключи из .env"""
-    keys = []
-    i = 1
-    while True:
-        # First key can be stored as OPENROUTER_API_KEY (or _1 for legacy naming)
-        key_name = "OPENROUTER_API_KEY" if i == 1 else f"OPENROUTER_API_KEY_{i}"
-        key_value = os.environ.get(key_name) or (
-            os.environ.get("OPENROUTER_API_KEY_1") if i == 1 else None
-        )
-        if key_value:
-            keys.append(key_value)
-            i += 1
-        else:
-            break
-    return keys
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+# Сколько запросов к LLM процесс держит одновременно, остальные ждут
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", 32))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
 
+# Долгоживущие клиенты по одному на ключ: httpx держит keep-alive соединения,
+# TLS рукопожатие не повторяется на каждое сообщение
+_clients: Dict[str, AsyncOpenAI] = {}
+_clients_loop = None
+_in_flight: Optional[asyncio.Semaphore] = None
 
-API_KEYS = _get_api_keys()
-current_key_index = 0
 
-
-def _get_client():
-    """Создает клиент с текущим API ключом"""
-    if not API_KEYS:
-        raise ValueError("No API keys available")
-
-    current_key = API_KEYS[current_key_index]
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=current_key,
-    )
+def _bind_loop():
+    """
+    Соединения httpx и семафор привязаны к event loop, поэтому в новом
+    цикле (asyncio.run в Celery) клиенты и семафор создаются заново
+    """
+    global _clients_loop, _in_flight
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        _clients.clear()
+        _in_flight = asyncio.Semaphore(LLM_MAX_IN_FLIGHT)
+        _clients_loop = loop
+
+
+def in_flight_slots() -> asyncio.Semaphore:
+    """Семафор LLM_MAX_IN_FLIGHT для текущего event loop"""
+    _bind_loop()
+    return _in_flight
+
+
+def get_client(api_key: str) -> AsyncOpenAI:
+    """Возвращает общий клиент для API ключа в текущем event loop"""
+    _bind_loop()
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(
+            base_url=LLM_BASE_URL,
+            api_key=api_key,
+            timeout=LLM_TIMEOUT,
+            # Повторы делаем сами, через пул ключей
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                ),
+            ),
+        )
+        _clients[api_key] = client
+    return client
 
 
-def _switch_to_next_key():
-    """Переключается на следующий API ключ"""
-    global current_key_index
-    current_key_index = (current_key_index + 1) % len(API_KEYS)
-    print(f"Switched to API key index: {current_key_index + 1}")
+async def close_clients():
+    """Закрывает пулы соединений при остановке приложения"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
 
 
 MODEL = os.getenv("MODEL")
+# Рассуждения модели в ответ диалога не попадают
+REASONING_EXCLUDED = {"reasoning": {"exclude": True}}
 
 
 def _extract_json_from_text(text: str) -> tuple[str, str | None]:
@@ -88,101 +114,299 @@ def _extract_json_from_text(text: str) -> tuple[str, str | None]:
     return cleaned_text, json_data
 
 
-def send_to_llm(user_id: str, user_message: str) -> Tuple[str, Optional[Dict]]:
-    add_message(user_id, "user", user_message)
+def _parse_llm_response(response: str) -> Tuple[str, Optional[Dict]]:
+    """Отделяет текст для пользователя от JSON блока с данными цели"""
+    response = response.lstrip()
+
+    # Извлекаем JSON и оставляем только текстовую часть для ответа пользователю
+    cleaned_response, json_data_str = _extract_json_from_text(response)
+
+    # Переменная для извлеченных JSON данных
+    extracted_data = None
+
+    # Если нашли JSON, пытаемся его распарсить
+    if json_data_str:
+        try:
+            extracted_data = json.loads(json_data_str)
+            print(f"Найден и распаршен JSON: {extracted_data}")
+        except json.JSONDecodeError as e:
+            print(f"Ошибка парсинга JSON: {e}")
+            extracted_data = None
 
-    messages = [m.model_dump() for m in get_conversation(user_id)]
+    # На фронт отправляем только очищенный текст
+    final_response = cleaned_response if cleaned_response else response
+    return final_response, extracted_data
 
-    max_retries = len(API_KEYS)
+
+def _check_retry(e: Exception, attempt: int, max_retries: int):
+    """
+    После rate limit ключ уже в cooldown у пула, следующая попытка
+    возьмет другой здоровый ключ. Остальные ошибки и исчерпание
+    попыток пробрасывает
+    """
+    if not is_rate_limit(e):
+        # Для других исключений просто пробрасываем
+        print(f"Non-rate-limit error: {e}")
+        raise e
+
+    print(f"Rate limit detected on attempt {attempt + 1}. Error: {e}")
+    if attempt >= max_retries - 1:
+        raise Exception(
+            f"All {max_retries} API keys exhausted "
+            f"with rate limits. Last error: {e}"
+        )
+
+
+async def complete(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    extra_body: Optional[Dict] = None,
+) -> Optional[str]:
+    """
+    Запрос к LLM с повтором на другом ключе после rate limit.
+    Общий для диалога и анализа портфеля
+    """
+    max_retries = max(len(key_pool.keys), 1)
 
     for attempt in range(max_retries):
         try:
-            client = _get_client()
-            completion = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                extra_body={
-                    "reasoning": {"exclude": True},
-                },
-            )
+            async with in_flight_slots(), key_pool.lease() as api_key:
+                completion = await get_client(api_key).chat.completions.create(
+                    model=model or MODEL,
+                    messages=messages,
+                    extra_body=extra_body,
+                )
+        except Exception as e:
+            _check_retry(e, attempt, max_retries)
+            continue
 
-            response = completion.choices[0].message.content
-            if not response:
-                return "", None
+        return completion.choices[0].message.content
 
-            if response.startswith('\n'):
-                response = response.lstrip('\n')
+    raise Exception(f"Failed after {max_retries} attempts")
 
-            response = response.lstrip()
 
-            # Извлекаем JSON и оставляем только текстовую часть для ответа пользователю
-            cleaned_response, json_data_str = _extract_json_from_text(response)
+def _rubles(value: float) -> str:
+    return f"{float(value):,.0f}".replace(",", " ") + " ₽"
 
-            # Переменная для извлеченных JSON данных
-            extracted_data = None
 
-            # Если нашли JSON, пытаемся его распарсить
-            if json_data_str:
-                try:
-                    extracted_data = json.loads(json_data_str)
-                    print(f"Найден и распаршен JSON: {extracted_data}")
-                except json.JSONDecodeError as e:
-                    print(f"Ошибка парсинга JSON: {e}")
-                    extracted_data = None
+def _goal_summary(goal: Dict) -> str:
+    return (
+        f"Записал вашу цель: {goal['reason']}, {_rubles(goal['sum'])} "
+        f"за {float(goal['term']):.0f} мес., "
+        f"стартовый капитал {_rubles(goal['capital'])}."
+    )
 
-            # На фронт отправляем только очищенный текст
-            final_response = cleaned_response if cleaned_response else response
 
-            add_message(user_id, "assistant", final_response)
+async def _try_local_goal(
+    user_id: str, user_message: str
+) -> Optional[Tuple[str, Dict]]:
+    """
+    Разбирает поля цели из сообщения без LLM и запоминает их в состоянии
+    диалога. Если вместе с ранее известными полями цель собрана целиком,
+    возвращает (ответ, поля цели) — модель не нужна. Иначе None: модель
+    получит уже известные поля в сжатом состоянии и спросит только
+    недостающие
+    """
+    fields = extract_goal_fields(user_message)
+    if not fields:
+        return None
+    goal = await chat_history.remember_goal(user_id, fields)
+    if not all(field in goal for field in chat_history.GOAL_FIELDS):
+        return None
 
-            # Возвращаем И текст, И JSON данные
-            return final_response, extracted_data
+    try:
+        response = _goal_summary(goal)
+    except (TypeError, ValueError):
+        # Поля от модели бывают строками, такой ответ пусть формирует она
+        return None
+    await add_message(user_id, "assistant", response)
+    return response, dict(goal)
 
-        except Exception as e:
-            # Универсальная обработка всех исключений
-            error_str = str(e).lower()
-
-            # Проверяем все возможные признаки rate limit
-            is_rate_limit = (
-                hasattr(e, 'status')
-                and e.status == 429  # Прямой статус 429
-                or '429' in error_str  # Код 429 в тексте ошибки
-                or 'rate limit' in error_str  # Упоминание rate limit
-                or 'ratelimit' in error_str  # Альтернативное написание
-                or 'too many requests' in error_str  # Другая формулировка
-                or 'exceeded' in error_str  # Общее указание на превышение
-            )
-
-            if is_rate_limit:
-                print(f"Rate limit detected on attempt {attempt + 1}. Error: {e}")
-                print("Switching API key...")
-
-                if attempt < max_retries - 1:
-                    _switch_to_next_key()
-                    sleep_time = 2 * (attempt + 1)
-                    print(f"Waiting {sleep_time} seconds before retry...")
-                    time.sleep(sleep_time)
-                    continue  # Продолжаем с следующей попытки
-                else:
-                    raise Exception(
-                        f"All {max_retries} API keys exhausted "
-                        f"with rate limits. Last error: {e}"
+
+async def _with_known_goal(
+    user_id: str, extracted_data: Optional[Dict]
+) -> Optional[Dict]:
+    """JSON блок модели, дополненный полями, которые уже разобраны локально"""
+    goal = await chat_history.remember_goal(user_id, extracted_data)
+    if extracted_data is None:
+        return None
+    merged = dict(extracted_data)
+    for field, value in goal.items():
+        if merged.get(field) is None or str(merged[field]).lower() == "false":
+            merged[field] = value
+    return merged
+
+
+async def send_to_llm(user_id: str, user_message: str) -> Tuple[str, Optional[Dict]]:
+    await add_message(user_id, "user", user_message)
+
+    local = await _try_local_goal(user_id, user_message)
+    if local is not None:
+        return local
+
+    # Окно последних реплик и сжатое состояние в пределах бюджета токенов
+    messages = await chat_history.build_prompt(user_id)
+
+    response = await response_cache.get(messages, MODEL)
+    if response is None:
+        response = await complete(messages, extra_body=REASONING_EXCLUDED)
+        await response_cache.put(messages, MODEL, response)
+
+    if not response:
+        return "", None
+
+    final_response, extracted_data = _parse_llm_response(response)
+
+    await add_message(user_id, "assistant", final_response)
+    extracted_data = await _with_known_goal(user_id, extracted_data)
+
+    # Возвращаем И текст, И JSON данные
+    return final_response, extracted_data
+
+
+async def _pump_completion(messages: List[Dict], queue: asyncio.Queue):
+    """
+    Читает потоковый ответ LLM в очередь: ("chunk", текст), в конце
+    ("end", None) или ("error", исключение). Слот in_flight_slots и ключ заняты,
+    пока идет ответ модели, а не пока клиент SSE забирает токены.
+    Повтор со сменой ключа возможен только до первого фрагмента
+    """
+    max_retries = max(len(key_pool.keys), 1)
+    try:
+        for attempt in range(max_retries):
+            started = False
+            try:
+                async with in_flight_slots(), key_pool.lease() as api_key:
+                    stream = await get_client(api_key).chat.completions.create(
+                        model=MODEL,
+                        messages=messages,
+                        stream=True,
+                        extra_body=REASONING_EXCLUDED,
                     )
-            else:
-                # Для других исключений просто пробрасываем
-                print(f"Non-rate-limit error: {e}")
-                raise e
+                    async for chunk in stream:
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        started = True
+                        queue.put_nowait(("chunk", chunk.choices[0].delta.content))
+            except Exception as e:
+                if started:
+                    raise
+                _check_retry(e, attempt, max_retries)
+                continue
+            break
+        else:
+            raise Exception(f"Failed after {max_retries} attempts")
+    except Exception as e:
+        queue.put_nowait(("error", e))
+        return
+    queue.put_nowait(("end", None))
 
-    raise Exception(f"Failed after {max_retries} attempts")
 
+class JsonBlockWithholder:
+    """
+    Пропускает текст ответа по мере генерации, но задерживает все, начиная
+    с первой '{': там может начинаться JSON блок цели, который пользователю
+    не показывается. По окончании разбирает ответ так же,
+    как _extract_json_from_text
+    """
 
-async def send_to_llm_async(user_id: str, user_message: str) -> Tuple[str, Optional[Dict]]:
+    def __init__(self):
+        self._parts: List[str] = []
+        self._emitted = 0
+        self._hold_from: Optional[int] = None
+        self._length = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> str:
+        """Добавляет фрагмент и возвращает текст, который можно отдать"""
+        if not self._parts:
+            # Как lstrip() в _parse_llm_response
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+        offset = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+
+        if self._hold_from is None:
+            brace = chunk.find("{")
+            if brace != -1:
+                self._hold_from = offset + brace
+
+        limit = self._length if self._hold_from is None else self._hold_from
+        if limit <= self._emitted:
+            return ""
+        text = self.text[self._emitted : limit]
+        self._emitted = limit
+        return text
+
+    def finish(self) -> str:
+        """Остаток ответа после JSON блока или задержанный текст без JSON"""
+        text = self.text
+        _, json_data = _extract_json_from_text(text)
+        if json_data:
+            return text[text.rfind("}") + 1 :].rstrip()
+        return text[self._emitted :]
+
+
+async def stream_llm(user_id: str, user_message: str) -> AsyncIterator[Tuple[str, Any]]:
     """
-    Async-friendly wrapper that runs the blocking OpenAI client in a thread
-    to avoid blocking the event loop while waiting for LLM responses.
+    Потоковый вариант send_to_llm. Отдает ("token", текст) по мере генерации,
+    последним событием ("done", (final_response, extracted_data)).
+    Ответ модели читает _pump_completion: медленный или ушедший клиент
+    не держит слот запроса и ключ API
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, send_to_llm, user_id, user_message)
+    await add_message(user_id, "user", user_message)
+
+    local = await _try_local_goal(user_id, user_message)
+    if local is not None:
+        yield "token", local[0]
+        yield "done", local
+        return
+
+    # Окно последних реплик и сжатое состояние в пределах бюджета токенов
+    messages = await chat_history.build_prompt(user_id)
+
+    cached = await response_cache.get(messages, MODEL)
+    withholder = JsonBlockWithholder()
+    if cached is not None:
+        text = withholder.feed(cached)
+        if text:
+            yield "token", text
+    else:
+        queue: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(_pump_completion(messages, queue))
+        try:
+            while True:
+                kind, payload = await queue.get()
+                if kind == "error":
+                    raise payload
+                if kind == "end":
+                    break
+                text = withholder.feed(payload)
+                if text:
+                    yield "token", text
+        finally:
+            pump.cancel()
+
+        await response_cache.put(messages, MODEL, withholder.text)
+
+    tail = withholder.finish()
+    if tail:
+        yield "token", tail
+
+    response = withholder.text
+    if not response:
+        yield "done", ("", None)
+        return
+
+    final_response, extracted_data = _parse_llm_response(response)
+    await add_message(user_id, "assistant", final_response)
+    extracted_data = await _with_known_goal(user_id, extracted_data)
+    yield "done", (final_response, extracted_data)
 
 
 def parse_llm_goal_response(llm_response: str):
@@ -216,23 +440,15 @@ def parse_llm_goal_response(llm_response: str):
         return None
 
 
-def _get_chat_key(user_id: str) -> str:
-    """Генерирует ключ для хранения истории чата"""
-    return f"user:{user_id}:chat_history"
-
-
-def add_message(user_id: str, role: str, content: str):
+async def add_message(user_id: str, role: str, content: str):
     """Добавляет сообщение в историю чата пользователя"""
     message = Message(role=role, content=content)
-    chat_key = _get_chat_key(user_id)
+    await chat_history.append_message(user_id, message.role, message.content)
 
-    cache.append_to_list(chat_key, message.model_dump())
 
-
-def get_conversation(user_id: str):
-    """Получает всю историю чата пользователя"""
-    chat_key = _get_chat_key(user_id)
-    messages_data = cache.get_list(chat_key)
+async def get_conversation(user_id: str):
+    """Получает хранимую историю чата пользователя"""
+    messages_data = await chat_history.get_messages(user_id)
 
     messages = []
     for msg_data in messages_data:
@@ -241,11 +457,6 @@ def get_conversation(user_id: str):
     return messages
 
 
-def clear_conversation(user_id: str):
+async def clear_conversation(user_id: str):
     """Очищает историю чата пользователя"""
-    chat_key = _get_chat_key(user_id)
-    if cache.enabled:
-        cache.client.delete(chat_key)
-    else:
-        if chat_key in cache._memory:
-            del cache._memory[chat_key]
+    await chat_history.clear(user_id)
@@ -1,9 +1,21 @@
 # services/moex_service.py
+import asyncio
 import datetime
-from typing import Dict, List, Tuple
+import os
+from typing import Dict, List, Optional, Tuple
 
+import aiohttp
 import numpy as np
-import requests
+
+from app.services import analytics_service as analytics
+
+ISS_BASE_URL = os.getenv("MOEX_ISS_URL", "https://iss.moex.com/iss")
+MOEX_MAX_CONCURRENCY = int(os.getenv("MOEX_MAX_CONCURRENCY", "8"))
+MOEX_REQUEST_TIMEOUT = float(os.getenv("MOEX_REQUEST_TIMEOUT", "10"))
+MOEX_MAX_RETRIES = int(os.getenv("MOEX_MAX_RETRIES", "3"))
+MOEX_RETRY_BACKOFF = float(os.getenv("MOEX_RETRY_BACKOFF", "0.5"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
 
 def safe_float_convert(value) -> float:
@@ -15,62 +27,176 @@ def safe_float_convert(value) -> float:
         return 0.0
 
 
-def find_nearest_trading_date(
+class MoexClient:
+    """Асинхронный клиент ISS MOEX с общим пулом соединений и повторами"""
+
+    def __init__(
+        self,
+        base_url: str = ISS_BASE_URL,
+        max_concurrency: int = MOEX_MAX_CONCURRENCY,
+        timeout: float = MOEX_REQUEST_TIMEOUT,
+        max_retries: int = MOEX_MAX_RETRIES,
+        retry_backoff: float = MOEX_RETRY_BACKOFF,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "MoexClient":
+        # Один коннектор на все тикеры: keep-alive и ограничение соединений к ISS
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency, limit_per_host=self.max_concurrency
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    async def get_json(self, path: str, params: Optional[Dict] = None) -> Dict:
+        """GET запрос к ISS с повторами и экспоненциальной задержкой"""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Семафор снаружи запроса: ожидание слота не съедает таймаут
+                async with self._semaphore:
+                    async with self.session.get(url, params=params) as response:
+                        if response.status in RETRYABLE_STATUSES:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info,
+                                response.history,
+                                status=response.status,
+                                message=response.reason or "",
+                            )
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRYABLE_STATUSES:
+                    raise
+                last_error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_backoff * (2**attempt))
+
+        raise last_error
+
+
+def get_engine_market(asset_type: str) -> Tuple[str, str]:
+    """Определить engine и market ISS по типу актива"""
+    if "облигация" in asset_type:
+        return "stock", "bonds"
+    return "stock", "shares"
+
+
+async def fetch_history_rows(
+    client: MoexClient,
+    ticker: str,
+    engine: str,
+    market: str,
+    params: Dict,
+) -> Tuple[List[str], List[list]]:
+    """Загрузить все страницы history, следуя курсору history.cursor"""
+    path = f"history/engines/{engine}/markets/{market}/securities/{ticker}.json"
+    columns: List[str] = []
+    rows: List[list] = []
+    start = 0
+
+    while True:
+        data = await client.get_json(path, params={**params, 'start': start})
+        history = data.get("history", {})
+        columns = history.get("columns", columns)
+        page = history.get("data", [])
+        rows.extend(page)
+
+        cursor = data.get("history.cursor", {}).get("data", [])
+        if not page or not cursor:
+            break
+        index, total, page_size = cursor[0][:3]
+        if index + page_size >= total:
+            break
+        start = index + page_size
+
+    return columns, rows
+
+
+def pick_nearest_trading_date(
+    prices: List[Tuple[datetime.date, float]], target_date: datetime.date
+) -> Optional[Tuple[float, datetime.date]]:
+    """
+    Выбрать торговый день, ближайший к целевой дате.
+    При равном смещении предпочитается более поздняя дата.
+    """
+    candidates = [(day, price) for day, price in prices if price > 0]
+    if not candidates:
+        return None
+
+    day, price = min(
+        candidates,
+        key=lambda item: (
+            abs((item[0] - target_date).days),
+            item[0] < target_date,
+        ),
+    )
+    return price, day
+
+
+def _log_nearest(
+    ticker: str, target_date: datetime.date, found: Tuple[float, datetime.date]
+):
+    open_price, current_date = found
+    days_diff = (current_date - target_date).days
+    if days_diff == 0:
+        print(f"[SUCCESS] {ticker}: точная цена на {current_date}: {open_price}")
+    else:
+        print(
+            f"[SUCCESS] {ticker}: цена на {current_date} "
+            f"(смещение {days_diff} дней): {open_price}"
+        )
+
+
+async def find_nearest_trading_date(
+    client: MoexClient,
     ticker: str,
     engine: str,
     market: str,
     target_date: datetime.date,
     days_range: int = 30,
 ) -> Tuple[float, datetime.date]:
-    """Найти ближайшую дату с торгами"""
-    for days_offset in range(0, days_range + 1):
-        # Пробуем даты в обе стороны от целевой
-        for direction in [0, 1, -1]:
-            if days_offset == 0 and direction != 0:
-                continue
-
-            current_date = target_date + datetime.timedelta(
-                days=direction * days_offset
-            )
-
-            # Пропускаем выходные для эффективности
-            if current_date.weekday() >= 5:
-                continue
+    """Найти ближайшую дату с торгами одним запросом окна from/till"""
+    params = {
+        'from': (target_date - datetime.timedelta(days=days_range)).isoformat(),
+        'till': (target_date + datetime.timedelta(days=days_range)).isoformat(),
+        'history.columns': 'TRADEDATE,OPEN',
+        'iss.meta': 'off',
+    }
 
-            url = (
-                f"https://iss.moex.com/iss/history/engines/{engine}/markets/"
-                f"{market}/securities/{ticker}.json"
+    try:
+        columns, rows = await fetch_history_rows(client, ticker, engine, market, params)
+        date_idx = columns.index("TRADEDATE")
+        open_idx = columns.index("OPEN")
+        prices = [
+            (
+                datetime.date.fromisoformat(row[date_idx]),
+                safe_float_convert(row[open_idx]),
             )
-            params = {
-                'from': current_date.strftime('%Y-%m-%d'),
-                'till': current_date.strftime('%Y-%m-%d'),
-                'history.columns': 'OPEN',
-                'iss.meta': 'off',
-            }
-
-            try:
-                response = requests.get(url, params=params, timeout=10)
-                data = response.json()
-                history_data = data.get("history", {}).get("data", [])
-
-                if history_data:
-                    open_price = safe_float_convert(history_data[0][0])
-                    if open_price > 0:
-                        days_diff = (current_date - target_date).days
-                        if days_diff == 0:
-                            print(
-                                f"[SUCCESS] {ticker}: точная цена на {current_date}: "
-                                f"{open_price}"
-                            )
-                        else:
-                            print(
-                                f"[SUCCESS] {ticker}: цена на {current_date} "
-                                f"(смещение {days_diff} дней): {open_price}"
-                            )
-                        return open_price, current_date
-
-            except Exception:
-                continue
+            for row in rows
+        ]
+        found = pick_nearest_trading_date(prices, target_date)
+        if found:
+            _log_nearest(ticker, target_date, found)
+            return found
+    except Exception as e:
+        print(f"[WARN] Ошибка получения истории {ticker} около {target_date}: {e}")
 
     print(
         f"[WARN] {ticker}: не найдено торгов в диапазоне ±{days_range} дней от "
@@ -79,201 +205,218 @@ def find_nearest_trading_date(
     return 0.0, target_date
 
 
-def fetch_all_prices_data(tickers: List[Tuple[str, str, str]]) -> Dict[str, Dict]:
-    """Получить ВСЕ данные с MOEX за один раз для всех активов"""
+class IssTradingDateResolver:
+    """Поиск ближайшего торгового дня через ISS"""
 
-    price_data = {}
-
-    for ticker, asset_type, asset_name in tickers:
-        print(f"[INFO] Получение данных для {asset_name} ({ticker}, {asset_type})")
-
-        # Определяем рынок
-        if (
-            asset_type == "акция"
-            or asset_type == "золото"
-            or asset_type == "недвижимость"
-        ):
-            engine = "stock"
-            market = "shares"
-        elif "облигация" in asset_type:
-            engine = "stock"
-            market = "bonds"
-        else:
-            engine = "stock"
-            market = "shares"
-
-        # 1. Текущая цена OPEN
-        current_price = 0.0
-        url_current = (
-            f"https://iss.moex.com/iss/engines/{engine}/markets/"
-            f"{market}/securities/{ticker}.json"
-        )
-        try:
-            response = requests.get(url_current, timeout=10)
-            data = response.json()
-            marketdata = data.get("marketdata", {})
-            data_rows = marketdata.get("data", [])
-            columns = marketdata.get("columns", [])
-
-            if data_rows and "OPEN" in columns:
-                open_idx = columns.index("OPEN")
-                for row in data_rows:
-                    price = row[open_idx]
-                    price_float = safe_float_convert(price)
-                    if price_float > 0:
-                        current_price = price_float
-                        break
-        except Exception as e:
-            print(f"[WARN] Ошибка получения текущей цены OPEN для {ticker}: {e}")
-
-        # 2. Историческая цена OPEN (3 года назад) - ИЩЕМ БЛИЖАЙШУЮ ДАТУ
-        historical_price = 0.0
-        historical_date = None
-
-        end_date = datetime.date.today()
-        target_date = end_date - datetime.timedelta(days=3 * 365)
-
-        historical_price, historical_date = find_nearest_trading_date(
-            ticker, engine, market, target_date, days_range=60
+    def __init__(self, client: MoexClient):
+        self.client = client
+
+    async def find(
+        self,
+        ticker: str,
+        engine: str,
+        market: str,
+        target_date: datetime.date,
+        days_range: int = 30,
+    ) -> Tuple[float, datetime.date]:
+        return await find_nearest_trading_date(
+            self.client, ticker, engine, market, target_date, days_range
         )
 
-        # 3. Исторические цены OPEN для волатильности
-        historical_prices = []
-        url_volatility = (
-            f"https://iss.moex.com/iss/history/engines/{engine}"
-            f"/markets/{market}/securities/{ticker}.json"
+
+async def fetch_current_price(
+    client: MoexClient, ticker: str, engine: str, market: str
+) -> float:
+    """Текущая цена OPEN из marketdata"""
+    try:
+        data = await client.get_json(
+            f"engines/{engine}/markets/{market}/securities/{ticker}.json"
         )
-        params_volatility = {'limit': 252, 'history.columns': 'OPEN', 'iss.meta': 'off'}
+        marketdata = data.get("marketdata", {})
+        data_rows = marketdata.get("data", [])
+        columns = marketdata.get("columns", [])
 
-        try:
-            response = requests.get(
-                url_volatility, params=params_volatility, timeout=10
-            )
-            data = response.json()
-            history_data = data.get("history", {}).get("data", [])
+        if data_rows and "OPEN" in columns:
+            open_idx = columns.index("OPEN")
+            for row in data_rows:
+                price_float = safe_float_convert(row[open_idx])
+                if price_float > 0:
+                    return price_float
+    except Exception as e:
+        print(f"[WARN] Ошибка получения текущей цены OPEN для {ticker}: {e}")
 
-            for row in history_data:
-                if len(row) > 0:
-                    price = safe_float_convert(row[0])
-                    if price > 0:
-                        historical_prices.append(price)
+    return 0.0
 
-            print(
-                f"[DEBUG] {ticker}: получено {len(historical_prices)} исторических цен"
-            )
 
-        except Exception as e:
-            print(
-                f"[WARN] Ошибка получения исторических цен для волатильности {ticker}: "
-                f"{e}"
-            )
+async def fetch_volatility_series(
+    client: MoexClient, ticker: str, engine: str, market: str
+) -> List[float]:
+    """Исторические цены OPEN для волатильности"""
+    historical_prices = []
+    params = {'limit': 252, 'history.columns': 'OPEN', 'iss.meta': 'off'}
 
-        price_data[ticker] = {
-            'name': asset_name,  # Человеко-читаемое название
-            'ticker': ticker,  # Тикер
-            'asset_type': asset_type,
-            'current_price': current_price,
-            'historical_price': historical_price,
-            'historical_date': historical_date,
-            'historical_prices_series': historical_prices,
-        }
+    try:
+        data = await client.get_json(
+            f"history/engines/{engine}/markets/{market}/securities/{ticker}.json",
+            params=params,
+        )
+        history_data = data.get("history", {}).get("data", [])
+
+        for row in history_data:
+            if len(row) > 0:
+                price = safe_float_convert(row[0])
+                if price > 0:
+                    historical_prices.append(price)
+
+        print(f"[DEBUG] {ticker}: получено {len(historical_prices)} исторических цен")
 
+    except Exception as e:
         print(
-            f"[SUMMARY] {asset_name} ({ticker}): current={current_price}, "
-            f"historical={historical_price}, prices_series={len(historical_prices)}"
+            f"[WARN] Ошибка получения исторических цен для волатильности {ticker}: "
+            f"{e}"
+        )
+
+    return historical_prices
+
+
+async def fetch_ticker_data(
+    client: MoexClient,
+    ticker: str,
+    asset_type: str,
+    asset_name: str,
+    resolver=None,
+) -> Dict:
+    """Получить текущую цену, историческую точку и ряд цен для одного тикера"""
+    print(f"[INFO] Получение данных для {asset_name} ({ticker}, {asset_type})")
+
+    engine, market = get_engine_market(asset_type)
+    resolver = resolver or IssTradingDateResolver(client)
+    target_date = datetime.date.today() - datetime.timedelta(days=3 * 365)
+
+    # Все три запроса тикера идут параллельно
+    current_price, (historical_price, historical_date), historical_prices = (
+        await asyncio.gather(
+            fetch_current_price(client, ticker, engine, market),
+            resolver.find(ticker, engine, market, target_date, days_range=60),
+            fetch_volatility_series(client, ticker, engine, market),
+        )
+    )
+
+    print(
+        f"[SUMMARY] {asset_name} ({ticker}): current={current_price}, "
+        f"historical={historical_price}, prices_series={len(historical_prices)}"
+    )
+
+    return {
+        'name': asset_name,  # Человеко-читаемое название
+        'ticker': ticker,  # Тикер
+        'asset_type': asset_type,
+        'current_price': current_price,
+        'historical_price': historical_price,
+        'historical_date': historical_date,
+        'historical_prices_series': historical_prices,
+    }
+
+
+async def fetch_all_prices_data_async(
+    tickers: List[Tuple[str, str, str]],
+    client: Optional[MoexClient] = None,
+    resolver=None,
+) -> Dict[str, Dict]:
+    """
+    Параллельно получить данные с MOEX для всех активов.
+    resolver — источник исторической точки (по умолчанию ISS).
+    """
+    if client is None:
+        async with MoexClient() as own_client:
+            return await fetch_all_prices_data_async(tickers, own_client, resolver)
+
+    results = await asyncio.gather(
+        *(
+            fetch_ticker_data(client, ticker, asset_type, asset_name, resolver)
+            for ticker, asset_type, asset_name in tickers
         )
+    )
+    return {data['ticker']: data for data in results}
 
-    return price_data
+
+def fetch_all_prices_data(tickers: List[Tuple[str, str, str]]) -> Dict[str, Dict]:
+    """Получить ВСЕ данные с MOEX за один раз для всех активов"""
+    return asyncio.run(fetch_all_prices_data_async(tickers))
 
 
 def calculate_yield_and_volatility(price_data: Dict[str, Dict]) -> Dict[str, Dict]:
     """Рассчитать доходность и волатильность для всех активов"""
 
+    tickers = list(price_data)
+    if not tickers:
+        return {}
+
+    # Доходность и волатильность всех активов считаются одним векторным проходом
+    end_date = datetime.date.today()
+    years = np.array(
+        [
+            (
+                (end_date - price_data[t]['historical_date']).days / 365.25
+                if price_data[t]['historical_date']
+                else 0.0
+            )
+            for t in tickers
+        ]
+    )
+    yields = analytics.cagr(
+        np.array([price_data[t]['historical_price'] for t in tickers]),
+        np.array([price_data[t]['current_price'] for t in tickers]),
+        years,
+    )
+    returns = analytics.log_returns(
+        analytics.stack_series(
+            [price_data[t]['historical_prices_series'] for t in tickers]
+        )
+    )
+    volatilities = analytics.annualised_volatility(returns)
+    return_counts = np.sum(~np.isnan(returns), axis=1)
+
     results = {}
 
-    for ticker, data in price_data.items():
+    for i, ticker in enumerate(tickers):
+        data = price_data[ticker]
         asset_name = data['name']
         asset_type = data['asset_type']
-        current_price = data['current_price']
-        historical_price = data['historical_price']
-        historical_date = data['historical_date']
-        prices_series = data['historical_prices_series']
 
         # Расчет доходности
-        yield_value = 0.0
-        if historical_price > 0 and current_price > 0:
-            # Точный расчет с учетом реального количества лет
-            end_date = datetime.date.today()
-            days_diff = (end_date - historical_date).days
-            years_diff = max(days_diff / 365.25, 0.1)  # Минимум 0.1 года
-
-            yield_value = (current_price / historical_price) ** (1 / years_diff) - 1
+        if np.isnan(yields[i]):
+            yield_value = get_fallback_yield(asset_type)
             print(
-                f"[CALC] {asset_name}: доходность = {yield_value:.4f} "
-                f"за {years_diff:.2f} лет"
+                f"[FALLBACK] {asset_name}: доходность по умолчанию = {yield_value:.4f}"
             )
         else:
-            # Fallback по типу актива
-            if "облигация" in asset_type:
-                if "краткосроч" in asset_type:
-                    yield_value = 0.08
-                elif "среднесроч" in asset_type:
-                    yield_value = 0.09
-                elif "долгосроч" in asset_type:
-                    yield_value = 0.10
-                else:
-                    yield_value = 0.085
-            elif asset_type == "акция":
-                yield_value = 0.12
-            elif asset_type == "золото":
-                yield_value = 0.06
-            elif asset_type == "недвижимость":
-                yield_value = 0.07
-            else:
-                yield_value = 0.08
+            yield_value = float(yields[i])
             print(
-                f"[FALLBACK] {asset_name}: доходность по умолчанию = {yield_value:.4f}"
+                f"[CALC] {asset_name}: доходность = {yield_value:.4f} "
+                f"за {max(years[i], 0.1):.2f} лет"
             )
 
         # Расчет волатильности
-        volatility = 0.0
-        if len(prices_series) >= 2:
-            try:
-                returns = []
-                for i in range(1, len(prices_series)):
-                    if prices_series[i - 1] > 0 and prices_series[i] > 0:
-                        log_return = np.log(prices_series[i] / prices_series[i - 1])
-                        returns.append(log_return)
-
-                if len(returns) >= 2:
-                    daily_volatility = np.std(returns)
-                    volatility = float(daily_volatility * np.sqrt(252))
-                    print(
-                        f"[CALC] {asset_name}: волатильность = {volatility:.4f} "
-                        f"(на основе {len(returns)} доходностей)"
-                    )
-                else:
-                    volatility = get_fallback_volatility(asset_type)
-                    print(
-                        f"[FALLBACK] {asset_name}: волатильность по умолчанию = "
-                        f"{volatility:.4f}"
-                    )
-            except Exception as e:
-                print(f"[ERROR] {asset_name}: ошибка расчета волатильности: {e}")
-                volatility = get_fallback_volatility(asset_type)
-        else:
+        if np.isnan(volatilities[i]):
             volatility = get_fallback_volatility(asset_type)
             print(
                 f"[FALLBACK] {asset_name}: недостаточно данных для волатильности, "
                 f"используется значение по умолчанию: {volatility:.4f}"
             )
+        else:
+            volatility = float(volatilities[i])
+            print(
+                f"[CALC] {asset_name}: волатильность = {volatility:.4f} "
+                f"(на основе {return_counts[i]} доходностей)"
+            )
 
         results[ticker] = {
             'name': asset_name,  # Человеко-читаемое название
             'ticker': ticker,  # Тикер
             'type': asset_type,
-            'price_old': float(historical_price),
-            'price_now': float(current_price),
+            'price_old': float(data['historical_price']),
+            'price_now': float(data['current_price']),
             'yield_value': float(yield_value),
             'volatility': float(volatility),
         }
@@ -281,6 +424,26 @@ def calculate_yield_and_volatility(price_data: Dict[str, Dict]) -> Dict[str, Dic
     return results
 
 
+def get_fallback_yield(asset_type: str) -> float:
+    """Получить fallback значение доходности по типу актива"""
+    if "облигация" in asset_type:
+        if "краткосроч" in asset_type:
+            return 0.08
+        elif "среднесроч" in asset_type:
+            return 0.09
+        elif "долгосроч" in asset_type:
+            return 0.10
+        return 0.085
+    elif asset_type == "акция":
+        return 0.12
+    elif asset_type == "золото":
+        return 0.06
+    elif asset_type == "недвижимость":
+        return 0.07
+    else:
+        return 0.08
+
+
 def get_fallback_volatility(asset_type: str) -> float:
     """Получить fallback значение волатильности по типу актива"""
     if "облигация" in asset_type:
@@ -295,16 +458,25 @@ def get_fallback_volatility(asset_type: str) -> float:
         return 0.15
 
 
-def fetch_asset_data_batch(tickers: List[Tuple[str, str, str]]) -> List[Dict]:
+async def fetch_asset_data_batch_async(
+    tickers: List[Tuple[str, str, str]],
+    client: Optional[MoexClient] = None,
+    resolver=None,
+) -> List[Dict]:
     """Основная функция: получить все данные и рассчитать показатели"""
 
     print(f"[BATCH] Начало получения данных для {len(tickers)} активов")
 
     # 1. Получить все данные с MOEX
-    price_data = fetch_all_prices_data(tickers)
+    price_data = await fetch_all_prices_data_async(tickers, client, resolver)
 
     # 2. Рассчитать все показатели
     results = calculate_yield_and_volatility(price_data)
 
     # 3. Вернуть в формате для репозитория
     return list(results.values())
+
+
+def fetch_asset_data_batch(tickers: List[Tuple[str, str, str]]) -> List[Dict]:
+    """Синхронная обертка для вызова вне event loop"""
+    return asyncio.run(fetch_asset_data_batch_async(tickers))
@@ -0,0 +1,130 @@
+"""
+Компактное представление портфеля для промпта анализа.
+
+Вместо JSON ответа convert_db_to_response модель получает текст:
+- ключевые параметры цели одной строкой на тему;
+- состав портфеля и активы таблицами с разделителем «|», заголовок
+  таблицы пишется один раз, а не ключами в каждом объекте;
+- каждый актив один раз, даже если он встречается в нескольких классах;
+- суммы округлены до рубля, доли и доходности — до 0.1%;
+- план — только заголовки шагов и действия, без описаний, которые
+  повторяют уже приведенные числа; покупки из generate_step_by_step_plan
+  («Купить 91 шт. SBER (Сбербанк) по 312 ₽ за 28438 ₽») сокращены
+  до «SBER×91»: название, цена и сумма есть в таблице активов.
+
+Производные величины (сумма актива = количество × цена, месячная ставка,
+коэффициент аннуитета) не передаются.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Покупка в действиях плана; цена и сумма выводятся из таблицы активов
+PURCHASE_RE = re.compile(
+    r"Купить (\d+) шт\. (\S+)(?: \([^)]*\))?(?: по \d+ ₽)? за \d+ ₽"
+)
+
+MONEY_FIELDS = (
+    ("target_amount", "сумма цели"),
+    ("future_value_with_inflation", "с инфляцией"),
+    ("initial_capital", "капитал"),
+)
+
+
+def _money(value: Optional[float]) -> str:
+    return "-" if value is None else str(round(value))
+
+
+def _pct(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return _trim(round(value * 100, 1))
+
+
+def _price(value: float) -> str:
+    return _money(value) if abs(value) >= 100 else _trim(round(value, 2))
+
+
+def _trim(value: float) -> str:
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _cell(text) -> str:
+    if text is None:
+        return "-"
+    return str(text).replace("|", "/").replace("\n", " ")
+
+
+def encode_portfolio(portfolio: Dict) -> str:
+    """
+    Текст промпта из jsonable_encoder(convert_db_to_response(...)).
+    Поля analysis и updated_at, если они есть, не используются
+    """
+    recommendation = portfolio.get("recommendation") or {}
+    lines: List[str] = ["Портфель. Суммы в ₽, доли и доходности в %."]
+
+    if recommendation.get("smart_goal"):
+        lines.append(f"Цель: {_cell(recommendation['smart_goal'])}")
+
+    header = [
+        f"{label} {_money(portfolio.get(field))}" for field, label in MONEY_FIELDS
+    ]
+    header.append(f"срок {portfolio.get('investment_term_months')} мес.")
+    header.append(f"инфляция {_pct(portfolio.get('annual_inflation_rate'))}/год")
+    lines.append(" | ".join(header))
+
+    if recommendation:
+        lines.append(
+            f"риск-профиль {_cell(recommendation.get('risk_profile'))} | "
+            f"горизонт {_cell(recommendation.get('time_horizon'))} | "
+            "ожидаемая доходность "
+            f"{_pct(recommendation.get('expected_portfolio_return'))} | "
+            f"вложено {_money(recommendation.get('total_investment'))}"
+        )
+        payment = recommendation.get("monthly_payment_detail") or {}
+        if payment:
+            lines.append(
+                f"взнос в месяц {_money(payment.get('monthly_payment'))} | "
+                f"капитал к концу срока {_money(payment.get('future_capital'))}"
+            )
+
+    composition = recommendation.get("composition") or []
+    seen = set()
+    if composition:
+        lines.append("Состав: класс|цель|факт|сумма")
+        asset_rows = []
+        for comp in composition:
+            lines.append(
+                f"{_cell(comp['asset_type'])}|{_pct(comp['target_weight'])}|"
+                f"{_pct(comp['actual_weight'])}|{_money(comp['amount'])}"
+            )
+            for asset in comp.get("assets") or []:
+                if asset["ticker"] in seen:
+                    continue
+                seen.add(asset["ticker"])
+                asset_rows.append(
+                    f"{asset['ticker']}|{_cell(comp['asset_type'])}|"
+                    f"{_cell(asset['name'])}|"
+                    f"{asset['quantity']}|{_price(asset['price'])}|"
+                    f"{_pct(asset['weight'])}|{_pct(asset.get('expected_return'))}"
+                )
+        if asset_rows:
+            lines.append("Активы: тикер|класс|название|шт|цена|вес в классе|доходность")
+            lines.extend(asset_rows)
+
+    plan = recommendation.get("step_by_step_plan") or {}
+    if plan.get("steps"):
+        lines.append("План:")
+        for step in plan["steps"]:
+            actions = [_compact_action(action) for action in step.get("actions") or []]
+            lines.append(
+                f"{step['step_number']}. {_cell(step['title'])}: " + "; ".join(actions)
+            )
+
+    return "\n".join(lines)
+
+
+def _compact_action(action: str) -> str:
+    action = PURCHASE_RE.sub(lambda m: f"{m.group(2)}×{m.group(1)}", action)
+    return _cell(action.replace(" + ", ", "))
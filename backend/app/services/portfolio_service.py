@@ -3,15 +3,8 @@ from typing import Dict, List
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.redis_cache import cache
-from app.models.asset import Asset
-from app.models.portfolio import AssetAllocation as AssetAllocationModel
-from app.models.portfolio import MonthlyPayment
-from app.models.portfolio import PlanStep as PlanStepModel
+from app.core.redis_cache import async_cache
 from app.models.portfolio import Portfolio
-from app.models.portfolio import PortfolioComposition as PortfolioCompositionModel
-from app.models.portfolio import StepAction as StepActionModel
-from app.models.portfolio import StepByStepPlan as StepByStepPlanModel
 from app.repositories.asset_repository import AssetRepository
 from app.repositories.inflation_repository import InflationRepository
 from app.repositories.portfolio_repository import PortfolioRepository
@@ -25,6 +18,7 @@ from app.schemas.portfolio import (
     PortfolioSummary,
     StepByStepPlan,
 )
+from app.services.asset_universe import asset_universe
 
 
 class PortfolioService:
@@ -187,7 +181,8 @@ class PortfolioService:
     ) -> List[AssetAllocationSchema]:  # ← Используйте Schema
         """Подбор акций по риск-профилю"""
 
-        all_stocks = await self.asset_repo.get_assets_by_type(self.db_session, 'акция')
+        universe = await asset_universe.get(self.db_session)
+        all_stocks = universe.by_type('акция')
 
         strategies = {
             'conservative': ['SBER', 'GAZP', 'LKOH'],
@@ -246,20 +241,20 @@ class PortfolioService:
     ) -> List[AssetAllocationSchema]:  # ← Используйте Schema
         """Подбор облигаций по сроку инвестирования"""
 
-        all_bonds = await self.asset_repo.get_assets_by_type(
-            self.db_session, 'облигация'
-        )
+        universe = await asset_universe.get(self.db_session)
 
-        if not all_bonds:
+        if not universe.by_type('облигация'):
             return []
 
+        short_term = universe.by_tenor('краткосрочная')
+        medium_term = universe.by_tenor('среднесрочная')
+        long_term = universe.by_tenor('долгосрочная')
+
         if term_years <= 1:
-            selected_bonds = [b for b in all_bonds if 'краткосрочная' in b.type]
+            selected_bonds = short_term
 
             weights = [0.6, 0.4] if len(selected_bonds) >= 2 else [1.0]
         elif term_years <= 5:
-            short_term = [b for b in all_bonds if 'краткосрочная' in b.type]
-            medium_term = [b for b in all_bonds if 'среднесрочная' in b.type]
             selected_bonds = (short_term[:1] + medium_term[:2])[:3]
 
             weights = (
@@ -268,9 +263,6 @@ class PortfolioService:
                 else [1.0 / len(selected_bonds)] * len(selected_bonds)
             )
         else:
-            short_term = [b for b in all_bonds if 'краткосрочная' in b.type]
-            medium_term = [b for b in all_bonds if 'среднесрочная' in b.type]
-            long_term = [b for b in all_bonds if 'долгосрочная' in b.type]
             selected_bonds = (short_term[:1] + medium_term[:1] + long_term[:1])[:3]
 
             weights = (
@@ -314,9 +306,8 @@ class PortfolioService:
     ) -> List[AssetAllocationSchema]:  # ← Используйте Schema
         """Подбор ETF активов (золото, недвижимость)"""
 
-        etf_assets = await self.asset_repo.get_assets_by_type(
-            self.db_session, asset_type
-        )
+        universe = await asset_universe.get(self.db_session)
+        etf_assets = universe.by_type(asset_type)
 
         if not etf_assets or budget <= 0:
             return []
@@ -473,8 +464,10 @@ class PortfolioService:
     async def calculate_portfolio(self, user_id: str) -> PortfolioCalculationResponse:
         """Основной метод расчета полного инвестиционного плана"""
 
-        goal_data = cache.get_json(f"user:{user_id}:llm_goal")
-        profile = cache.get_json(f"user:{user_id}:risk_result")
+        # Цель и риск-профиль одним MGET
+        goal_data, profile = await async_cache.get_many_json(
+            [f"user:{user_id}:llm_goal", f"user:{user_id}:risk_result"]
+        )
         if not goal_data:
             raise ValueError(
                 "Данные цели не найдены. Сначала определите цель через диалог."
@@ -517,9 +510,7 @@ class PortfolioService:
             portfolio_dict['updated_at'] = portfolio_dict['updated_at'].isoformat()
 
         portfolio_key = f"user:{user_id}:portfolio"
-        cache.set_json(
-            portfolio_key, portfolio_dict, expire=360000
-        )  # ← Теперь без ошибки
+        await async_cache.set_json(portfolio_key, portfolio_dict, expire=360000)
 
         return portfolio_response
 
@@ -530,122 +521,9 @@ class PortfolioService:
         portfolio_name: str = "Основной портфель",
     ) -> Portfolio:
         """Создание портфеля в базе данных с пошаговым планом"""
-        from sqlalchemy import select
-
-        # Создаем основной объект портфеля
-        portfolio = Portfolio(
-            user_id=user_id,
-            portfolio_name=portfolio_name,
-            target_amount=portfolio_data.target_amount,
-            initial_capital=portfolio_data.initial_capital,
-            investment_term_months=portfolio_data.investment_term_months,
-            annual_inflation_rate=portfolio_data.annual_inflation_rate,
-            future_value_with_inflation=portfolio_data.future_value_with_inflation,
-            risk_profile=portfolio_data.recommendation.risk_profile,
-            time_horizon=portfolio_data.recommendation.time_horizon,
-            smart_goal=portfolio_data.recommendation.smart_goal,
-            total_investment=portfolio_data.recommendation.total_investment,
-            expected_portfolio_return=(
-                portfolio_data.recommendation.expected_portfolio_return
-            ),
-        )
-
-        self.db_session.add(portfolio)
-        await self.db_session.flush()
-
-        # Создаем monthly_payment
-        monthly_payment = MonthlyPayment(
-            portfolio_id=portfolio.id,
-            monthly_payment=(
-                portfolio_data.recommendation.monthly_payment_detail.monthly_payment
-            ),
-            future_capital=(
-                portfolio_data.recommendation.monthly_payment_detail.future_capital
-            ),
-            total_months=(
-                portfolio_data.recommendation.monthly_payment_detail.total_months
-            ),
-            monthly_rate=(
-                portfolio_data.recommendation.monthly_payment_detail.monthly_rate
-            ),
-            annuity_factor=(
-                portfolio_data.recommendation.monthly_payment_detail.annuity_factor
-            ),
+        return await self.portfolio_repo.create_portfolio(
+            portfolio_data, user_id, portfolio_name
         )
-        self.db_session.add(monthly_payment)
-
-        # Создаем композиции портфеля
-        for comp in portfolio_data.recommendation.composition:
-            portfolio_composition = PortfolioCompositionModel(
-                portfolio_id=portfolio.id,
-                asset_type=comp.asset_type,
-                target_weight=comp.target_weight,
-                actual_weight=comp.actual_weight,
-                amount=comp.amount,
-            )
-            self.db_session.add(portfolio_composition)
-            await self.db_session.flush()
-
-            # Добавляем распределения активов
-            for asset_alloc in comp.assets:
-                # АСИНХРОННЫЙ ЗАПРОС вместо query
-                stmt = select(Asset).where(Asset.ticker == asset_alloc.ticker)
-                result = await self.db_session.execute(stmt)
-                asset = result.scalar_one_or_none()
-
-                if asset:
-                    asset_allocation = AssetAllocationModel(  # ← Используйте Model
-                        portfolio_composition_id=portfolio_composition.id,
-                        asset_id=asset.id,
-                        quantity=asset_alloc.quantity,
-                        target_weight=asset_alloc.weight,
-                        purchase_price=asset_alloc.price,
-                    )
-                    self.db_session.add(asset_allocation)
-
-        # Создаем пошаговый план, если он есть в данных
-        if (
-            portfolio_data.recommendation.step_by_step_plan
-            and portfolio_data.recommendation.step_by_step_plan.steps
-        ):
-
-            try:
-                generated_at = datetime.fromisoformat(
-                    portfolio_data.recommendation.step_by_step_plan.generated_at
-                )
-            except (ValueError, AttributeError):
-                generated_at = datetime.now()
-
-            step_plan = StepByStepPlanModel(  # ← Используйте Model
-                portfolio_id=portfolio.id,
-                generated_at=generated_at,
-                total_steps=len(portfolio_data.recommendation.step_by_step_plan.steps),
-            )
-            self.db_session.add(step_plan)
-            await self.db_session.flush()
-
-            # Добавляем шаги плана
-            for step_data in portfolio_data.recommendation.step_by_step_plan.steps:
-                plan_step = PlanStepModel(  # ← Используйте Model
-                    step_by_step_plan_id=step_plan.id,
-                    step_number=step_data.step_number,
-                    title=step_data.title,
-                    description=step_data.description,
-                )
-                self.db_session.add(plan_step)
-                await self.db_session.flush()
-
-                # Добавляем действия для шага
-                for action_order, action_text in enumerate(step_data.actions, 1):
-                    step_action = StepActionModel(  # ← Используйте Model
-                        plan_step_id=plan_step.id,
-                        action_text=action_text,
-                        action_order=action_order,
-                    )
-                    self.db_session.add(step_action)
-
-        await self.db_session.commit()
-        return portfolio
 
     async def get_user_portfolios_from_db(self, user_id: int) -> list:
         """Получение всех портфелей пользователя из БД"""
@@ -0,0 +1,195 @@
+# services/price_history_service.py
+import asyncio
+import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repositories.asset_repository import AssetRepository
+from app.repositories.price_history_repository import PriceHistoryRepository
+from app.services.moex_service import (
+    MoexClient,
+    calculate_yield_and_volatility,
+    fetch_all_prices_data_async,
+    fetch_history_rows,
+    get_engine_market,
+    pick_nearest_trading_date,
+    safe_float_convert,
+)
+
+HISTORY_COLUMNS = ["TRADEDATE", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
+HISTORICAL_POINT_DAYS = 3 * 365
+HISTORICAL_POINT_RANGE = 60
+# Первичная загрузка: 3 года для доходности + запас на поиск торгового дня
+BACKFILL_DAYS = HISTORICAL_POINT_DAYS + HISTORICAL_POINT_RANGE
+VOLATILITY_WINDOW = 252
+
+
+def parse_history_rows(
+    columns: List[str], rows: List[list], asset_id: int
+) -> List[Dict]:
+    """Свести строки ISS к одной свече OHLCV на дату"""
+    idx = {name: columns.index(name) for name in HISTORY_COLUMNS}
+    candles: Dict[datetime.date, Dict] = {}
+
+    for row in rows:
+        open_price = safe_float_convert(row[idx["OPEN"]])
+        if open_price <= 0:
+            continue
+
+        day = datetime.date.fromisoformat(row[idx["TRADEDATE"]])
+        volume = int(safe_float_convert(row[idx["VOLUME"]]))
+
+        # Несколько режимов торгов за день — оставляем самый ликвидный
+        existing = candles.get(day)
+        if existing and existing["volume"] >= volume:
+            continue
+
+        candles[day] = {
+            "asset_id": asset_id,
+            "date": day,
+            "open_price": open_price,
+            "high_price": safe_float_convert(row[idx["HIGH"]]),
+            "low_price": safe_float_convert(row[idx["LOW"]]),
+            "close_price": safe_float_convert(row[idx["CLOSE"]]),
+            "volume": volume,
+        }
+
+    return [candles[day] for day in sorted(candles)]
+
+
+async def fetch_price_history_delta(
+    client: MoexClient,
+    ticker: str,
+    asset_type: str,
+    asset_id: int,
+    since: datetime.date,
+) -> List[Dict]:
+    """Свечи тикера начиная с since (все страницы курсора ISS)"""
+    engine, market = get_engine_market(asset_type)
+    params = {
+        'from': since.isoformat(),
+        'history.columns': ",".join(HISTORY_COLUMNS),
+        'iss.meta': 'off',
+    }
+
+    # Ошибка одного тикера (сеть или неожиданные колонки ISS)
+    # не должна прерывать общий gather синхронизации
+    try:
+        columns, rows = await fetch_history_rows(client, ticker, engine, market, params)
+        candles = parse_history_rows(columns, rows, asset_id)
+    except Exception as e:
+        print(f"[WARN] Ошибка синхронизации истории {ticker}: {e}")
+        return []
+
+    print(f"[SYNC] {ticker}: получено {len(candles)} свечей с {since}")
+    return candles
+
+
+async def sync_price_history(
+    client: MoexClient,
+    session: AsyncSession,
+    tickers: List[Tuple[str, str, str]],
+    asset_ids: Dict[str, int],
+) -> int:
+    """
+    Инкрементальная синхронизация price_history.
+    Первый запуск загружает историю за BACKFILL_DAYS, далее запрашиваются
+    только дни после последней сохраненной даты каждого актива.
+    """
+    repo = PriceHistoryRepository()
+    last_dates = await repo.get_last_dates(session, list(asset_ids.values()))
+    backfill_from = datetime.date.today() - datetime.timedelta(days=BACKFILL_DAYS)
+
+    def since(ticker: str) -> datetime.date:
+        last_date = last_dates.get(asset_ids[ticker])
+        if last_date is None:
+            return backfill_from
+        return last_date + datetime.timedelta(days=1)
+
+    deltas = await asyncio.gather(
+        *(
+            fetch_price_history_delta(
+                client, ticker, asset_type, asset_ids[ticker], since(ticker)
+            )
+            for ticker, asset_type, _ in tickers
+        )
+    )
+
+    rows = [row for delta in deltas for row in delta]
+    if rows:
+        await repo.upsert_many(session, rows)
+    return len(rows)
+
+
+async def load_price_data_from_history(
+    session: AsyncSession,
+    tickers: List[Tuple[str, str, str]],
+    asset_ids: Dict[str, int],
+) -> Dict[str, Dict]:
+    """Собрать входные данные calculate_yield_and_volatility из price_history"""
+    repo = PriceHistoryRepository()
+    target_date = datetime.date.today() - datetime.timedelta(days=HISTORICAL_POINT_DAYS)
+    series = await repo.get_open_series(
+        session,
+        [asset_ids[ticker] for ticker, _, _ in tickers],
+        target_date - datetime.timedelta(days=HISTORICAL_POINT_RANGE),
+    )
+
+    price_data = {}
+    for ticker, asset_type, asset_name in tickers:
+        prices = series.get(asset_ids[ticker], [])
+
+        around_target = [
+            (day, price)
+            for day, price in prices
+            if abs((day - target_date).days) <= HISTORICAL_POINT_RANGE
+        ]
+        historical_price, historical_date = pick_nearest_trading_date(
+            around_target, target_date
+        ) or (0.0, target_date)
+
+        price_data[ticker] = {
+            'name': asset_name,
+            'ticker': ticker,
+            'asset_type': asset_type,
+            'current_price': prices[-1][1] if prices else 0.0,
+            'historical_price': historical_price,
+            'historical_date': historical_date,
+            'historical_prices_series': [
+                price for _, price in prices[-VOLATILITY_WINDOW:] if price > 0
+            ],
+        }
+
+    return price_data
+
+
+async def fetch_asset_data_incremental(
+    client: MoexClient,
+    session: AsyncSession,
+    tickers: List[Tuple[str, str, str]],
+) -> List[Dict]:
+    """
+    Обновить показатели активов через локальную историю цен.
+    Для активов, которых еще нет в таблице assets, данные берутся напрямую
+    из ISS; их история будет загружена при следующем запуске.
+    """
+    known_assets = await AssetRepository().get_assets_by_tickers(
+        session, [ticker for ticker, _, _ in tickers]
+    )
+    asset_ids = {asset.ticker: asset.id for asset in known_assets}
+
+    stored = [item for item in tickers if item[0] in asset_ids]
+    new = [item for item in tickers if item[0] not in asset_ids]
+
+    price_data = {}
+    if stored:
+        synced = await sync_price_history(client, session, stored, asset_ids)
+        print(f"[SYNC] Сохранено {synced} свечей для {len(stored)} активов")
+        price_data.update(
+            await load_price_data_from_history(session, stored, asset_ids)
+        )
+    if new:
+        price_data.update(await fetch_all_prices_data_async(new, client))
+
+    return list(calculate_yield_and_volatility(price_data).values())
@@ -0,0 +1,300 @@
+"""
+Скомпилированный расчет риск-профиля.
+
+Анкета кодируется вектором малых целых: по столбцу на вопрос 1–11 и на
+факторы из цели (горизонт, размер капитала), 0 — нет ответа, 1–3 —
+варианты A–C. Баллы и ограничения описаны таблицами ниже, условия
+противоречий и эффекты уточнений берутся из правил contradiction_rules.
+При импорте условия сводятся в один массив TABLE[столбец, вариант]:
+строка содержит вклад ответа в баллы трех профилей и в счетчики
+условий. Расчет — сумма строк по столбцам, без разбора строк и словарей.
+Для одной анкеты (запрос API) накладные расходы numpy больше самого
+расчета, поэтому строка там упакована в целое по 8 бит на поле и
+анкета считается одной суммой 13 чисел.
+
+score_batch считает сразу матрицу анкет (n × N_COLUMNS), например для
+проверки изменений анкеты на истории ответов: ProfileEngine с другими
+таблицами компилируется так же, как основной.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas.risk_profile import RiskProfileResult
+from app.services.contradiction_rules import CONTRADICTION_RULES, rule_options
+
+OPTIONS = ("A", "B", "C")
+OPTION_CODES = {option: code for code, option in enumerate(OPTIONS, start=1)}
+# Ответ разбирается по первой букве в любом регистре
+_LETTER_CODES = {
+    **OPTION_CODES,
+    **{option.lower(): code for option, code in OPTION_CODES.items()},
+}
+
+QUESTION_COUNT = 11
+FACTOR_COLUMNS = {"horizon": QUESTION_COUNT, "capital_size": QUESTION_COUNT + 1}
+N_COLUMNS = QUESTION_COUNT + len(FACTOR_COLUMNS)
+
+PROFILES = ("Консервативный", "Умеренный", "Агрессивный")
+CONSERVATIVE, MODERATE, AGGRESSIVE = range(3)
+HORIZONS = (None, "До 3 лет", "3–7 лет", "Более 7 лет")
+
+# Вклад ответа в баллы: вопрос → вариант → (профиль, баллы)
+SCORING: Dict[int, Dict[str, Tuple[int, int]]] = {
+    # Блок 1 – Опыт и вовлечённость
+    1: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    2: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    3: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    # Блок 2 – Финансовое положение
+    4: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    5: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    # Блок 3 – Отношение к риску
+    6: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    7: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    8: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    # Блок 4 – Эмоциональная устойчивость
+    9: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    10: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+    11: {"A": (CONSERVATIVE, 2), "B": (MODERATE, 1), "C": (AGGRESSIVE, 3)},
+}
+
+# Ограничения применяются по порядку, когда выполнены все условия:
+# "cap_aggressive" — агрессивный балл не выше умеренного,
+# "conservative" — остаются только консервативные баллы, не меньше 8
+RESTRICTIONS: List[Tuple[Dict, str]] = [
+    ({1: "A"}, "cap_aggressive"),  # Нет опыта → максимум умеренный
+    ({6: "A"}, "conservative"),  # Просадка ≤ -10% → консервативный
+    ({9: "A", 7: "A"}, "conservative"),  # Страх потерь → консервативный
+]
+FORCED_CONSERVATIVE_SCORE = 8
+
+# Ширина поля упакованной строки: баллы и счетчики меньше 256
+PACKED_FIELD_BITS = 8
+PACKED_FIELD_MASK = (1 << PACKED_FIELD_BITS) - 1
+
+# Пороги профиля по баллам после ограничений
+AGGRESSIVE_THRESHOLD = 15
+CONSERVATIVE_THRESHOLD = 12
+
+# Условия противоречий и эффекты уточнений — из правил contradiction_rules
+CONTRADICTIONS: List[Tuple[str, Dict]] = [
+    (rule["code"], rule["when"]) for rule in CONTRADICTION_RULES if rule.get("when")
+]
+# Уточняющий ответ меняет ответы анкеты: (код, вариант) → {вопрос: вариант}
+CLARIFICATION_EFFECTS: Dict[Tuple[str, str], Dict[int, str]] = {
+    (rule["code"], answer): effect
+    for rule in CONTRADICTION_RULES
+    for answer, effect in rule.get("effects", {}).items()
+}
+
+
+def option_code(answer: str) -> int:
+    """Код варианта по ответу вида "B) 1-3 года"; 0 — не A–C"""
+    return _LETTER_CODES.get(answer.lstrip()[:1], 0)
+
+
+def column(key) -> int:
+    """Столбец вектора: номер вопроса или имя фактора из цели"""
+    return FACTOR_COLUMNS[key] if isinstance(key, str) else key - 1
+
+
+def encode_answers(
+    answers_map: Dict[int, str], llm_data: Optional[Dict] = None
+) -> List[int]:
+    """
+    Коды анкеты из {номер вопроса: вариант} и факторов цели.
+    Без цели столбцы факторов остаются 0: условия на них не выполняются
+    """
+    codes = [0] * N_COLUMNS
+    for question_id, answer in answers_map.items():
+        if 1 <= question_id <= QUESTION_COUNT:
+            codes[question_id - 1] = _LETTER_CODES.get(answer.lstrip()[:1], 0)
+    if llm_data:
+        for factor, index in FACTOR_COLUMNS.items():
+            codes[index] = option_code(llm_data.get(factor) or "")
+    return codes
+
+
+def horizon_code(codes: Sequence[int]) -> int:
+    """Горизонт для результата: из цели, если она есть, иначе из ответа на вопрос 1"""
+    return codes[FACTOR_COLUMNS["horizon"]] or codes[0]
+
+
+def _condition_rows(conditions: Sequence[Dict]) -> Tuple[np.ndarray, List[int]]:
+    """Счетчики условий по (столбец, вариант) и сколько совпадений нужно"""
+    table = np.zeros((N_COLUMNS, len(OPTIONS) + 1, len(conditions)), dtype=np.int16)
+    for i, condition in enumerate(conditions):
+        for key, value in condition.items():
+            for option in rule_options(value):
+                table[column(key), OPTION_CODES[option], i] = 1
+    return table, [len(condition) for condition in conditions]
+
+
+class ProfileEngine:
+    """Таблицы анкеты, скомпилированные в массивы"""
+
+    def __init__(
+        self,
+        scoring: Dict[int, Dict[str, Tuple[int, int]]] = SCORING,
+        restrictions: List[Tuple[Dict, str]] = RESTRICTIONS,
+        contradictions: List[Tuple[str, Dict]] = CONTRADICTIONS,
+        clarification_effects: Dict[
+            Tuple[str, str], Dict[int, str]
+        ] = CLARIFICATION_EFFECTS,
+    ):
+        scores = np.zeros((N_COLUMNS, len(OPTIONS) + 1, len(PROFILES)), dtype=np.int16)
+        for question_id, options in scoring.items():
+            for option, (profile, points) in options.items():
+                scores[column(question_id), OPTION_CODES[option], profile] += points
+
+        restriction_table, self._restriction_required = _condition_rows(
+            [condition for condition, _ in restrictions]
+        )
+        self._restriction_effects = [effect for _, effect in restrictions]
+        contradiction_table, self._contradiction_required = _condition_rows(
+            [condition for _, condition in contradictions]
+        )
+        self.contradiction_codes = [code for code, _ in contradictions]
+
+        # Одна строка на ответ: баллы | ограничения | противоречия
+        self.table = np.concatenate(
+            [scores, restriction_table, contradiction_table], axis=2
+        )
+        self._packed = [
+            [
+                sum(
+                    int(value) << (PACKED_FIELD_BITS * i) for i, value in enumerate(row)
+                )
+                for row in options
+            ]
+            for options in self.table
+        ]
+        self._restrictions_at = len(PROFILES)
+        self._contradictions_at = self._restrictions_at + len(restrictions)
+        # (эффект или код, сдвиг поля в упакованной сумме, нужно совпадений)
+        self._packed_restrictions = [
+            (effect, PACKED_FIELD_BITS * i, required)
+            for i, (effect, required) in enumerate(
+                zip(self._restriction_effects, self._restriction_required),
+                start=self._restrictions_at,
+            )
+        ]
+        self._packed_contradictions = [
+            (code, PACKED_FIELD_BITS * i, required)
+            for i, (code, required) in enumerate(
+                zip(self.contradiction_codes, self._contradiction_required),
+                start=self._contradictions_at,
+            )
+        ]
+
+        self.clarification_effects = {
+            key: [
+                (column(question_id), OPTION_CODES[option])
+                for question_id, option in effect.items()
+            ]
+            for key, effect in clarification_effects.items()
+        }
+
+    def score_batch(self, codes: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Расчет матрицы анкет n × N_COLUMNS (коды 0–3).
+        Возвращает массивы длины n: conservative, moderate, aggressive
+        (баллы до ограничений), profile (индекс в PROFILES), horizon
+        (индекс в HORIZONS) и contradictions — n × len(contradiction_codes)
+        """
+        codes = np.asarray(codes, dtype=np.intp)
+        totals = np.zeros((len(codes), self.table.shape[2]), dtype=np.int16)
+        for index in range(N_COLUMNS):
+            totals += self.table[index, codes[:, index]]
+
+        conservative, moderate, aggressive = totals[:, 0], totals[:, 1], totals[:, 2]
+        matched = (
+            totals[:, self._restrictions_at : self._contradictions_at]
+            == self._restriction_required
+        )
+        cons, mod, agr = conservative, moderate, aggressive
+        for i, effect in enumerate(self._restriction_effects):
+            hit = matched[:, i]
+            if effect == "cap_aggressive":
+                agr = np.where(hit, np.minimum(agr, mod), agr)
+            elif effect == "conservative":
+                agr = np.where(hit, 0, agr)
+                mod = np.where(hit, 0, mod)
+                cons = np.where(hit, np.maximum(cons, FORCED_CONSERVATIVE_SCORE), cons)
+
+        profile = np.where(
+            agr >= AGGRESSIVE_THRESHOLD,
+            AGGRESSIVE,
+            np.where(cons >= CONSERVATIVE_THRESHOLD, CONSERVATIVE, MODERATE),
+        )
+        return {
+            "conservative": conservative,
+            "moderate": moderate,
+            "aggressive": aggressive,
+            "profile": profile,
+            "horizon": np.where(
+                codes[:, FACTOR_COLUMNS["horizon"]] > 0,
+                codes[:, FACTOR_COLUMNS["horizon"]],
+                codes[:, 0],
+            ),
+            "contradictions": totals[:, self._contradictions_at :]
+            == self._contradiction_required,
+        }
+
+    def _packed_total(self, codes: Sequence[int]) -> int:
+        return sum(map(list.__getitem__, self._packed, codes))
+
+    def profile(self, codes: Sequence[int]) -> RiskProfileResult:
+        """Результат для одной анкеты, как строка score_batch"""
+        total = self._packed_total(codes)
+        conservative = total & PACKED_FIELD_MASK
+        moderate = (total >> PACKED_FIELD_BITS) & PACKED_FIELD_MASK
+        aggressive = (total >> 2 * PACKED_FIELD_BITS) & PACKED_FIELD_MASK
+        cons, mod, agr = conservative, moderate, aggressive
+        for effect, shift, required in self._packed_restrictions:
+            if (total >> shift) & PACKED_FIELD_MASK != required:
+                continue
+            if effect == "cap_aggressive":
+                agr = min(agr, mod)
+            elif effect == "conservative":
+                agr, mod, cons = 0, 0, max(cons, FORCED_CONSERVATIVE_SCORE)
+
+        if agr >= AGGRESSIVE_THRESHOLD:
+            profile = AGGRESSIVE
+        elif cons >= CONSERVATIVE_THRESHOLD:
+            profile = CONSERVATIVE
+        else:
+            profile = MODERATE
+        return RiskProfileResult(
+            profile=PROFILES[profile],
+            conservative_score=conservative,
+            moderate_score=moderate,
+            aggressive_score=aggressive,
+            investment_horizon=HORIZONS[horizon_code(codes)],
+        )
+
+    def contradictions(self, codes: Sequence[int]) -> List[str]:
+        """Коды противоречий одной анкеты"""
+        total = self._packed_total(codes)
+        return [
+            code
+            for code, shift, required in self._packed_contradictions
+            if (total >> shift) & PACKED_FIELD_MASK == required
+        ]
+
+    def clarify(
+        self, codes: Sequence[int], clarification_answers: List[Dict[str, str]]
+    ) -> List[int]:
+        """Копия анкеты с изменениями от уточняющих ответов"""
+        codes = list(codes)
+        for clarification in clarification_answers:
+            answer = clarification["answer"].strip()[:1].upper()
+            for index, code in self.clarification_effects.get(
+                (clarification["code"], answer), []
+            ):
+                codes[index] = code
+        return codes
+
+
+engine = ProfileEngine()
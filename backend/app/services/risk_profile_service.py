@@ -1,6 +1,8 @@
 from typing import Dict, List
 
 from app.schemas.risk_profile import RiskAnswer, RiskProfileResult
+from app.services.contradiction_rules import matcher
+from app.services.risk_profile_engine import encode_answers, engine
 
 QUESTIONS = [
     # Блок 1 – Опыт и вовлечённость
@@ -120,170 +122,19 @@ def get_llm_risk_factors(user_id: str, cache) -> Dict:
 
 
 def check_all_contradictions(answers: dict, llm_data: Dict = None) -> List[Dict]:
-    """Проверка противоречий с учетом данных из LLM"""
-    contradictions = []
+    """Проверка противоречий с учетом данных из LLM (правила — contradiction_rules)"""
+    return matcher.match(answers, llm_data)
 
-    if llm_data:
-        capital_size = llm_data.get("capital_size")
 
-        if capital_size == "A" and answers.get(8) == "C":
-            contradictions.append(
-                {
-                    "code": "small_capital_high_return",
-                    "question": "При небольшом стартовом капитале вы ожидаете "
-                    + "высокую доходность. "
-                    + "Рекомендуем начать с умеренных стратегий. Согласны?",
-                    "options": [
-                        "A) Да, начну с умеренного риска",
-                        "B) Нет, готов к высокому риску",
-                    ],
-                }
-            )
-
-        if answers.get(1) == "A" and capital_size == "C":
-            contradictions.append(
-                {
-                    "code": "beginner_large_capital",
-                    "question": "Вы начинающий инвестор с крупным капиталом. "
-                    + "Рекомендуем начать с умеренных стратегий. Согласны?",
-                    "options": [
-                        "A) Да, начну с умеренного риска",
-                        "B) Нет, готов к более агрессивной стратегии",
-                    ],
-                }
-            )
-
-    if answers.get(6) == "A" and answers.get(7) == "C":
-        contradictions.append(
-            {
-                "code": "low_risk_buy_dip",
-                "question": "Вы указали низкую терпимость к просадкам, "
-                + "но готовы докупать при падении. Что для вас приоритетнее?",
-                "options": [
-                    "A) Сохранение капитала важнее",
-                    "B) Готов к умеренному риску для роста",
-                ],
-            }
-        )
-
-    if answers.get(1) == "A" and answers.get(2) == "C":
-        contradictions.append(
-            {
-                "code": "no_experience_self_management",
-                "question": "Без опыта вы выбираете самостоятельное управление. "
-                + "Рекомендуем начать с ETF. Согласны?",
-                "options": [
-                    "A) Да, начну с ETF",
-                    "B) Нет, хочу самостоятельное управление",
-                ],
-            }
-        )
-
-    return contradictions
-
-
-def apply_restrictions(
-    conservative: int,
-    moderate: int,
-    aggressive: int,
-    answers_map: dict,
-    llm_data: Dict = None,
-):
-    """Применение ограничивающих условий с учетом LLM данных"""
-
-    # Нет опыта → максимум умеренный
-    if answers_map.get(1) == "A":
-        aggressive = min(aggressive, moderate)
-
-    # Просадка ≤ -10% → консервативный
-    if answers_map.get(6) == "A":
-        aggressive = 0
-        moderate = 0
-        conservative = max(conservative, 8)
-
-    # Страх потерь → консервативный
-    if answers_map.get(9) == "A" and answers_map.get(7) == "A":
-        aggressive = 0
-        moderate = 0
-        conservative = max(conservative, 8)
-
-    return conservative, moderate, aggressive
-
-
-def determine_profile_v2(
-    conservative: int,
-    moderate: int,
-    aggressive: int,
-    answers_map: dict,
-    llm_data: Dict = None,
-) -> str:
-    """Определение профиля с учетом LLM данных"""
-
-    conservative, moderate, aggressive = apply_restrictions(
-        conservative, moderate, aggressive, answers_map, llm_data
-    )
-
-    if aggressive >= 15:
-        return "Агрессивный"
-    elif conservative >= 12:
-        return "Консервативный"
-    else:
-        return "Умеренный"
+def _answers_map(answers: List[RiskAnswer]) -> Dict[int, str]:
+    return {a.question_id: a.answer for a in answers}
 
 
 def calculate_profile_v2(
     answers: List[RiskAnswer], llm_data: Dict = None
 ) -> RiskProfileResult:
-    """Основной расчет профиля"""
-    answers_map = {a.question_id: a.answer.strip()[0].upper() for a in answers}
-
-    conservative = moderate = aggressive = 0
-
-    scoring = {
-        # Блок 1 – Опыт и вовлечённость
-        1: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        2: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        3: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        # Блок 2 – Финансовое положение
-        4: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        5: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        # Блок 3 – Отношение к риску
-        6: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        7: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        8: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        # Блок 4 – Эмоциональная устойчивость
-        9: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        10: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-        11: {"A": ("cons", 2), "B": ("mod", 1), "C": ("agr", 3)},
-    }
-
-    for qid, ans in answers_map.items():
-        if qid in scoring and ans in scoring[qid]:
-            prof, val = scoring[qid][ans]
-            if prof == "cons":
-                conservative += val
-            elif prof == "mod":
-                moderate += val
-            elif prof == "agr":
-                aggressive += val
-
-    profile = determine_profile_v2(
-        conservative, moderate, aggressive, answers_map, llm_data
-    )
-
-    horizon_mapping = {"A": "До 3 лет", "B": "3–7 лет", "C": "Более 7 лет"}
-    investment_horizon = horizon_mapping.get(answers_map.get(1))
-
-    if llm_data:
-        investment_horizon = horizon_mapping.get(llm_data.get("horizon"))
-
-    return RiskProfileResult(
-        profile=profile,
-        conservative_score=conservative,
-        moderate_score=moderate,
-        aggressive_score=aggressive,
-        investment_horizon=investment_horizon,
-    )
+    """Основной расчет профиля по скомпилированным таблицам (risk_profile_engine)"""
+    return engine.profile(encode_answers(_answers_map(answers), llm_data))
 
 
 def calculate_profile_v2_with_clarifications(
@@ -292,38 +143,5 @@ def calculate_profile_v2_with_clarifications(
     llm_data: Dict = None,
 ) -> RiskProfileResult:
     """Расчет профиля с учетом уточняющих ответов"""
-    answers_map = {a.question_id: a.answer.strip()[0].upper() for a in answers}
-
-    for clarification in clarification_answers:
-        code = clarification["code"]
-        answer = clarification["answer"].strip()[0].upper()
-
-        if code == "low_risk_buy_dip":
-            if answer == "A":
-                answers_map[9] = "A"
-            elif answer == "B":
-                answers_map[8] = "B"
-        elif code == "no_experience_self_management":
-            if answer == "A":
-                answers_map[3] = "B"
-
-        elif code == "large_capital_fear":
-            if answer == "A":
-                answers_map[9] = "A"
-                answers_map[10] = "A"
-            elif answer == "B":
-                answers_map[11] = "B"
-        elif code == "small_capital_high_return":
-            if answer == "A":
-                answers_map[10] = "B"
-            elif answer == "B":
-                pass
-
-        elif code == "high_investment_low_capital":
-            if answer == "A":
-                answers_map[7] = "B"
-
-    # Пересчитываем с обновленными ответами
-    return calculate_profile_v2(
-        [RiskAnswer(question_id=k, answer=v) for k, v in answers_map.items()], llm_data
-    )
+    codes = encode_answers(_answers_map(answers), llm_data)
+    return engine.profile(engine.clarify(codes, clarification_answers))
@@ -0,0 +1,43 @@
+"""
+Кеш расшифровок голосовых сообщений.
+
+Пользователи часто отправляют то же голосовое повторно (например, после
+ошибки LLM). Ключ — sha256 байтов записи, посчитанный при копировании на
+диск (spool_upload), вместе с моделью Whisper и языком: та же запись
+другой моделью распознается заново. Записи живут
+WHISPER_TRANSCRIPT_CACHE_TTL секунд; без Redis кеш работает в памяти
+процесса, как остальные ключи async_cache.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from app.core.redis_cache import async_cache
+
+WHISPER_TRANSCRIPT_CACHE_ENABLED = os.getenv(
+    "WHISPER_TRANSCRIPT_CACHE_ENABLED", "true"
+).lower() in ("1", "true", "yes")
+WHISPER_TRANSCRIPT_CACHE_TTL = int(
+    os.getenv("WHISPER_TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600)
+)
+
+ENTRY_PREFIX = "whisper:transcript:"
+
+
+def transcript_key(audio_hash: str, model: str, language: str) -> str:
+    return f"{ENTRY_PREFIX}{model}:{language}:{audio_hash}"
+
+
+async def get_transcript(audio_hash: str, model: str, language: str) -> Optional[Dict]:
+    """{"phrases": [...]} или None"""
+    return await async_cache.get_json(transcript_key(audio_hash, model, language))
+
+
+async def put_transcript(
+    audio_hash: str, model: str, language: str, phrases: List[str]
+):
+    await async_cache.set_json(
+        transcript_key(audio_hash, model, language),
+        {"phrases": phrases},
+        expire=WHISPER_TRANSCRIPT_CACHE_TTL,
+    )
@@ -0,0 +1,97 @@
+"""
+Микробатчинг фраз для Whisper.
+
+Фразы одновременных голосовых сообщений собираются в общий батч и
+распознаются одним прямым проходом модели: при нагрузке воркер решает
+один батч вместо N отдельных циклов декодера.
+
+Батч отправляется, когда есть свободный воркер и набралось
+WHISPER_BATCH_SIZE фраз либо первая фраза ждет WHISPER_BATCH_WAIT
+секунд. Пока все воркеры заняты, фразы копятся в следующий батч.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", 8))
+WHISPER_BATCH_WAIT = float(os.getenv("WHISPER_BATCH_WAIT", 0.05))
+
+
+class WhisperBatcher:
+    """Собирает фразы в батчи и раздает результаты ожидающим запросам"""
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int = WHISPER_BATCH_SIZE,
+        max_wait: float = WHISPER_BATCH_WAIT,
+        concurrency: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._expired = False
+        self._running = 0
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Ставит фразу в очередь и ждет ее результат"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future))
+        if self._timer is None and not self._expired:
+            self._timer = loop.call_later(self.max_wait, self._on_timeout)
+        self._dispatch()
+        return await future
+
+    def _on_timeout(self):
+        self._timer = None
+        self._expired = True
+        self._dispatch()
+
+    def _dispatch(self):
+        # Отмененные запросы (клиент ушел) в батч не попадают
+        self._queue = [
+            (item, future) for item, future in self._queue if not future.done()
+        ]
+        while self._queue and self._running < self.concurrency:
+            if len(self._queue) < self.max_batch and not self._expired:
+                return
+            batch = self._queue[: self.max_batch]
+            self._queue = self._queue[self.max_batch :]
+            self._running += 1
+            asyncio.ensure_future(self._run(batch))
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            # Оставшиеся фразы ждали дольше новых — отправляем без паузы
+            self._expired = bool(self._queue)
+
+        if not self._queue:
+            self._expired = False
+        elif self._timer is None and not self._expired:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait, self._on_timeout
+            )
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._running -= 1
+            self._dispatch()
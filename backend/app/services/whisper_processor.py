@@ -1,35 +1,172 @@
+"""
+Транскрипция голосовых сообщений в отдельных процессах.
+
+Whisper работает в пуле из WHISPER_WORKERS процессов (whisper_worker),
+модель загружается один раз в каждом. Event loop API не блокируется,
+а torch в процесс API не импортируется. Запросов в работе и в очереди
+не больше WHISPER_WORKERS + WHISPER_MAX_QUEUE; сверх этого сразу
+отвечаем 503 с Retry-After, чтобы клиент повторил позже, а не ждал
+в бесконечной очереди.
+
+Модель выбирается WHISPER_MODEL: turbo на GPU, на CPU быстрее реального
+времени работают base и small (см. benchmarks/bench_whisper_rtf.py).
+WHISPER_INT8 включает динамическую int8 квантизацию на CPU.
+
+Загрузка копируется на диск кусками (spool_upload), декодируется
+потоком и режется на фразы (audio_stream): память не растет с длиной
+записи, а stream_file отдает текст фраз по мере готовности. Фразы всех
+одновременных запросов распознаются общими батчами (whisper_batcher).
+Повторно отправленная запись берется из кеша расшифровок
+(transcript_cache) без Whisper, device_used в ответе — "cache".
+При старте приложения воркеры поднимаются и прогреваются заранее
+(WHISPER_WARMUP), а не на первом голосовом сообщении.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
 import os
 import tempfile
-from typing import Any, Dict
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-import torch
-import whisper
 from fastapi import HTTPException, UploadFile
 
+from app.services import whisper_worker
+from app.services.audio_stream import iter_segments, read_pcm
+from app.services.transcript_cache import (
+    WHISPER_TRANSCRIPT_CACHE_ENABLED,
+    get_transcript,
+    put_transcript,
+)
+from app.services.whisper_batcher import (
+    WHISPER_BATCH_SIZE,
+    WHISPER_BATCH_WAIT,
+    WhisperBatcher,
+)
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "turbo")
+WHISPER_INT8 = os.getenv("WHISPER_INT8", "false").lower() in ("1", "true", "yes")
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "true").lower() in ("1", "true", "yes")
+WHISPER_LANGUAGE = "ru"
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", 1))
+# Сколько запросов может ждать свободный воркер
+WHISPER_MAX_QUEUE = int(os.getenv("WHISPER_MAX_QUEUE", 4))
+WHISPER_RETRY_AFTER = int(os.getenv("WHISPER_RETRY_AFTER", 10))
+# Запись копируется на диск кусками такого размера, целиком в память не читается
+WHISPER_UPLOAD_CHUNK_SIZE = int(os.getenv("WHISPER_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+WHISPER_MAX_UPLOAD_BYTES = int(os.getenv("WHISPER_MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+
+
+async def spool_upload(audio_file: UploadFile) -> Tuple[str, str]:
+    """
+    Копирует загрузку во временный файл кусками.
+    Возвращает путь и sha256 содержимого — ключ кеша расшифровок
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        delete=False, suffix=os.path.splitext(audio_file.filename or "")[1]
+    ) as tmp_file:
+        size = 0
+        try:
+            while chunk := await audio_file.read(WHISPER_UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > WHISPER_MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=(
+                            "Аудио файл больше "
+                            f"{WHISPER_MAX_UPLOAD_BYTES // 2**20} МБ"
+                        ),
+                    )
+                tmp_file.write(chunk)
+                digest.update(chunk)
+        except BaseException:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    return tmp_file.name, digest.hexdigest()
+
 
 class WhisperProcessor:
-    """Упрощенный класс для обработки аудио файлов с помощью Whisper"""
-
-    def __init__(self):
-        self.model_type = "turbo"
-        self.model = None
-        self.device = self._get_best_device()
-
-    def _get_best_device(self) -> str:
-        """Определяет лучшее доступное устройство"""
-        if torch.cuda.is_available():
-            try:
-                torch.tensor([1.0]).cuda()
-                torch.cuda.empty_cache()
-                return "cuda"
-            except RuntimeError:
-                return "cpu"
-        return "cpu"
-
-    def load_model(self):
-        """Загружает модель Whisper"""
-        if self.model is None:
-            self.model = whisper.load_model(self.model_type, device=self.device)
+    """Очередь транскрипций перед пулом процессов Whisper"""
+
+    def __init__(
+        self,
+        model_type: str = WHISPER_MODEL,
+        int8: bool = WHISPER_INT8,
+        workers: int = WHISPER_WORKERS,
+        max_queue: int = WHISPER_MAX_QUEUE,
+        max_batch: int = WHISPER_BATCH_SIZE,
+        max_wait: float = WHISPER_BATCH_WAIT,
+        task: Callable = whisper_worker.transcribe_batch,
+        initializer: Callable = whisper_worker.init_worker,
+        warm_up_task: Callable = whisper_worker.warm_up,
+        decoder: Callable = read_pcm,
+        use_cache: bool = WHISPER_TRANSCRIPT_CACHE_ENABLED,
+    ):
+        self.model_type = model_type
+        self.int8 = int8
+        self.workers = workers
+        self.max_queue = max_queue
+        self.task = task
+        self.initializer = initializer
+        self.warm_up_task = warm_up_task
+        self.decoder = decoder
+        self.use_cache = use_cache
+        self.device_used: Optional[str] = None
+        self.batcher = WhisperBatcher(
+            self._run_batch, max_batch=max_batch, max_wait=max_wait, concurrency=workers
+        )
+        self._warm_up: Optional[asyncio.Task] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def model_tier(self) -> str:
+        """Модель в ключе кеша: int8 распознает чуть иначе, чем fp32"""
+        return f"{self.model_type}-int8" if self.int8 else self.model_type
+
+    @property
+    def pending(self) -> int:
+        """Запросы в работе и в очереди"""
+        return self._pending
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # spawn: воркер не наследует event loop и соединения API
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+                initargs=(self.model_type, self.int8),
+            )
+        return self._pool
+
+    def check_capacity(self):
+        """503 с Retry-After, если воркеры и очередь заняты"""
+        if self._pending >= self.workers + self.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Сервис распознавания речи перегружен, повторите позже",
+                headers={"Retry-After": str(WHISPER_RETRY_AFTER)},
+            )
+
+    async def _run_batch(self, segments: List[Any]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._get_pool(), self.task, segments, WHISPER_LANGUAGE
+            )
+        except BrokenProcessPool:
+            # Воркер упал (например, по памяти): следующий батч поднимет пул заново
+            self._pool = None
+            raise
+        self.device_used = result["device_used"]
+        return result["texts"]
 
     async def transcribe_audio_file(self, audio_file: UploadFile) -> Dict[str, Any]:
         """
@@ -42,36 +179,127 @@ class WhisperProcessor:
             Dict с результатом транскрипции
         """
 
-        with tempfile.NamedTemporaryFile(
-            delete=False, suffix=os.path.splitext(audio_file.filename)[1]
-        ) as tmp_file:
-            try:
-                content = await audio_file.read()
-                tmp_file.write(content)
-                tmp_file_path = tmp_file.name
-
-                self.load_model()
-
-                result = self.model.transcribe(
-                    tmp_file_path,
-                    verbose=False,
-                    fp16=(self.device == "cuda"),
-                    language="ru",
-                )
+        # Емкость проверяет stream_file: повтор из кеша проходит и под нагрузкой
+        path, audio_hash = await spool_upload(audio_file)
+        try:
+            # Дочитываем поток до конца, чтобы stream_file удалил файл
+            async for kind, payload in self.stream_file(
+                path, audio_file.filename, audio_hash
+            ):
+                if kind == "done":
+                    result = payload
+            return result
 
-                return {
-                    "text": result["text"].strip(),
-                    "device_used": self.device,
-                    "filename": audio_file.filename,
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Ошибка транскрипции: {str(e)}"
+            )
+
+    async def is_cached(self, audio_hash: Optional[str]) -> bool:
+        """Есть ли расшифровка записи в кеше"""
+        if not audio_hash or not self.use_cache:
+            return False
+        return (
+            await get_transcript(audio_hash, self.model_tier, WHISPER_LANGUAGE)
+            is not None
+        )
+
+    async def stream_file(
+        self, path: str, filename: str, audio_hash: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Транскрибирует сохраненный spool_upload файл и удаляет его.
+        Отдает ("partial", текст фразы) по мере распознавания,
+        последним — ("done", результат как у transcribe_audio_file).
+        С audio_hash расшифровка берется из кеша и сохраняется в него
+        """
+        if audio_hash and self.use_cache:
+            cached = await get_transcript(audio_hash, self.model_tier, WHISPER_LANGUAGE)
+            if cached is not None:
+                os.unlink(path)
+                for text in cached["phrases"]:
+                    yield "partial", text
+                yield "done", {
+                    "text": " ".join(cached["phrases"]),
+                    "device_used": "cache",
+                    "filename": filename,
                 }
+                return
+
+        try:
+            self.check_capacity()
+        except HTTPException:
+            os.unlink(path)
+            raise
 
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500, detail=f"Ошибка транскрипции: {str(e)}"
+        self._pending += 1
+        texts: List[str] = []
+        results: deque = deque()
+        try:
+            async for segment in iter_segments(path, self.decoder):
+                results.append(asyncio.ensure_future(self.batcher.submit(segment)))
+                # Готовые фразы отдаем сразу; в очереди у запроса не больше
+                # батча фраз, чтобы длинная запись не лежала в памяти целиком
+                while results and (
+                    results[0].done() or len(results) >= self.batcher.max_batch
+                ):
+                    if text := await results.popleft():
+                        texts.append(text)
+                        yield "partial", text
+            while results:
+                if text := await results.popleft():
+                    texts.append(text)
+                    yield "partial", text
+            if audio_hash and self.use_cache:
+                await put_transcript(
+                    audio_hash, self.model_tier, WHISPER_LANGUAGE, texts
                 )
-            finally:
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
+            yield "done", {
+                "text": " ".join(texts),
+                "device_used": self.device_used,
+                "filename": filename,
+            }
+        finally:
+            for result in results:
+                result.cancel()
+            self._pending -= 1
+            os.unlink(path)
+
+    def start_warm_up(self):
+        """Поднимает и прогревает все воркеры в фоне, не задерживая старт API"""
+        if self._warm_up is None:
+            self._warm_up = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            # Задачи идут одновременно, поэтому пул запускает все процессы
+            devices = await asyncio.gather(
+                *[
+                    loop.run_in_executor(pool, self.warm_up_task)
+                    for _ in range(self.workers)
+                ]
+            )
+        except Exception as e:
+            print(f"❌ Не удалось прогреть Whisper: {e}")
+            # Пул мог остаться сломанным: первый запрос поднимет его заново
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            return
+        self.device_used = devices[0]
+        print(
+            f"✅ Whisper {self.model_type} прогрет: {self.workers} воркер(ов) "
+            f"на {devices[0]} за {time.perf_counter() - started:.1f}с"
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
 
 
 whisper_processor = WhisperProcessor()
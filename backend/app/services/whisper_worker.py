@@ -0,0 +1,110 @@
+"""
+Код процессов-воркеров Whisper.
+
+Модуль импортируется процессом API только ради ссылок на функции для
+пула процессов: torch и whisper загружаются внутри функций, то есть
+только в воркерах. Модель загружается один раз на воркер.
+"""
+
+from typing import Any, Dict, List
+
+from app.services.audio_stream import SAMPLE_RATE
+
+_model = None
+_device = "cpu"
+
+
+def get_best_device() -> str:
+    """Определяет лучшее доступное устройство"""
+    import torch
+
+    if torch.cuda.is_available():
+        try:
+            torch.tensor([1.0]).cuda()
+            torch.cuda.empty_cache()
+            return "cuda"
+        except RuntimeError:
+            return "cpu"
+    return "cpu"
+
+
+def quantize_int8(model):
+    """
+    Динамическая int8 квантизация линейных слоев для инференса на CPU.
+    Whisper использует свой подкласс Linear (приводит веса к dtype входа),
+    quantize_dynamic его не узнает; в fp32 он эквивалентен nn.Linear
+    """
+    import torch
+    from whisper.model import Linear
+
+    for module in model.modules():
+        if isinstance(module, Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_model(model_type: str, device: str, int8: bool = False):
+    import whisper
+
+    model = whisper.load_model(model_type, device=device)
+    if int8 and device == "cpu":
+        model = quantize_int8(model)
+    return model
+
+
+def init_worker(model_type: str, int8: bool = False):
+    """Инициализатор процесса пула: загружает модель Whisper"""
+    global _model, _device
+
+    _device = get_best_device()
+    _model = load_model(model_type, _device, int8)
+    quantized = " int8" if int8 and _device == "cpu" else ""
+    print(f"✅ Whisper {model_type}{quantized} загружен в воркере ({_device})")
+
+
+def warm_up() -> str:
+    """Прогон секунды тишины: первый настоящий запрос не платит за инициализацию"""
+    import numpy as np
+
+    transcribe_batch([np.zeros(SAMPLE_RATE, dtype=np.float32)], "ru")
+    return _device
+
+
+def transcribe_batch(segments: List[Any], language: str) -> Dict[str, Any]:
+    """
+    Распознает батч фраз (float32, 16 кГц, не длиннее окна 30 с) одним
+    прямым проходом: кодировщик и жадный декодер работают по всему батчу.
+    Неуверенные ответы перерешиваются по одному через model.transcribe,
+    где есть откат по температуре
+    """
+    import torch
+    import whisper
+
+    mel = torch.stack(
+        [
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(segment)), _model.dims.n_mels
+            )
+            for segment in segments
+        ]
+    ).to(_model.device)
+    options = whisper.DecodingOptions(
+        language=language, fp16=(_device == "cuda"), without_timestamps=True
+    )
+    results = whisper.decode(_model, mel, options)
+
+    texts = []
+    for segment, result in zip(segments, results):
+        # Пороги те же, что по умолчанию в model.transcribe
+        if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+            texts.append("")
+            continue
+        text = result.text
+        if result.compression_ratio > 2.4 or result.avg_logprob < -1.0:
+            text = _model.transcribe(
+                segment, verbose=None, fp16=(_device == "cuda"), language=language
+            )["text"]
+        texts.append(text.strip())
+    return {"texts": texts, "device_used": _device}
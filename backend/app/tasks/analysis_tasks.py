@@ -0,0 +1,44 @@
+import asyncio
+
+from celery import shared_task
+
+from app.core.database import async_engine
+from app.services import analysis_jobs
+from app.services.llm_service import close_clients
+from app.services.portfolio_analysis_service import PortfolioAnalysisService
+
+
+@shared_task(time_limit=analysis_jobs.ANALYSIS_TASK_TIME_LIMIT)
+def analyze_portfolio_task(
+    user_id: int, portfolio_id: str, job_id: str, force: bool = False
+):
+    """Анализ портфеля через LLM вне HTTP запроса, результат — в записи задачи"""
+
+    async def _analyze_async() -> dict:
+        await analysis_jobs.update_job(user_id, job_id, status="running")
+        try:
+            analysis = await PortfolioAnalysisService().analyze_portfolio(
+                user_id=user_id, portfolio_id=portfolio_id, force=force
+            )
+        except Exception as e:
+            print(f"❌ Ошибка анализа портфеля {portfolio_id}: {e}")
+            return await analysis_jobs.update_job(
+                user_id, job_id, status="failed", error=str(e)
+            )
+        finally:
+            # Клиенты привязаны к циклу этой задачи
+            await close_clients()
+        return await analysis_jobs.update_job(
+            user_id, job_id, status="done", analysis=analysis
+        )
+
+    async def _run() -> dict:
+        try:
+            return await _analyze_async()
+        finally:
+            # Соединения пула asyncpg привязаны к циклу этой задачи:
+            # следующий asyncio.run не должен получить их из пула
+            await async_engine.dispose()
+
+    job = asyncio.run(_run())
+    return {"status": job["status"], "job_id": job_id}
@@ -4,7 +4,9 @@ from celery import shared_task
 
 from app.core.database import AsyncSessionLocal
 from app.repositories.asset_repository import AssetRepository
-from app.services.moex_service import fetch_asset_data_batch
+from app.services.asset_universe import publish_asset_universe_update
+from app.services.moex_service import MoexClient
+from app.services.price_history_service import fetch_asset_data_incremental
 
 
 @shared_task
@@ -36,20 +38,27 @@ def update_assets_task():
         ("RU000A1034U7", "недвижимость", "СФН АрБиз7"),
     ]
 
-    async def _update_assets_async(assets_data: list[dict]):
-        async with AsyncSessionLocal() as session:
+    async def _update_assets_async() -> list[dict]:
+        async with MoexClient() as client, AsyncSessionLocal() as session:
             try:
-                await repo.add_or_update_many(session, assets_data)
+                # Дозагрузить историю цен и рассчитать показатели по локальной таблице
+                assets_data = await fetch_asset_data_incremental(
+                    client, session, tickers
+                )
+                if assets_data:
+                    updated = await repo.add_or_update_many(session, assets_data)
+                    if updated:
+                        # Процессы API перечитают снимок активов
+                        await asyncio.to_thread(publish_asset_universe_update)
             except Exception:
                 await session.rollback()
                 raise
+        return assets_data
 
     try:
-        # Получить ВСЕ данные и рассчитать ВСЕ показатели за один проход
-        assets_data = fetch_asset_data_batch(tickers)
+        assets_data = asyncio.run(_update_assets_async())
 
         if assets_data:
-            asyncio.run(_update_assets_async(assets_data))
             print(f"✅ Задача завершена. Обработано {len(assets_data)} активов")
         else:
             print("❌ Не удалось получить данные ни для одного актива")
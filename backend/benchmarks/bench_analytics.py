@@ -0,0 +1,80 @@
+"""
+Микро-бенчмарк векторных расчетов analytics_service.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_analytics
+"""
+
+import time
+
+import numpy as np
+
+from app.services import analytics_service as analytics
+
+INSTRUMENT_COUNTS = [10, 500, 5000]
+DAYS = 3 * 252
+GAP_SHARE = 0.05
+
+
+def make_prices(count: int, rng: np.random.Generator) -> np.ndarray:
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (count, DAYS)), axis=1))
+    prices[rng.random(prices.shape) < GAP_SHARE] = np.nan
+    return prices
+
+
+def legacy_volatility(prices: np.ndarray) -> list:
+    """Прежний расчет: цикл по активам и по дням"""
+    result = []
+    for row in prices:
+        series = [p for p in row if p > 0]
+        returns = []
+        for i in range(1, len(series)):
+            returns.append(np.log(series[i] / series[i - 1]))
+        result.append(float(np.std(returns) * np.sqrt(252)))
+    return result
+
+
+def timed(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(42)
+    dates = np.datetime64("2022-01-03") + np.arange(DAYS)
+
+    print(f"Матрица: N активов × {DAYS} дней, {GAP_SHARE:.0%} пропусков")
+    print(
+        f"{'активов':>8} {'доходн.+волат., мс':>19} {'CAGR, мс':>9} "
+        f"{'просадка, мс':>13} {'ковариация, мс':>15} {'активов/с':>11} "
+        f"{'цикл, мс':>9}"
+    )
+    for count in INSTRUMENT_COUNTS:
+        prices = make_prices(count, rng)
+        returns = analytics.log_returns(prices)
+
+        vol_time = timed(
+            lambda p: analytics.annualised_volatility(analytics.log_returns(p)), prices
+        )
+        cagr_time = timed(analytics.cagr_from_matrix, prices, dates)
+        dd_time = timed(analytics.max_drawdown, prices)
+        cov_time = timed(analytics.correlation_matrix, returns, repeat=1)
+        total = vol_time + cagr_time + dd_time + cov_time
+
+        legacy = (
+            f"{timed(legacy_volatility, prices, repeat=1) * 1000:>9.1f}"
+            if count <= 500
+            else f"{'-':>9}"
+        )
+        print(
+            f"{count:>8} {vol_time * 1000:>19.2f} {cagr_time * 1000:>9.2f} "
+            f"{dd_time * 1000:>13.2f} {cov_time * 1000:>15.2f} "
+            f"{count / total:>11.0f} {legacy}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Бенчмарк очистки кеша пользователя на большом keyspace.
+
+Заполняет отдельную БД Redis миллионом ключей и измеряет задержку
+конкурентных GET, пока выполняется очистка кеша одного пользователя:
+прежний KEYS + DEL, SCAN + UNLINK и удаление по индексу ключей.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_cache_clear
+Внимание: БД из BENCH_REDIS_URL очищается (FLUSHDB).
+"""
+
+import os
+import random
+import statistics
+import threading
+import time
+
+import redis
+
+from app.core.redis_cache import RedisCache
+
+BENCH_REDIS_URL = os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/15")
+TOTAL_KEYS = int(os.getenv("BENCH_TOTAL_KEYS", 1_000_000))
+USER_COUNT = TOTAL_KEYS // 5
+READERS = 8
+TARGET_USER = "target"
+USER_FIELDS = [
+    "llm_goal",
+    "risk_result",
+    "portfolio",
+    "pending_answers",
+    "chat_history",
+]
+
+
+def populate(client: redis.Redis):
+    client.flushdb()
+    started = time.perf_counter()
+    pipe = client.pipeline(transaction=False)
+    for user in range(USER_COUNT):
+        for field in USER_FIELDS:
+            pipe.set(f"user:{user}:{field}", "{}")
+        if user % 2000 == 1999:
+            pipe.execute()
+    pipe.execute()
+    print(
+        f"Заполнено {client.dbsize():,} ключей за {time.perf_counter() - started:.1f} с"
+    )
+
+
+def fill_target(bench: RedisCache):
+    for field in USER_FIELDS:
+        bench.set_json(f"user:{TARGET_USER}:{field}", {"field": field})
+
+
+def legacy_clear(bench: RedisCache) -> int:
+    keys = bench.client.keys(f"user:{TARGET_USER}:*")
+    if keys:
+        bench.client.delete(*keys)
+    return len(keys)
+
+
+def measure(bench: RedisCache, name: str, clear) -> None:
+    fill_target(bench)
+    stop = threading.Event()
+    latencies = []
+    lock = threading.Lock()
+
+    def reader():
+        client = redis.Redis.from_url(BENCH_REDIS_URL)
+        local = []
+        while not stop.is_set():
+            key = f"user:{random.randrange(USER_COUNT)}:llm_goal"
+            started = time.perf_counter()
+            client.get(key)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    deleted = clear(bench)
+    elapsed = time.perf_counter() - started
+    time.sleep(0.05)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(
+        f"{name:>14} {elapsed * 1000:>11.1f} {deleted:>8} "
+        f"{statistics.median(latencies) * 1000:>9.3f} {p99 * 1000:>9.3f} "
+        f"{latencies[-1] * 1000:>9.1f}"
+    )
+
+
+def main():
+    bench = RedisCache()
+    bench.client = redis.Redis.from_url(BENCH_REDIS_URL, decode_responses=True)
+    bench.enabled = True
+    populate(bench.client)
+
+    print(f"Очистка кеша одного пользователя, {READERS} потоков читают параллельно")
+    print(
+        f"{'способ':>14} {'очистка, мс':>11} {'ключей':>8} "
+        f"{'GET p50':>9} {'GET p99':>9} {'GET max':>9}"
+    )
+    measure(bench, "KEYS + DEL", legacy_clear)
+    measure(bench, "SCAN + UNLINK", lambda b: b.delete_pattern(f"user:{TARGET_USER}:*"))
+    measure(bench, "индекс", lambda b: b.clear_user_cache(TARGET_USER))
+    bench.client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Бенчмарк размера промпта диалога: вся история против окна с кратким
+содержанием (chat_history). Синтетические диалоги разной длины,
+токены оцениваются chat_history.estimate_tokens.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_chat_history
+"""
+
+import asyncio
+import random
+import time
+import uuid
+
+from app.services import chat_history
+
+DIALOG_TURNS = [5, 20, 50, 100, 200]
+
+USER_PHRASES = [
+    "Хочу накопить на квартиру в Москве, думаю лет за пять.",
+    "Сейчас у меня есть около 500 тысяч рублей, могу откладывать 40 тысяч в месяц.",
+    "А какие риски у облигаций федерального займа? Насколько они надежны?",
+    "Я не готов терять больше 10 процентов за год, это для меня важно.",
+    "Можно ли добавить в портфель золото, если рубль ослабнет?",
+    "Расскажи подробнее, почему именно такой срок инвестирования.",
+]
+ASSISTANT_PHRASES = [
+    "Понял вас. Чтобы подобрать стратегию, уточните, пожалуйста, желаемую сумму "
+    "накоплений и срок, к которому она понадобится.",
+    "Облигации федерального займа считаются одним из самых надежных инструментов: "
+    "их выпускает Минфин, а доходность зафиксирована заранее. Основной риск — "
+    "изменение ключевой ставки, из-за которого меняется рыночная цена бумаги.",
+    "Отлично, с таким горизонтом можно включить в портфель часть акций. "
+    "Какую сумму вы готовы вложить на старте?",
+    "Золото действительно часто дорожает при ослаблении рубля, его доля в "
+    "умеренном портфеле обычно составляет 5–10 процентов.",
+]
+
+
+def full_history_tokens(dialog: list) -> int:
+    return sum(chat_history.estimate_tokens(m["content"]) for m in dialog)
+
+
+async def run_dialog(turns: int, rng: random.Random) -> tuple:
+    user_id = f"bench-{uuid.uuid4().hex}"
+    dialog = []
+    full_total = managed_total = 0
+    managed_last = full_last = 0
+    prompt_time = 0.0
+    try:
+        for _ in range(turns):
+            user_message = {"role": "user", "content": rng.choice(USER_PHRASES)}
+            dialog.append(user_message)
+            await chat_history.append_message(user_id, "user", user_message["content"])
+
+            started = time.perf_counter()
+            prompt = await chat_history.build_prompt(user_id)
+            prompt_time += time.perf_counter() - started
+
+            full_last = full_history_tokens(dialog)
+            managed_last = full_history_tokens(prompt)
+            full_total += full_last
+            managed_total += managed_last
+
+            answer = rng.choice(ASSISTANT_PHRASES)
+            dialog.append({"role": "assistant", "content": answer})
+            await chat_history.append_message(user_id, "assistant", answer)
+            await chat_history.remember_goal(
+                user_id, {"term": 60, "reason": "квартира"}
+            )
+    finally:
+        await chat_history.clear(user_id)
+    return full_last, managed_last, full_total, managed_total, prompt_time / turns
+
+
+async def main():
+    rng = random.Random(7)
+    print(
+        f"Окно {chat_history.CHAT_HISTORY_WINDOW} сообщений, "
+        f"бюджет {chat_history.CHAT_HISTORY_TOKEN_BUDGET} токенов"
+    )
+    print(
+        f"{'ходов':>6} {'промпт: вся':>12} {'промпт: окно':>13} "
+        f"{'за диалог: вся':>15} {'за диалог: окно':>16} {'экономия':>9} "
+        f"{'сборка, мс':>11}"
+    )
+    for turns in DIALOG_TURNS:
+        full_last, managed_last, full_total, managed_total, prompt_time = (
+            await run_dialog(turns, rng)
+        )
+        print(
+            f"{turns:>6} {full_last:>12} {managed_last:>13} "
+            f"{full_total:>15} {managed_total:>16} "
+            f"{1 - managed_total / full_total:>9.0%} {prompt_time * 1000:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+Бенчмарк параллельной загрузки MOEX против локальной заглушки ISS.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_moex_fetch
+"""
+
+import asyncio
+import contextlib
+import io
+import time
+
+from benchmarks.iss_stub import StubStats, run_stub_iss
+
+from app.services.moex_service import MoexClient, fetch_all_prices_data_async
+
+LATENCY = 0.05
+TICKER_COUNTS = [19, 76, 304]
+CONCURRENCY_LEVELS = [4, 16, 64]
+
+
+def make_tickers(count: int):
+    return [(f"T{i:04d}", "акция", f"Тикер {i}") for i in range(count)]
+
+
+async def run_case(ticker_count: int, concurrency: int):
+    stats = StubStats()
+    async with run_stub_iss(latency=LATENCY, stats=stats) as (base_url, _):
+        async with MoexClient(base_url=base_url, max_concurrency=concurrency) as client:
+            started = time.perf_counter()
+            # Логи сервиса не нужны в выводе бенчмарка
+            with contextlib.redirect_stdout(io.StringIO()):
+                await fetch_all_prices_data_async(make_tickers(ticker_count), client)
+            elapsed = time.perf_counter() - started
+    return elapsed, stats
+
+
+async def main():
+    print(f"Задержка заглушки: {LATENCY * 1000:.0f} мс на запрос")
+    print(
+        f"{'тикеров':>8} {'параллельно':>12} {'запросов':>9} "
+        f"{'время, с':>9} {'последовательно, с':>19}"
+    )
+    for ticker_count in TICKER_COUNTS:
+        for concurrency in CONCURRENCY_LEVELS:
+            elapsed, stats = await run_case(ticker_count, concurrency)
+            serial = stats.requests * LATENCY
+            print(
+                f"{ticker_count:>8} {concurrency:>12} {stats.requests:>9} "
+                f"{elapsed:>9.2f} {serial:>19.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
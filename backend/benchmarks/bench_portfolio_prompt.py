@@ -0,0 +1,234 @@
+"""
+Бенчмарк размера промпта анализа портфеля: прежний JSON
+(json.dumps(jsonable_encoder(...))) против portfolio_prompt.encode_portfolio.
+
+Портфели собираются методами PortfolioService (распределение по
+риск-профилю, взнос, пошаговый план) на фиксированном наборе активов и
+проходят через convert_db_to_response, как при анализе из БД. Токены
+оцениваются chat_history.estimate_tokens.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_portfolio_prompt
+"""
+
+import contextlib
+import io
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas.portfolio import (
+    AssetAllocation,
+    PortfolioComposition,
+    PortfolioRecommendation,
+)
+from app.services.chat_history import estimate_tokens
+from app.services.portfolio_analysis_service import VOLATILE_FIELDS
+from app.services.portfolio_prompt import encode_portfolio
+from app.services.portfolio_service import PortfolioService
+
+# (тикер, название, класс, цена, доходность)
+ASSETS = [
+    ("SBER", "Сбербанк", "акции", 312.5, 0.18),
+    ("GAZP", "Газпром", "акции", 128.3, 0.05),
+    ("LKOH", "Лукойл", "акции", 6950.0, 0.21),
+    ("GMKN", "Норникель", "акции", 118.7, 0.09),
+    ("ROSN", "Роснефть", "акции", 545.2, 0.14),
+    ("MGNT", "Магнит", "акции", 5120.0, 0.11),
+    ("TATN", "Татнефть", "акции", 640.8, 0.19),
+    ("SU26207RMFS9", "ОФЗ 26207", "облигации", 984.1, 0.12),
+    ("SU26212RMFS9", "ОФЗ 26212", "облигации", 901.6, 0.125),
+    ("SU26218RMFS6", "ОФЗ 26218", "облигации", 845.3, 0.13),
+    ("SU26219RMFS4", "ОФЗ 26219", "облигации", 958.0, 0.115),
+    ("GOLD", "FinEx золото", "золото", 2.34, 0.16),
+    ("RU000A0ERGA7", "ПИФ Сбер-КН", "недвижимость", 1650.0, 0.07),
+    ("RU000A0JXP78", "ЗПИФ ДОМ.РФ", "недвижимость", 1450.0, 0.08),
+]
+
+# (риск-профиль, срок в месяцах, сумма цели, стартовый капитал, цель)
+SCENARIOS = [
+    ("Консервативный", 24, 1_200_000, 300_000, "подушка безопасности"),
+    ("Умеренный", 60, 3_000_000, 500_000, "покупка квартиры"),
+    ("Умеренный", 84, 6_000_000, 0, "покупка дома"),
+    ("Агрессивный", 120, 10_000_000, 1_000_000, "пенсия"),
+    ("Агрессивный", 180, 25_000_000, 2_500_000, "образование детей"),
+]
+
+INFLATION = 0.075
+
+
+def build_recommendation(
+    service: PortfolioService, profile: str, months: int, goal: float, capital: float
+) -> PortfolioRecommendation:
+    future_value = goal * (1 + INFLATION) ** (months / 12)
+    composition = []
+    for asset_type, target_weight in service.get_portfolio_allocation(
+        profile, months / 12
+    ).items():
+        rows = [row for row in ASSETS if row[2] == asset_type]
+        assets = []
+        for ticker, name, kind, price, expected in rows:
+            weight = 1 / len(rows)
+            quantity = int(future_value * target_weight * weight / price)
+            assets.append(
+                AssetAllocation(
+                    name=name,
+                    type=kind,
+                    ticker=ticker,
+                    quantity=quantity,
+                    price=price,
+                    weight=weight,
+                    amount=quantity * price,
+                    expected_return=expected,
+                )
+            )
+        amount = sum(asset.amount for asset in assets)
+        composition.append(
+            PortfolioComposition(
+                asset_type=asset_type,
+                target_weight=target_weight,
+                actual_weight=amount / future_value,
+                amount=amount,
+                assets=assets,
+            )
+        )
+
+    expected_return = service.calculate_expected_portfolio_return(composition)
+    recommendation = PortfolioRecommendation(
+        target_amount=future_value,
+        initial_capital=capital,
+        investment_term_months=months,
+        annual_inflation_rate=INFLATION,
+        future_value_with_inflation=future_value,
+        risk_profile=profile,
+        time_horizon="short" if months <= 36 else "medium" if months <= 84 else "long",
+        smart_goal=f"Накопить {goal:.0f} ₽ за {months} мес.",
+        total_investment=sum(comp.amount for comp in composition),
+        expected_portfolio_return=expected_return,
+        composition=composition,
+        monthly_payment_detail=service.calculate_monthly_payment(
+            future_goal=future_value,
+            years=months // 12,
+            portfolio_return=expected_return,
+            start_capital=capital,
+        ),
+    )
+    recommendation.step_by_step_plan = service.generate_step_by_step_plan(
+        recommendation, capital
+    )
+    return recommendation
+
+
+def as_db_row(recommendation: PortfolioRecommendation, goal: float, reason: str):
+    """Объект в форме модели Portfolio для convert_db_to_response"""
+    plan = recommendation.step_by_step_plan
+    return SimpleNamespace(
+        target_amount=goal,
+        initial_capital=recommendation.initial_capital,
+        investment_term_months=recommendation.investment_term_months,
+        annual_inflation_rate=recommendation.annual_inflation_rate,
+        future_value_with_inflation=recommendation.future_value_with_inflation,
+        updated_at=datetime(2026, 10, 1),
+        risk_profile=recommendation.risk_profile,
+        time_horizon=recommendation.time_horizon,
+        smart_goal=f"{recommendation.smart_goal} Цель: {reason}",
+        total_investment=recommendation.total_investment,
+        expected_portfolio_return=recommendation.expected_portfolio_return,
+        portfolio_compositions=[
+            SimpleNamespace(
+                asset_type=comp.asset_type,
+                target_weight=comp.target_weight,
+                actual_weight=comp.actual_weight,
+                amount=comp.amount,
+                asset_allocations=[
+                    SimpleNamespace(
+                        asset=SimpleNamespace(
+                            name=asset.name,
+                            type=asset.type,
+                            ticker=asset.ticker,
+                            yield_value=asset.expected_return,
+                        ),
+                        quantity=asset.quantity,
+                        purchase_price=asset.price,
+                        target_weight=asset.weight,
+                    )
+                    for asset in comp.assets
+                ],
+            )
+            for comp in recommendation.composition
+        ],
+        step_by_step_plan=SimpleNamespace(
+            plan_steps=[
+                SimpleNamespace(
+                    step_number=step.step_number,
+                    title=step.title,
+                    description=step.description,
+                    step_actions=[
+                        SimpleNamespace(action_text=text, action_order=i)
+                        for i, text in enumerate(step.actions)
+                    ],
+                )
+                for step in plan.steps
+            ],
+            generated_at=datetime.fromisoformat(plan.generated_at),
+            total_steps=plan.total_steps,
+        ),
+        monthly_payment=recommendation.monthly_payment_detail,
+        calculation_explanations=[],
+    )
+
+
+def representative_portfolios() -> list:
+    """Ответы convert_db_to_response в виде jsonable_encoder, как в анализе"""
+    service = PortfolioService(None)
+    portfolios = []
+    # get_portfolio_allocation печатает отладку на каждый вызов
+    with contextlib.redirect_stdout(io.StringIO()):
+        for profile, months, goal, capital, reason in SCENARIOS:
+            recommendation = build_recommendation(
+                service, profile, months, goal, capital
+            )
+            response = service.convert_db_to_response(
+                as_db_row(recommendation, goal, reason)
+            )
+            portfolios.append(
+                (
+                    profile,
+                    months,
+                    jsonable_encoder(response, exclude=set(VOLATILE_FIELDS)),
+                )
+            )
+    return portfolios
+
+
+def main():
+    print(
+        f"{'профиль':>15} {'мес.':>5} {'JSON, токены':>13} {'компакт, токены':>16} "
+        f"{'экономия':>9} {'кодирование, мкс':>17}"
+    )
+    total_json = total_compact = 0
+    for profile, months, payload in representative_portfolios():
+        json_tokens = estimate_tokens(json.dumps(payload, ensure_ascii=False))
+
+        started = time.perf_counter()
+        for _ in range(100):
+            prompt = encode_portfolio(payload)
+        encode_time = (time.perf_counter() - started) / 100
+
+        compact_tokens = estimate_tokens(prompt)
+        total_json += json_tokens
+        total_compact += compact_tokens
+        print(
+            f"{profile:>15} {months:>5} {json_tokens:>13} {compact_tokens:>16} "
+            f"{1 - compact_tokens / json_tokens:>9.0%} {encode_time * 1e6:>17.0f}"
+        )
+    print(
+        f"Итого: {total_json} → {total_compact} "
+        f"({1 - total_compact / total_json:.0%} меньше)"
+    )
+
+
+if __name__ == "__main__":
+    main()
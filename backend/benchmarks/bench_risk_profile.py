@@ -0,0 +1,71 @@
+"""
+Бенчмарк расчета риск-профиля: анкета за анкетой через
+calculate_profile_v2 (как в /risk-profile/answers) против
+ProfileEngine.score_batch на матрице кодов ответов.
+
+Анкеты случайные: ответ на каждый вопрос и факторы цели, в том числе
+пропуски (код 0).
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_risk_profile
+"""
+
+import time
+
+import numpy as np
+
+from app.schemas.risk_profile import RiskAnswer
+from app.services.risk_profile_engine import N_COLUMNS, OPTIONS, QUESTION_COUNT, engine
+from app.services.risk_profile_service import calculate_profile_v2
+
+SINGLE_COUNT = 10_000
+BATCH_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def random_codes(count: int) -> np.ndarray:
+    return np.random.default_rng(0).integers(
+        0, 4, size=(count, N_COLUMNS), dtype=np.int8
+    )
+
+
+def as_request(row: np.ndarray) -> tuple:
+    """Ответы и факторы цели в том виде, в каком их получает API"""
+    answers = [
+        RiskAnswer(question_id=i + 1, answer=f"{OPTIONS[code - 1]}) вариант")
+        for i, code in enumerate(row[:QUESTION_COUNT])
+        if code
+    ]
+    llm_data = {
+        "horizon": OPTIONS[row[QUESTION_COUNT] - 1] if row[QUESTION_COUNT] else None,
+        "capital_size": (
+            OPTIONS[row[QUESTION_COUNT + 1] - 1] if row[QUESTION_COUNT + 1] else None
+        ),
+    }
+    return answers, llm_data
+
+
+def main():
+    requests = [as_request(row) for row in random_codes(SINGLE_COUNT)]
+    started = time.perf_counter()
+    for answers, llm_data in requests:
+        calculate_profile_v2(answers, llm_data)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{'calculate_profile_v2':>22} {SINGLE_COUNT:>9} анкет "
+        f"{SINGLE_COUNT / elapsed:>12,.0f} анкет/с"
+    )
+
+    for size in BATCH_SIZES:
+        codes = random_codes(size)
+        engine.score_batch(codes[:1000])
+        started = time.perf_counter()
+        result = engine.score_batch(codes)
+        elapsed = time.perf_counter() - started
+        shares = np.bincount(result["profile"], minlength=3) / size
+        print(
+            f"{'score_batch':>22} {size:>9} анкет {size / elapsed:>12,.0f} анкет/с  "
+            f"профили К/У/А {shares[0]:.0%}/{shares[1]:.0%}/{shares[2]:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк микробатчинга Whisper: пропускная способность и задержка
+при 1, 4 и 16 одновременных клиентах, без батчей (размер батча 1) и
+с батчами WHISPER_BATCH_SIZE.
+
+Каждый клиент отправляет одну и ту же запись через
+WhisperProcessor.stream_file, как голосовое сообщение в /dialog/chat/stream.
+Пропускная способность — секунды записи, распознанные за секунду
+(больше — лучше), задержка — от отправки до полного текста.
+
+Запись передается аргументом (любой формат, который читает ffmpeg).
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_whisper_batching clip.ogg [модель] [воркеры]
+"""
+
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from app.services.audio_stream import SAMPLE_RATE, read_pcm
+from app.services.whisper_batcher import WHISPER_BATCH_SIZE
+from app.services.whisper_processor import WhisperProcessor
+
+CLIENTS = [1, 4, 16]
+
+
+async def request(processor: WhisperProcessor, clip: str) -> float:
+    """Одно сообщение: копия записи, как после spool_upload"""
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(clip)[1])
+    os.close(fd)
+    shutil.copyfile(clip, path)
+
+    started = time.perf_counter()
+    async for _ in processor.stream_file(path, os.path.basename(clip)):
+        pass
+    return time.perf_counter() - started
+
+
+async def measure(processor: WhisperProcessor, clip: str, clients: int) -> tuple:
+    batches, items = processor.batcher.batches, processor.batcher.items
+    started = time.perf_counter()
+    latencies = await asyncio.gather(
+        *[request(processor, clip) for _ in range(clients)]
+    )
+    elapsed = time.perf_counter() - started
+    batch_size = (processor.batcher.items - items) / max(
+        1, processor.batcher.batches - batches
+    )
+    return elapsed, sorted(latencies), batch_size
+
+
+async def run(processor: WhisperProcessor, clip: str, duration: float) -> None:
+    await processor.warm_up()
+    for clients in CLIENTS:
+        elapsed, latencies, batch_size = await measure(processor, clip, clients)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{processor.batcher.max_batch:>6} {clients:>8} {batch_size:>13.1f} "
+            f"{clients * duration / elapsed:>13.2f} "
+            f"{statistics.median(latencies):>10.1f} {p95:>9.1f}"
+        )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    clip = sys.argv[1]
+    model_type = sys.argv[2] if len(sys.argv) > 2 else "base"
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    duration = sum(len(chunk) for chunk in read_pcm(clip)) / SAMPLE_RATE
+    print(f"Запись {duration:.1f}с, модель {model_type}, воркеров {workers}")
+    print(
+        f"{'батч':>6} {'клиенты':>8} {'фраз в батче':>13} {'с записи/с':>13} "
+        f"{'p50, с':>10} {'p95, с':>9}"
+    )
+
+    for max_batch in (1, WHISPER_BATCH_SIZE):
+        processor = WhisperProcessor(
+            model_type, workers=workers, max_queue=max(CLIENTS), max_batch=max_batch
+        )
+        try:
+            asyncio.run(run(processor, clip, duration))
+        finally:
+            processor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
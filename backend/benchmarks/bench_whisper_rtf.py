@@ -0,0 +1,65 @@
+"""
+Бенчмарк скорости Whisper по размерам модели: время загрузки и
+real-time factor (время распознавания / длительность записи) на
+эталонной русской записи, в fp32 и с int8 квантизацией на CPU.
+RTF < 1 — быстрее реального времени.
+
+Запись передается аргументом (любой формат, который читает ffmpeg),
+модели скачиваются whisper в ~/.cache/whisper при первом запуске.
+
+Запуск: PYTHONPATH=. python -m benchmarks.bench_whisper_rtf clip.ogg [tiny base small ...]
+"""
+
+import sys
+import time
+
+import whisper
+
+from app.services.audio_stream import SAMPLE_RATE
+from app.services.whisper_worker import get_best_device, load_model
+
+MODEL_TIERS = ["tiny", "base", "small", "medium", "turbo"]
+
+
+def measure(model_type: str, device: str, int8: bool, audio) -> tuple:
+    started = time.perf_counter()
+    model = load_model(model_type, device, int8)
+    load_time = time.perf_counter() - started
+
+    # Первый прогон прогревает модель, как warm_up в воркере
+    model.transcribe(
+        audio[:SAMPLE_RATE], language="ru", fp16=device == "cuda", verbose=None
+    )
+
+    started = time.perf_counter()
+    result = model.transcribe(audio, language="ru", fp16=device == "cuda", verbose=None)
+    elapsed = time.perf_counter() - started
+    return load_time, elapsed, result["text"].strip()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    audio = whisper.load_audio(sys.argv[1])
+    duration = len(audio) / SAMPLE_RATE
+    tiers = sys.argv[2:] or MODEL_TIERS
+    device = get_best_device()
+    print(f"Запись {duration:.1f}с, устройство {device}")
+    print(
+        f"{'модель':>8} {'int8':>5} {'загрузка, с':>12} "
+        f"{'распознавание, с':>17} {'RTF':>6}  текст"
+    )
+
+    for model_type in tiers:
+        for int8 in (False, True) if device == "cpu" else (False,):
+            load_time, elapsed, text = measure(model_type, device, int8, audio)
+            print(
+                f"{model_type:>8} {'да' if int8 else 'нет':>5} {load_time:>12.1f} "
+                f"{elapsed:>17.1f} {elapsed / duration:>6.2f}  {text[:60]}"
+            )
+
+
+if __name__ == "__main__":
+    main()
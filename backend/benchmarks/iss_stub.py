@@ -0,0 +1,130 @@
+"""Локальная заглушка ISS MOEX для бенчмарков и тестов"""
+
+import asyncio
+import contextlib
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict
+
+from aiohttp import web
+
+HISTORY_COLUMNS = ["TRADEDATE", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
+HISTORY_DAYS = 4 * 365
+PAGE_SIZE = 100
+
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    failures_left: Dict[str, int] = field(default_factory=dict)
+
+
+def _price_for(ticker: str, day: datetime.date) -> float:
+    """Детерминированная «цена» тикера на дату"""
+    base = 100 + sum(ord(c) for c in ticker) % 900
+    return round(base * (1 + 0.0003 * (day.toordinal() % 365)), 2)
+
+
+def _history_row(ticker: str, day: datetime.date) -> list:
+    price = _price_for(ticker, day)
+    return [
+        day.isoformat(),
+        price,
+        round(price * 1.01, 2),
+        round(price * 0.99, 2),
+        round(price * 1.002, 2),
+        1000 + day.toordinal() % 500,
+    ]
+
+
+def create_stub_app(latency: float = 0.05, stats: StubStats = None) -> web.Application:
+    stats = stats if stats is not None else StubStats()
+
+    @web.middleware
+    async def track(request, handler):
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep(latency)
+            ticker = request.match_info.get("ticker", "")
+            if stats.failures_left.get(ticker, 0) > 0:
+                stats.failures_left[ticker] -= 1
+                return web.Response(status=503)
+            return await handler(request)
+        finally:
+            stats.in_flight -= 1
+
+    async def marketdata(request):
+        ticker = request.match_info["ticker"]
+        price = _price_for(ticker, datetime.date.today())
+        return web.json_response(
+            {"marketdata": {"columns": ["SECID", "OPEN"], "data": [[ticker, price]]}}
+        )
+
+    async def history(request):
+        ticker = request.match_info["ticker"]
+        query = request.query
+        today = datetime.date.today()
+
+        if "from" in query:
+            first = datetime.date.fromisoformat(query["from"])
+            till = datetime.date.fromisoformat(query.get("till", today.isoformat()))
+        else:
+            first = today - datetime.timedelta(days=HISTORY_DAYS)
+            till = today
+
+        days = [
+            first + datetime.timedelta(days=i)
+            for i in range((till - first).days + 1)
+            if (first + datetime.timedelta(days=i)).weekday() < 5
+        ]
+
+        columns = HISTORY_COLUMNS
+        if "history.columns" in query:
+            columns = query["history.columns"].split(",")
+        indexes = [HISTORY_COLUMNS.index(column) for column in columns]
+
+        start = int(query.get("start", 0))
+        page_size = min(int(query.get("limit", PAGE_SIZE)), PAGE_SIZE)
+        page = [_history_row(ticker, day) for day in days[start : start + page_size]]
+        return web.json_response(
+            {
+                "history": {
+                    "columns": columns,
+                    "data": [[row[i] for i in indexes] for row in page],
+                },
+                "history.cursor": {
+                    "columns": ["INDEX", "TOTAL", "PAGESIZE"],
+                    "data": [[start, len(days), page_size]],
+                },
+            }
+        )
+
+    app = web.Application(middlewares=[track])
+    app["stats"] = stats
+    app.router.add_get(
+        "/iss/engines/{engine}/markets/{market}/securities/{ticker}.json", marketdata
+    )
+    app.router.add_get(
+        "/iss/history/engines/{engine}/markets/{market}/securities/{ticker}.json",
+        history,
+    )
+    return app
+
+
+@contextlib.asynccontextmanager
+async def run_stub_iss(latency: float = 0.05, stats: StubStats = None):
+    """Поднимает заглушку на свободном порту и отдает (base_url, stats)"""
+    app = create_stub_app(latency, stats)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/iss", app["stats"]
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,119 @@
+"""Локальная заглушка OpenAI-совместимого API (OpenRouter) для бенчмарков и тестов"""
+
+import asyncio
+import contextlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from aiohttp import web
+
+
+@dataclass
+class OpenAIStubStats:
+    requests: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    # Сколько ответов 429 отдать по каждому ключу
+    rate_limited: Dict[str, int] = field(default_factory=dict)
+    keys: List[str] = field(default_factory=list)
+    bodies: List[dict] = field(default_factory=list)
+
+
+def _chunk(content: str = None, finish_reason: str = None) -> dict:
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def create_stub_app(
+    chunks: List[str],
+    first_token_delay: float = 0.2,
+    token_delay: float = 0.05,
+    stats: OpenAIStubStats = None,
+) -> web.Application:
+    """
+    Ответ модели задается списком фрагментов. Первый фрагмент приходит
+    через first_token_delay, следующие — каждые token_delay секунд
+    """
+    stats = stats if stats is not None else OpenAIStubStats()
+
+    async def completions(request):
+        body = await request.json()
+        key = request.headers.get("Authorization", "").split()[-1]
+        stats.requests += 1
+        stats.keys.append(key)
+        stats.bodies.append(body)
+        if stats.rate_limited.get(key, 0) > 0:
+            stats.rate_limited[key] -= 1
+            return web.json_response(
+                {"error": {"message": "rate limit exceeded", "code": 429}}, status=429
+            )
+
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            if not body.get("stream"):
+                await asyncio.sleep(first_token_delay + token_delay * (len(chunks) - 1))
+                return web.json_response(
+                    {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": "stub",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {
+                                    "role": "assistant",
+                                    "content": "".join(chunks),
+                                },
+                            }
+                        ],
+                    }
+                )
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for i, content in enumerate(chunks):
+                await asyncio.sleep(first_token_delay if i == 0 else token_delay)
+                payload = json.dumps(_chunk(content), ensure_ascii=False)
+                await response.write(f"data: {payload}\n\n".encode())
+            payload = json.dumps(_chunk(finish_reason="stop"))
+            await response.write(f"data: {payload}\n\ndata: [DONE]\n\n".encode())
+            await response.write_eof()
+            return response
+        finally:
+            stats.in_flight -= 1
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+@contextlib.asynccontextmanager
+async def run_stub_openai(
+    chunks: List[str],
+    first_token_delay: float = 0.2,
+    token_delay: float = 0.05,
+    stats: OpenAIStubStats = None,
+):
+    """Поднимает заглушку на свободном порту и отдает (base_url, stats)"""
+    app = create_stub_app(chunks, first_token_delay, token_delay, stats)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/v1", app["stats"]
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,204 @@
+import asyncio
+import contextlib
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+from benchmarks.openai_stub import OpenAIStubStats, run_stub_openai
+from fastapi.testclient import TestClient
+
+from app.core.dependencies import get_current_user
+from app.main import app
+from app.services import analysis_jobs, llm_service
+from app.services.llm_key_pool import KeyPool
+from app.services.portfolio_analysis_service import (
+    PortfolioAnalysisService,
+    analysis_content_hash,
+)
+from app.tasks import analysis_tasks
+
+
+@pytest.fixture
+def user():
+    user = SimpleNamespace(id=random.randint(10**6, 10**9))
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_analyze_returns_job_and_result_is_polled(monkeypatch, user):
+    queued = []
+    monkeypatch.setattr(
+        analysis_tasks.analyze_portfolio_task,
+        "delay",
+        lambda *args: queued.append(args),
+    )
+    client = TestClient(app)
+
+    response = client.post("/portfolios/analyze", json={"portfolio_id": "7"})
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert queued == [(user.id, "7", job["job_id"], False)]
+    assert (
+        client.get(f"/portfolios/analyze/{job['job_id']}").json()["status"] == "queued"
+    )
+    assert client.get("/portfolios/analyze/unknown").status_code == 404
+
+    asyncio.run(
+        analysis_jobs.update_job(
+            user.id, job["job_id"], status="done", analysis="Отлично"
+        )
+    )
+    events = client.get(f"/portfolios/analyze/{job['job_id']}/events").text
+    event, data = events.strip().split("\n")
+    assert event == "event: done"
+    assert json.loads(data[len("data: ") :])["analysis"] == "Отлично"
+
+
+def test_task_records_result_and_failure(monkeypatch):
+    class FakeService:
+        async def analyze_portfolio(self, user_id, portfolio_id, force=False):
+            if portfolio_id == "404":
+                raise ValueError("Портфель 404 не найден")
+            return f"Анализ {portfolio_id}"
+
+    monkeypatch.setattr(analysis_tasks, "PortfolioAnalysisService", FakeService)
+    user_id = random.randint(10**6, 10**9)
+    done = asyncio.run(analysis_jobs.create_job(user_id, "1"))
+    failed = asyncio.run(analysis_jobs.create_job(user_id, "404"))
+
+    analysis_tasks.analyze_portfolio_task(user_id, "1", done["job_id"])
+    analysis_tasks.analyze_portfolio_task(user_id, "404", failed["job_id"])
+
+    done = asyncio.run(analysis_jobs.get_job(user_id, done["job_id"]))
+    failed = asyncio.run(analysis_jobs.get_job(user_id, failed["job_id"]))
+    assert (done["status"], done["analysis"]) == ("done", "Анализ 1")
+    assert (failed["status"], failed["error"]) == ("failed", "Портфель 404 не найден")
+
+
+def test_db_session_is_released_while_waiting_for_llm(monkeypatch):
+    open_sessions = []
+
+    @contextlib.asynccontextmanager
+    async def session_factory():
+        open_sessions.append(1)
+        try:
+            yield SimpleNamespace()
+        finally:
+            open_sessions.pop()
+
+    service = PortfolioAnalysisService(session_factory=session_factory)
+
+    async def load(db_session, user_id, portfolio_id):
+        assert open_sessions
+        return {"id": portfolio_id}, None
+
+    async def complete(portfolio_dict):
+        assert not open_sessions
+        return "Анализ"
+
+    saved = []
+
+    async def save(db_session, portfolio_id, text, content_hash):
+        assert open_sessions
+        saved.append((portfolio_id, text))
+
+    monkeypatch.setattr(service, "_load_portfolio", load)
+    monkeypatch.setattr(service, "_complete", complete)
+    monkeypatch.setattr(service, "_save_analysis_explanation", save)
+
+    assert (
+        asyncio.run(service.analyze_portfolio(user_id=1, portfolio_id="5")) == "Анализ"
+    )
+    assert saved == [(5, "Анализ")]
+
+
+def test_unchanged_portfolio_reuses_stored_analysis(monkeypatch):
+    @contextlib.asynccontextmanager
+    async def session_factory():
+        yield SimpleNamespace()
+
+    service = PortfolioAnalysisService(session_factory=session_factory)
+    service.model = "analysis-model"
+    portfolio = {
+        "target_amount": 1_000_000.0,
+        "recommendation": {"risk_profile": "умеренный"},
+    }
+    stored = SimpleNamespace(
+        explanation_text="Прошлый анализ",
+        content_hash=analysis_content_hash(portfolio, "analysis-model"),
+    )
+    calls = []
+
+    async def load(db_session, user_id, portfolio_id):
+        return json.loads(json.dumps(portfolio)), stored
+
+    async def complete(portfolio_dict):
+        calls.append(portfolio_dict)
+        return "Новый анализ"
+
+    async def save(db_session, portfolio_id, text, content_hash):
+        stored.explanation_text, stored.content_hash = text, content_hash
+
+    monkeypatch.setattr(service, "_load_portfolio", load)
+    monkeypatch.setattr(service, "_complete", complete)
+    monkeypatch.setattr(service, "_save_analysis_explanation", save)
+
+    async def run(**kwargs):
+        return await service.analyze_portfolio(user_id=1, portfolio_id=5, **kwargs)
+
+    assert asyncio.run(run()) == "Прошлый анализ"
+    assert calls == []
+
+    assert asyncio.run(run(force=True)) == "Новый анализ"
+    assert len(calls) == 1
+
+    portfolio["target_amount"] = 2_000_000.0
+    service.model = "other-model"
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert asyncio.run(run()) == "Новый анализ"
+    assert len(calls) == 2
+
+
+def test_event_stream_gives_up_on_a_stuck_job(monkeypatch, user):
+    monkeypatch.setattr("app.api.routes_portfolios.ANALYSIS_STREAM_TIMEOUT", 0.2)
+    monkeypatch.setattr("app.api.routes_portfolios.ANALYSIS_JOB_POLL_INTERVAL", 0.05)
+    job = asyncio.run(analysis_jobs.create_job(user.id, "7"))
+    asyncio.run(analysis_jobs.update_job(user.id, job["job_id"], status="running"))
+
+    events = TestClient(app).get(f"/portfolios/analyze/{job['job_id']}/events").text
+
+    status, error = events.strip().split("\n\n")
+    assert status.startswith("event: status")
+    event, data = error.split("\n")
+    assert event == "event: error"
+    assert json.loads(data[len("data: ") :])["status"] == "failed"
+
+
+def test_analysis_retries_rate_limit_through_shared_completion(monkeypatch):
+    stats = OpenAIStubStats(rate_limited={"key-1": 1})
+    monkeypatch.setattr(
+        llm_service, "key_pool", KeyPool(["key-1", "key-2"], use_redis=False)
+    )
+    service = PortfolioAnalysisService()
+    service.model = "analysis-model"
+
+    async def run():
+        async with run_stub_openai(
+            ["Портфель сбалансирован"], first_token_delay=0, stats=stats
+        ) as (
+            base_url,
+            _,
+        ):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            analysis = await service._complete({"target_amount": 1})
+            await llm_service.close_clients()
+            return analysis
+
+    assert asyncio.run(run()) == "Портфель сбалансирован"
+    assert stats.keys == ["key-1", "key-2"]
+    assert stats.bodies[-1]["model"] == "analysis-model"
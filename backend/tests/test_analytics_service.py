@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+
+from app.services import analytics_service as analytics
+from app.services.moex_service import calculate_yield_and_volatility
+
+
+def _loop_volatility(prices):
+    returns = [np.log(prices[i] / prices[i - 1]) for i in range(1, len(prices))]
+    return float(np.std(returns) * np.sqrt(252))
+
+
+def test_volatility_matches_per_asset_loop():
+    rng = np.random.default_rng(0)
+    series = [
+        list(100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))) for n in (5, 40, 252)
+    ]
+
+    volatility = analytics.annualised_volatility(
+        analytics.log_returns(analytics.stack_series(series))
+    )
+
+    np.testing.assert_allclose(volatility, [_loop_volatility(s) for s in series])
+
+
+def test_gaps_bridge_to_previous_available_price():
+    prices = np.array([[100.0, np.nan, 121.0, 110.0]])
+
+    returns = analytics.log_returns(prices)
+
+    np.testing.assert_allclose(returns[0, 1:], [np.log(1.21), np.log(110 / 121)])
+    assert np.isnan(returns[0, 0])
+    np.testing.assert_allclose(analytics.max_drawdown(prices), [110 / 121 - 1])
+
+
+def test_cagr_and_covariance():
+    dates = np.array(["2021-01-01", "2022-01-01", "2023-01-01"], dtype="datetime64[D]")
+    prices = np.array([[100.0, 110.0, 121.0], [np.nan, 50.0, 50.0]])
+
+    growth = analytics.cagr_from_matrix(prices, dates)
+    assert abs(growth[0] - 0.1) < 1e-3
+    assert growth[1] == 0.0
+
+    rng = np.random.default_rng(1)
+    returns = rng.normal(0, 0.01, (3, 500))
+    np.testing.assert_allclose(
+        analytics.covariance_matrix(returns, periods=1), np.cov(returns)
+    )
+    np.testing.assert_allclose(
+        analytics.correlation_matrix(returns), np.corrcoef(returns)
+    )
+
+
+def test_calculate_yield_and_volatility_uses_fallbacks():
+    three_years_ago = datetime.date.today() - datetime.timedelta(days=3 * 365)
+    price_data = {
+        "SBER": {
+            "name": "Сбербанк",
+            "ticker": "SBER",
+            "asset_type": "акция",
+            "current_price": 133.1,
+            "historical_price": 100.0,
+            "historical_date": three_years_ago,
+            "historical_prices_series": [100.0, 101.0, 99.0, 102.0],
+        },
+        "SU26219RMFS4": {
+            "name": "ОФЗ 26219",
+            "ticker": "SU26219RMFS4",
+            "asset_type": "облигация краткосрочная",
+            "current_price": 0.0,
+            "historical_price": 0.0,
+            "historical_date": None,
+            "historical_prices_series": [95.0],
+        },
+    }
+
+    results = calculate_yield_and_volatility(price_data)
+
+    assert abs(results["SBER"]["yield_value"] - 0.1) < 1e-3
+    expected_volatility = _loop_volatility([100.0, 101.0, 99.0, 102.0])
+    assert abs(results["SBER"]["volatility"] - expected_volatility) < 1e-12
+    assert results["SU26219RMFS4"]["yield_value"] == 0.08
+    assert results["SU26219RMFS4"]["volatility"] == 0.05
@@ -0,0 +1,94 @@
+import asyncio
+
+from app.core.redis_cache import cache
+from app.models.asset import Asset
+from app.services.asset_universe import AssetUniverse
+
+
+class CountingRepo:
+    def __init__(self, assets):
+        self.assets = assets
+        self.calls = 0
+
+    async def get_all_assets(self, db_session):
+        self.calls += 1
+        return self.assets
+
+
+ASSETS = [
+    Asset(
+        id=3,
+        name="ОФЗ 26219",
+        ticker="SU26219RMFS4",
+        type="облигация краткосрочная",
+        price_now=95.0,
+    ),
+    Asset(id=1, name="Сбербанк", ticker="SBER", type="акция", price_now=300.0),
+    Asset(
+        id=2,
+        name="ОФЗ 26218",
+        ticker="SU26218RMFS6",
+        type="облигация долгосрочная",
+        price_now=90.0,
+    ),
+    Asset(id=4, name="FinEx золото", ticker="GOLD", type="золото", price_now=2.0),
+]
+
+
+def test_snapshot_indexes_and_serves_from_memory():
+    repo = CountingRepo(ASSETS)
+    universe = AssetUniverse(repo=repo)
+
+    async def run():
+        first = await universe.get(db_session=None)
+        second = await universe.get(db_session=None)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first is second
+    assert repo.calls == 1
+    assert [a.ticker for a in first.by_type("облигация")] == [
+        "SU26218RMFS6",
+        "SU26219RMFS4",
+    ]
+    assert [a.ticker for a in first.by_tenor("краткосрочная")] == ["SU26219RMFS4"]
+    assert [a.ticker for a in first.by_type("акция")] == ["SBER"]
+    assert first.by_ticker["GOLD"].price_now == 2.0
+
+
+def test_invalidate_reloads_with_new_version():
+    repo = CountingRepo(ASSETS)
+    universe = AssetUniverse(repo=repo)
+
+    async def run():
+        first = await universe.get(db_session=None)
+        universe.invalidate()
+        return first, await universe.get(db_session=None)
+
+    first, second = asyncio.run(run())
+
+    assert repo.calls == 2
+    assert second.version == first.version + 1
+
+
+class SyncClient:
+    def __init__(self):
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+        raise ConnectionError("Redis недоступен")
+
+
+def test_get_does_not_ping_sync_redis_on_the_event_loop(monkeypatch):
+    client = SyncClient()
+    monkeypatch.setattr(cache, "client", client)
+    monkeypatch.setattr(cache, "_available", False)
+    monkeypatch.setattr(cache, "_next_attempt", 0.0)
+    universe = AssetUniverse(repo=CountingRepo(ASSETS))
+
+    snapshot = asyncio.run(universe.get(db_session=None))
+
+    assert len(snapshot.assets) == 4
+    assert client.pings == 0
@@ -0,0 +1,57 @@
+import numpy as np
+
+from app.services.audio_stream import SAMPLE_RATE, VadSegmenter
+
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def segment(audio: np.ndarray, chunk: int) -> list:
+    segmenter = VadSegmenter(min_silence=0.5, max_segment=28)
+    segments = []
+    for start in range(0, len(audio), chunk):
+        segments += segmenter.feed(audio[start : start + chunk])
+    return segments + segmenter.finish()
+
+
+def test_segments_split_on_pauses_and_window_limit():
+    audio = np.concatenate(
+        [
+            silence(2),
+            tone(1),
+            silence(1),
+            tone(2),
+            silence(1),
+            tone(0.05),
+            silence(1),  # щелчок, а не речь
+            tone(35),
+        ]
+    )
+
+    durations = [len(s) / SAMPLE_RATE for s in segment(audio, SAMPLE_RATE)]
+
+    assert len(durations) == 4
+    assert 1.2 <= durations[0] <= 1.5  # фраза и отступы по краям
+    assert 2.2 <= durations[1] <= 2.5
+    assert 27.5 <= durations[2] <= 28.0
+    assert 7.0 <= durations[3] <= 7.7
+    assert sum(durations) < len(audio) / SAMPLE_RATE - 3  # тишина отброшена
+
+
+def test_chunk_size_does_not_change_segments():
+    audio = np.concatenate(
+        [tone(1.3), silence(0.8), tone(0.7), silence(0.1), tone(0.4)]
+    )
+
+    whole = segment(audio, len(audio))
+    streamed = segment(audio, 777)
+
+    assert len(whole) == len(streamed) == 2
+    for a, b in zip(whole, streamed):
+        np.testing.assert_array_equal(a, b)
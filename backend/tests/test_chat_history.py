@@ -0,0 +1,79 @@
+import asyncio
+import uuid
+
+from app.services import chat_history
+
+
+def run_dialog(user_id: str, turns: int):
+    async def run():
+        for i in range(turns):
+            await chat_history.append_message(user_id, "user", f"Вопрос номер {i}")
+            await chat_history.append_message(user_id, "assistant", f"Ответ номер {i}")
+        await chat_history.remember_goal(
+            user_id, {"term": 60, "sum": "false", "reason": "квартира", "capital": None}
+        )
+        stored = await chat_history.get_messages(user_id)
+        prompt = await chat_history.build_prompt(user_id)
+        await chat_history.clear(user_id)
+        return stored, prompt
+
+    return asyncio.run(run())
+
+
+def test_long_dialog_is_compacted_into_summary_and_goal():
+    stored, prompt = run_dialog(uuid.uuid4().hex, turns=40)
+
+    assert len(stored) <= chat_history.CHAT_HISTORY_WINDOW
+    assert stored[-1] == {"role": "assistant", "content": "Ответ номер 39"}
+
+    system, recent = prompt[0], prompt[1:]
+    assert system["role"] == "system"
+    assert recent == stored
+    # Сообщение прямо перед окном попало в краткое содержание: разрыва нет
+    dialog = [
+        text for i in range(40) for text in (f"Вопрос номер {i}", f"Ответ номер {i}")
+    ]
+    previous = dialog[dialog.index(stored[0]["content"]) - 1]
+    assert system["content"].split("\n\n")[0].endswith(previous)
+    assert "Вопрос номер 0\n" not in system["content"]
+    assert (
+        "срок, мес.: 60" in system["content"] and "цель: квартира" in system["content"]
+    )
+    assert "сумма" not in system["content"]
+
+
+def test_short_dialog_is_sent_as_is(monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_HISTORY_WINDOW", 50)
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        await chat_history.append_message(user_id, "user", "Привет")
+        await chat_history.append_message(user_id, "assistant", "Здравствуйте!")
+        prompt = await chat_history.build_prompt(user_id)
+        await chat_history.clear(user_id)
+        return prompt
+
+    assert asyncio.run(run()) == [
+        {"role": "user", "content": "Привет"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+
+
+def test_token_budget_drops_oldest_but_keeps_last_message(monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_HISTORY_TOKEN_BUDGET", 50)
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        await chat_history.append_message(user_id, "user", "а" * 100)
+        await chat_history.append_message(user_id, "user", "б" * 400)
+        prompt = await chat_history.build_prompt(user_id)
+        await chat_history.clear(user_id)
+        return prompt
+
+    assert asyncio.run(run()) == [{"role": "user", "content": "б" * 400}]
+
+
+def test_estimate_tokens_counts_cyrillic_denser():
+    assert chat_history.estimate_tokens("a" * 400) < chat_history.estimate_tokens(
+        "я" * 400
+    )
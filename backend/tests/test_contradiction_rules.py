@@ -0,0 +1,137 @@
+import random
+import time
+
+import numpy as np
+
+from app.services.contradiction_rules import CONTRADICTION_RULES, ContradictionMatcher
+from app.services.risk_profile_engine import ProfileEngine, encode_answers
+from app.services.risk_profile_service import check_all_contradictions
+
+
+def legacy_codes(answers: dict, llm_data: dict = None) -> list:
+    """Порядок и условия прежней if-цепочки check_all_contradictions"""
+    codes = []
+    if llm_data:
+        if llm_data.get("capital_size") == "A" and answers.get(8) == "C":
+            codes.append("small_capital_high_return")
+        if answers.get(1) == "A" and llm_data.get("capital_size") == "C":
+            codes.append("beginner_large_capital")
+    if answers.get(6) == "A" and answers.get(7) == "C":
+        codes.append("low_risk_buy_dip")
+    if answers.get(1) == "A" and answers.get(2) == "C":
+        codes.append("no_experience_self_management")
+    return codes
+
+
+def test_rules_match_legacy_checks():
+    rng = random.Random(3)
+    for _ in range(5000):
+        answers = {q: rng.choice("ABC") for q in range(1, 12) if rng.random() > 0.1}
+        llm_data = None
+        if rng.random() > 0.3:
+            llm_data = {"horizon": rng.choice("ABC"), "capital_size": rng.choice("ABC")}
+
+        found = check_all_contradictions(answers, llm_data)
+
+        assert [c["code"] for c in found] == legacy_codes(answers, llm_data)
+
+
+def test_contradiction_carries_question_and_options():
+    found = check_all_contradictions({6: "A", 7: "C"})
+
+    assert found == [
+        {
+            "code": "low_risk_buy_dip",
+            "question": "Вы указали низкую терпимость к просадкам, "
+            "но готовы докупать при падении. Что для вас приоритетнее?",
+            "options": [
+                "A) Сохранение капитала важнее",
+                "B) Готов к умеренному риску для роста",
+            ],
+        }
+    ]
+
+
+def test_clarification_effects_use_offered_options():
+    for rule in CONTRADICTION_RULES:
+        if rule.get("when"):
+            letters = {option[0] for option in rule["options"]}
+            assert set(rule.get("effects", {})) <= letters, rule["code"]
+
+
+def test_new_rule_is_data_for_matcher_and_engine():
+    rule = {
+        "code": "short_horizon_high_share",
+        "when": {"horizon": "A", 5: ("B", "C")},
+        "question": "Короткий срок и большая доля дохода в инвестициях. Уверены?",
+        "options": ["A) Снижу долю", "B) Оставлю"],
+        "effects": {"A": {5: "A"}},
+    }
+    rules = CONTRADICTION_RULES + [rule]
+    matcher = ContradictionMatcher(rules)
+    engine = ProfileEngine(
+        contradictions=[(r["code"], r["when"]) for r in rules if r.get("when")],
+        clarification_effects={("short_horizon_high_share", "A"): {5: "A"}},
+    )
+    llm_data = {"horizon": "A", "capital_size": "B"}
+
+    for share, expected in (("A", False), ("B", True), ("C", True)):
+        answers = {5: share}
+        found = [c["code"] for c in matcher.match(answers, llm_data)]
+        codes = encode_answers(answers, llm_data)
+        assert ("short_horizon_high_share" in found) is expected
+        assert ("short_horizon_high_share" in engine.contradictions(codes)) is expected
+        assert (
+            engine.score_batch(np.array([codes]))["contradictions"][0, -1] == expected
+        )
+
+    clarified = engine.clarify(
+        encode_answers({5: "C"}, llm_data), [{"code": rule["code"], "answer": "A"}]
+    )
+    assert engine.contradictions(clarified) == []
+
+
+def test_factor_rule_without_goal_matches_nowhere():
+    # Без цели горизонт не подставляется из вопроса 1 в условия
+    rules = [
+        {"code": "x", "when": {"horizon": "A", 5: "B"}, "question": "", "options": []}
+    ]
+    engine = ProfileEngine(
+        contradictions=[("x", rules[0]["when"])], clarification_effects={}
+    )
+    answers = {1: "A", 5: "B"}
+    codes = encode_answers(answers)
+
+    assert ContradictionMatcher(rules).match(answers) == []
+    assert engine.contradictions(codes) == []
+    assert not engine.score_batch(np.array([codes]))["contradictions"][0, 0]
+    assert engine.profile(codes).investment_horizon == "До 3 лет"
+    assert engine.score_batch(np.array([codes]))["horizon"][0] == 1
+
+
+def test_matching_time_does_not_grow_with_unrelated_rules():
+    answers = {q: "A" for q in range(1, 12)}
+    llm_data = {"horizon": "A", "capital_size": "C"}
+    unrelated = [
+        {
+            "code": f"rule_{i}",
+            "when": {100 + i % 50: "B", "income": str(i)},
+            "question": "",
+            "options": [],
+        }
+        for i in range(20_000)
+    ]
+    small = ContradictionMatcher()
+    large = ContradictionMatcher(CONTRADICTION_RULES + unrelated)
+
+    def best_time(matcher):
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            for _ in range(2000):
+                matcher.match(answers, llm_data)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    assert large.match(answers, llm_data) == small.match(answers, llm_data)
+    assert best_time(large) < 2 * best_time(small)
@@ -0,0 +1,170 @@
+import datetime
+import time
+
+from app.services.goal_extractor import extract_goal_fields
+
+YEARS_TO_2030 = (2030 - datetime.date.today().year) * 12
+
+# (сообщение, ожидаемые поля); поля, которых нет в ожидании, извлекаться не должны
+CORPUS = [
+    (
+        "Хочу накопить на квартиру 3 млн за 5 лет, есть 500 тыс",
+        {
+            "term": 60,
+            "sum": 3_000_000,
+            "capital": 500_000,
+            "reason": "покупка квартиры",
+        },
+    ),
+    ("хочу накопить на квартиру за 5 лет", {"term": 60, "reason": "покупка квартиры"}),
+    (
+        "Мне 30 лет, хочу машину за 2 млн через полтора года",
+        {"term": 18, "sum": 2_000_000, "reason": "покупка автомобиля"},
+    ),
+    (
+        "хочу накопить миллион на свадьбу, накоплений нет",
+        {"sum": 1_000_000, "capital": 0, "reason": "свадьба"},
+    ),
+    (
+        "откладываю 40 тысяч в месяц, хочу на пенсию 10 000 000 рублей через 20 лет",
+        {"term": 240, "sum": 10_000_000, "reason": "пенсия"},
+    ),
+    (
+        "у меня есть 1 500 000 ₽, нужно 5,5 млн на дом",
+        {"capital": 1_500_000, "sum": 5_500_000, "reason": "покупка дома"},
+    ),
+    ("Цель — образование детей", {"reason": "образование"}),
+    ("5 лет", {"term": 60}),
+    ("за пять лет", {"term": 60}),
+    ("через 10 месяцев", {"term": 10}),
+    ("на полгода", {"term": 6}),
+    ("срок 3 года", {"term": 36}),
+    (
+        "к 2030 году хочу накопить 4 млн на квартиру",
+        {"term": YEARS_TO_2030, "sum": 4_000_000, "reason": "покупка квартиры"},
+    ),
+    (
+        "хочу купить квартиру в 2030 г., есть 1 млн",
+        {"term": YEARS_TO_2030, "capital": 1_000_000, "reason": "покупка квартиры"},
+    ),
+    (
+        "в 2030 году хочу накопить 4 млн на квартиру",
+        {"term": YEARS_TO_2030, "sum": 4_000_000, "reason": "покупка квартиры"},
+    ),
+    (
+        "в 2015 году отложил 300 тыс, хочу накопить 2 млн",
+        {"sum": 2_000_000, "capital": 300_000},
+    ),
+    ("нужно 800 тыс. на ремонт", {"sum": 800_000, "reason": "ремонт"}),
+    ("Стартовый капитал 200к", {"capital": 200_000}),
+    ("Могу вложить 300 000 рублей сразу", {"capital": 300_000}),
+    (
+        "хочу собрать 2.5 млн на первоначальный взнос по ипотеке",
+        {"sum": 2_500_000, "reason": "первоначальный взнос по ипотеке"},
+    ),
+    (
+        "Коплю на машину, нужно полтора миллиона, сейчас на счету 400 тысяч",
+        {"sum": 1_500_000, "capital": 400_000, "reason": "покупка автомобиля"},
+    ),
+    (
+        "хочу путешествовать, нужно 500 тыс за год",
+        {"term": 12, "sum": 500_000, "reason": "путешествие"},
+    ),
+    (
+        "финансовая подушка безопасности на черный день",
+        {"reason": "финансовая подушка"},
+    ),
+    ("хочу открыть свое дело через 3 года", {"term": 36, "reason": "открытие бизнеса"}),
+    (
+        "накопить на обучение ребенка в университете 3 млн",
+        {"sum": 3_000_000, "reason": "образование"},
+    ),
+    ("начинаю с нуля, цель 1 млн", {"capital": 0, "sum": 1_000_000}),
+    ("у меня уже 10 лет стаж", {}),
+    ("зарплата 150 тысяч в месяц", {}),
+    ("Привет! Помоги составить портфель", {}),
+    ("Сколько нужно инвестировать?", {}),
+    ("думаю про 2 или 3 года", {}),
+    ("3 млн", {}),
+    (
+        "хочу дачу за 6 млн через 7 лет, сбережений пока нет",
+        {"sum": 6_000_000, "term": 84, "capital": 0, "reason": "покупка дома"},
+    ),
+    (
+        "Есть 2 млн. Хочу за 4 года получить 3 млн",
+        {"capital": 2_000_000, "term": 48, "sum": 3_000_000},
+    ),
+    (
+        "цель 700 000 на отпуск в течение 2 лет",
+        {"sum": 700_000, "term": 24, "reason": "путешествие"},
+    ),
+    (
+        "хочу купить автомобиль стоимостью 3 200 000 рублей",
+        {"sum": 3_200_000, "reason": "покупка автомобиля"},
+    ),
+    ("мне 45, думаю о пенсии через 15 лет", {"term": 180, "reason": "пенсия"}),
+    (
+        "имеется 100 тыс руб, хочу 1 млн за 5 лет",
+        {"capital": 100_000, "sum": 1_000_000, "term": 60},
+    ),
+    (
+        "Хочу квартиру. Срок 10 лет. Нужно 12 млн. Есть 2 млн.",
+        {
+            "reason": "покупка квартиры",
+            "term": 120,
+            "sum": 12_000_000,
+            "capital": 2_000_000,
+        },
+    ),
+    ("ежемесячно могу откладывать 30 тыс, цель — дом", {"reason": "покупка дома"}),
+    ("за два года 900 тысяч на свадьбу накопить", {"term": 24, "reason": "свадьба"}),
+]
+
+
+def score(corpus):
+    correct = extracted = expected = 0
+    failures = []
+    for message, truth in corpus:
+        fields = extract_goal_fields(message)
+        expected += len(truth)
+        extracted += len(fields)
+        for field, value in fields.items():
+            if field in truth and truth[field] == value:
+                correct += 1
+            else:
+                failures.append((message, field, value, truth.get(field)))
+    return correct / max(extracted, 1), correct / max(expected, 1), failures
+
+
+def test_corpus_precision_and_recall():
+    precision, recall, failures = score(CORPUS)
+
+    # Ошибочное поле хуже пропущенного: пропуск доберет LLM
+    assert precision >= 0.97, failures
+    assert recall >= 0.9, failures
+
+
+def test_loan_term_is_not_a_savings_term():
+    # Все поля, кроме срока, заполнены: срок ипотеки не должен закрыть цель без LLM
+    fields = extract_goal_fields(
+        "хочу квартиру за 10 млн, есть 2 млн, ипотека на 20 лет"
+    )
+    assert "term" not in fields
+    assert fields["sum"] == 10_000_000 and fields["capital"] == 2_000_000
+
+    assert "term" not in extract_goal_fields(
+        "взять кредит сроком на 5 лет и купить машину"
+    )
+    assert extract_goal_fields(
+        "хочу собрать на первоначальный взнос по ипотеке за 3 года 2 млн"
+    ) == {"term": 36, "sum": 2_000_000, "reason": "первоначальный взнос по ипотеке"}
+
+
+def test_throughput():
+    messages = [message for message, _ in CORPUS] * 50
+    started = time.perf_counter()
+    for message in messages:
+        extract_goal_fields(message)
+    rate = len(messages) / (time.perf_counter() - started)
+
+    assert rate > 5000, f"{rate:.0f} сообщений/с"
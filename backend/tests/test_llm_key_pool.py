@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from app.core.redis_cache import cache
+from app.services.llm_key_pool import KeyPool, KeyPoolExhausted
+
+KEYS = ["key-a", "key-b", "key-c"]
+
+
+def rate_limit_error() -> Exception:
+    return Exception("Error code: 429 - rate limit exceeded")
+
+
+def test_concurrent_leases_spread_across_keys():
+    pool = KeyPool(KEYS, use_redis=False)
+
+    async def run():
+        leases = [await pool.acquire() for _ in range(6)]
+        return [key for key, _ in leases]
+
+    assert sorted(asyncio.run(run())) == sorted(KEYS * 2)
+
+
+def test_rate_limited_key_is_skipped_until_cooldown_ends():
+    pool = KeyPool(KEYS[:2], cooldown=60, use_redis=False)
+
+    async def run():
+        with pytest.raises(Exception):
+            async with pool.lease() as key:
+                assert key == "key-a"
+                raise rate_limit_error()
+        return [(await pool.acquire())[0] for _ in range(3)]
+
+    assert asyncio.run(run()) == ["key-b"] * 3
+
+
+def test_exhausted_budget_raises_when_wait_exceeds_timeout():
+    pool = KeyPool(
+        ["key-a"], rate_per_minute=1, burst=1, acquire_timeout=0.5, use_redis=False
+    )
+
+    async def run():
+        await pool.acquire()
+        with pytest.raises(KeyPoolExhausted):
+            await pool.acquire()
+
+    asyncio.run(run())
+
+
+def test_exhausted_budget_waits_for_refill():
+    pool = KeyPool(["key-a"], rate_per_minute=600, burst=1, use_redis=False)
+
+    async def run():
+        await pool.acquire()
+        started = asyncio.get_running_loop().time()
+        await pool.acquire()
+        return asyncio.get_running_loop().time() - started
+
+    assert 0.05 <= asyncio.run(run()) < 0.5
+
+
+@pytest.mark.skipif(not cache.enabled, reason="нужен Redis")
+def test_redis_state_is_shared_between_pools():
+    keys = [f"shared-{i}-{uuid.uuid4().hex}" for i in range(2)]
+    first, second = KeyPool(keys), KeyPool(keys)
+
+    async def run():
+        key, _ = await first.acquire()
+        other, _ = await second.acquire()
+        await first.report_rate_limit(other, retry_after=30)
+        third, _ = await second.acquire()
+        return key, other, third
+
+    key, other, third = asyncio.run(run())
+    cache.delete(*[name for i in range(2) for name in first._redis_keys(i)])
+
+    assert key != other
+    assert third == key
+
+
+def test_lease_reports_openai_rate_limit_error():
+    pool = KeyPool(["key-a"], use_redis=False)
+    calls = []
+
+    async def report(api_key, retry_after=None):
+        calls.append((api_key, retry_after))
+
+    pool.report_rate_limit = report
+
+    response = httpx.Response(
+        429,
+        headers={"retry-after": "7"},
+        request=httpx.Request("POST", "http://llm.test/v1/chat/completions"),
+    )
+
+    async def run():
+        with pytest.raises(RateLimitError):
+            async with pool.lease():
+                raise RateLimitError("rate limited", response=response, body=None)
+
+    asyncio.run(run())
+    assert calls == [("key-a", 7.0)]
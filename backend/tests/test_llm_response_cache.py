@@ -0,0 +1,157 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from benchmarks.openai_stub import run_stub_openai
+
+from app.core.redis_cache import cache
+from app.services import llm_service
+from app.services.llm_key_pool import KeyPool
+from app.services.llm_response_cache import ResponseCache, cache_key
+
+
+def user(text: str) -> list:
+    return [{"role": "user", "content": text}]
+
+
+def test_key_ignores_case_punctuation_and_spaces():
+    assert cache_key(user("Хочу накопить на квартиру, за 5 лет!"), "m") == cache_key(
+        user("  хочу  накопить на КВАРТИРУ за 5 лет"), "m"
+    )
+    assert cache_key(user("за 5 лет"), "m") != cache_key(user("за 5 лет"), "other")
+
+
+def test_similar_first_turn_hits_only_with_same_numbers():
+    response_cache = ResponseCache(enabled=True, similarity=0.8, use_redis=False)
+
+    async def run():
+        await response_cache.put(
+            user("хочу накопить на квартиру за 5 лет"), "m", "ответ"
+        )
+        return (
+            await response_cache.get(user("хочу накопить на квартиру за 5 лет"), "m"),
+            await response_cache.get(
+                user("хочу накопить деньги на квартиру за 5 лет"), "m"
+            ),
+            await response_cache.get(user("хочу накопить на квартиру за 10 лет"), "m"),
+        )
+
+    assert asyncio.run(run()) == ("ответ", "ответ", None)
+    assert response_cache.stats()["exact_hits"] == 1
+    assert response_cache.stats()["similar_hits"] == 1
+    assert response_cache.stats()["misses"] == 1
+
+
+def test_similar_first_turn_compares_numbers_written_as_words():
+    response_cache = ResponseCache(enabled=True, similarity=0.8, use_redis=False)
+
+    async def run():
+        await response_cache.put(
+            user("хочу накопить на квартиру за пять лет"), "m", "ответ"
+        )
+        return (
+            await response_cache.get(
+                user("хочу накопить деньги на квартиру за пять лет"), "m"
+            ),
+            await response_cache.get(
+                user("хочу накопить на квартиру за десять лет"), "m"
+            ),
+            await response_cache.get(user("хочу накопить на квартиру за 10 лет"), "m"),
+        )
+
+    assert asyncio.run(run()) == ("ответ", None, None)
+
+
+def test_disabled_cache_is_a_no_op():
+    response_cache = ResponseCache(enabled=False, use_redis=False)
+
+    async def run():
+        await response_cache.put(user("привет"), "m", "ответ")
+        return await response_cache.get(user("привет"), "m")
+
+    assert asyncio.run(run()) is None
+
+
+@pytest.mark.skipif(not cache.enabled, reason="нужен Redis")
+def test_redis_entries_are_evicted_least_recently_used(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.llm_response_cache.LRU_KEY", f"test:lru:{uuid.uuid4().hex}"
+    )
+    response_cache = ResponseCache(enabled=True, ttl=60, max_entries=2)
+    prompts = [user(f"вопрос {uuid.uuid4().hex}") for _ in range(3)]
+
+    async def run():
+        await response_cache.put(prompts[0], "m", "0")
+        await response_cache.put(prompts[1], "m", "1")
+        await response_cache.get(prompts[0], "m")
+        await response_cache.put(prompts[2], "m", "2")
+        return [await response_cache.get(prompt, "m") for prompt in prompts]
+
+    assert asyncio.run(run()) == ["0", None, "2"]
+
+
+def test_repeated_first_turn_is_served_without_llm_call(monkeypatch):
+    monkeypatch.setattr(llm_service, "key_pool", KeyPool(["key-1"], use_redis=False))
+    monkeypatch.setattr(
+        llm_service, "response_cache", ResponseCache(enabled=True, use_redis=False)
+    )
+    users = [uuid.uuid4().hex, uuid.uuid4().hex]
+
+    async def run():
+        async with run_stub_openai(
+            ["Отличная цель! На какой срок?"], first_token_delay=0.3
+        ) as (
+            base_url,
+            stats,
+        ):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            first = await llm_service.send_to_llm(users[0], "Хочу накопить на квартиру")
+            started = time.perf_counter()
+            second = await llm_service.send_to_llm(
+                users[1], "хочу накопить на квартиру"
+            )
+            elapsed = time.perf_counter() - started
+            for user_id in users:
+                await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            return first, second, elapsed, stats.requests
+
+    first, second, elapsed, requests = asyncio.run(run())
+
+    assert first == second == ("Отличная цель! На какой срок?", None)
+    assert requests == 1
+    assert elapsed < 0.05
+
+
+def test_similar_first_turn_hits_through_send_to_llm(monkeypatch):
+    # В промпте первой реплики есть сообщение состояния с полями цели
+    monkeypatch.setattr(llm_service, "key_pool", KeyPool(["key-1"], use_redis=False))
+    monkeypatch.setattr(
+        llm_service,
+        "response_cache",
+        ResponseCache(enabled=True, similarity=0.8, use_redis=False),
+    )
+    users = [uuid.uuid4().hex, uuid.uuid4().hex]
+
+    async def run():
+        async with run_stub_openai(["На какой срок?"]) as (base_url, stats):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            first = await llm_service.send_to_llm(
+                users[0], "Хочу накопить 2 млн на квартиру"
+            )
+            prompt = await llm_service.chat_history.build_prompt(users[0])
+            second = await llm_service.send_to_llm(
+                users[1], "хочу накопить деньги, 2 млн на квартиру"
+            )
+            for user_id in users:
+                await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            return first, second, prompt, stats.requests
+
+    first, second, prompt, requests = asyncio.run(run())
+
+    assert prompt[0]["role"] == "system"
+    assert first == second
+    assert requests == 1
+    assert llm_service.response_cache.stats()["similar_hits"] == 1
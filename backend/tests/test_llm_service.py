@@ -0,0 +1,218 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from benchmarks.openai_stub import OpenAIStubStats, run_stub_openai
+
+from app.services import llm_service
+from app.services.llm_key_pool import KeyPool, KeyPoolExhausted, is_rate_limit
+
+
+def test_rate_limit_cools_key_and_retries_on_another(monkeypatch):
+    stats = OpenAIStubStats(rate_limited={"key-1": 1})
+    monkeypatch.setattr(
+        llm_service, "key_pool", KeyPool(["key-1", "key-2"], use_redis=False)
+    )
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        async with run_stub_openai(
+            ['Понял. {"term": 60, "sum": 5000000}'], first_token_delay=0, stats=stats
+        ) as (base_url, _):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            result = await llm_service.send_to_llm(user_id, "Хочу квартиру")
+            history = await llm_service.get_conversation(user_id)
+            await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            return result, history
+
+    (text, data), history = asyncio.run(run())
+
+    assert stats.keys == ["key-1", "key-2"]
+    assert stats.bodies[-1]["messages"][-1]["content"] == "Хочу квартиру"
+    assert text == "Понял."
+    # reason разобран из сообщения локально и дополняет JSON блок модели
+    assert data == {"term": 60, "sum": 5000000, "reason": "покупка квартиры"}
+    assert [m.role for m in history] == ["user", "assistant"]
+
+
+def test_exhausted_key_pool_fails_without_retries(monkeypatch):
+    pool = KeyPool(
+        ["key-1", "key-2"],
+        rate_per_minute=1,
+        burst=1,
+        acquire_timeout=0.2,
+        use_redis=False,
+    )
+    monkeypatch.setattr(llm_service, "key_pool", pool)
+    user_id = uuid.uuid4().hex
+    acquired = []
+    acquire = pool.acquire
+
+    async def counting_acquire():
+        acquired.append(1)
+        return await acquire()
+
+    async def run():
+        await pool.acquire()
+        await pool.acquire()
+        monkeypatch.setattr(pool, "acquire", counting_acquire)
+        try:
+            with pytest.raises(KeyPoolExhausted) as exhausted:
+                await llm_service.send_to_llm(user_id, "Хочу квартиру")
+        finally:
+            await llm_service.clear_conversation(user_id)
+        return exhausted.value
+
+    exhausted = asyncio.run(run())
+
+    assert not is_rate_limit(exhausted)
+    assert acquired == [1]
+
+
+def test_client_is_reused_per_key():
+    async def run():
+        first = llm_service.get_client("key-1")
+        assert llm_service.get_client("key-1") is first
+        assert llm_service.get_client("key-2") is not first
+        await llm_service.close_clients()
+
+    asyncio.run(run())
+
+
+def feed_all(chunks):
+    withholder = llm_service.JsonBlockWithholder()
+    shown = "".join(withholder.feed(chunk) for chunk in chunks)
+    return shown + withholder.finish(), withholder
+
+
+def test_withholder_hides_json_block_split_across_chunks():
+    reply = (
+        'Отлично, записал цель. {"term": 60, "sum": 5000000, "reason": "квартира"} '
+        "Дальше риск-профиль."
+    )
+    chunks = [reply[i : i + 7] for i in range(0, len(reply), 7)]
+
+    shown, withholder = feed_all(["\n\n"] + chunks)
+
+    assert "{" not in shown and "term" not in shown
+    assert shown == "Отлично, записал цель.  Дальше риск-профиль."
+    assert withholder.text == reply
+
+
+def test_withholder_releases_braces_that_are_not_json():
+    shown, _ = feed_all(["Формула {не json", "} и все"])
+
+    assert shown == "Формула {не json} и все"
+
+
+def test_stream_first_token_arrives_before_completion(monkeypatch):
+    words = ["Слово "] * 20 + ['{"term": 60, "sum": false}']
+    monkeypatch.setattr(llm_service, "key_pool", KeyPool(["key-1"], use_redis=False))
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        async with run_stub_openai(words, first_token_delay=0.2, token_delay=0.05) as (
+            base_url,
+            stats,
+        ):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            started = time.perf_counter()
+            first_token = None
+            tokens = []
+            async for kind, payload in llm_service.stream_llm(user_id, "Привет"):
+                if kind == "token":
+                    first_token = first_token or time.perf_counter() - started
+                    tokens.append(payload)
+                else:
+                    done = payload
+            total = time.perf_counter() - started
+            await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            assert stats.bodies[0]["stream"] is True
+            return first_token, total, tokens, done
+
+    first_token, total, tokens, done = asyncio.run(run())
+
+    assert first_token < 0.5
+    assert total > 1.0
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Слово " * 20
+    assert done == ("Слово " * 19 + "Слово", {"term": 60, "sum": False})
+
+
+def test_stalled_stream_client_does_not_hold_key_lease(monkeypatch):
+    pool = KeyPool(["key-1"], use_redis=False)
+    monkeypatch.setattr(llm_service, "key_pool", pool)
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        async with run_stub_openai(
+            ["Слово "] * 5, first_token_delay=0.05, token_delay=0.01
+        ) as (
+            base_url,
+            _,
+        ):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            stream = llm_service.stream_llm(user_id, "Привет")
+            assert (await stream.__anext__())[0] == "token"
+            # Клиент не забирает токены, а модель уже ответила
+            await asyncio.sleep(0.5)
+            leases = dict(pool._local_state(0, time.time()).leases)
+            await stream.aclose()
+            await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            return leases
+
+    assert asyncio.run(run()) == {}
+
+
+def test_complete_goal_in_message_skips_llm(monkeypatch):
+    monkeypatch.setattr(llm_service, "key_pool", KeyPool(["key-1"], use_redis=False))
+    user_id = uuid.uuid4().hex
+
+    async def run():
+        async with run_stub_openai(
+            ['Понял. {"capital": false}'], first_token_delay=0
+        ) as (
+            base_url,
+            stats,
+        ):
+            monkeypatch.setattr(llm_service, "LLM_BASE_URL", base_url)
+            partial = await llm_service.send_to_llm(
+                user_id, "Хочу квартиру за 3 млн через 5 лет"
+            )
+            prompt = stats.bodies[0]["messages"]
+            complete = await llm_service.send_to_llm(user_id, "есть 500 тыс")
+            await llm_service.clear_conversation(user_id)
+            await llm_service.close_clients()
+            return partial, prompt, complete, stats.requests
+
+    partial, prompt, (text, data), requests = asyncio.run(run())
+
+    assert prompt[0]["role"] == "system" and "3000000" in prompt[0]["content"]
+    assert partial[1]["term"] == 60 and partial[1]["capital"] is False
+    assert requests == 1
+    assert data == {
+        "term": 60,
+        "sum": 3_000_000,
+        "reason": "покупка квартиры",
+        "capital": 500_000,
+    }
+    assert "3 000 000 ₽" in text
+
+
+def test_in_flight_limit_works_in_each_event_loop(monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_MAX_IN_FLIGHT", 1)
+
+    async def contend():
+        async def hold():
+            async with llm_service.in_flight_slots():
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(hold(), hold())
+
+    # Второй asyncio.run, как в следующей задаче Celery
+    asyncio.run(contend())
+    asyncio.run(contend())
@@ -1,8 +1,9 @@
+import json
 import os
 from unittest.mock import MagicMock, patch
 
 with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}):
-    with patch('app.services.llm_service.OpenAI') as mock_openai:
+    with patch('app.services.llm_service.AsyncOpenAI') as mock_openai:
         mock_client = MagicMock()
         mock_openai.return_value = mock_client
 
@@ -33,3 +34,37 @@ def test_health_check():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok", "database": "connected"}
+
+
+def test_dialog_chat_stream_emits_tokens_then_goal_flags(monkeypatch):
+    async def fake_stream_llm(user_id, user_message):
+        yield "token", "Сколько "
+        yield "token", "лет копим?"
+        yield "done", ("Сколько лет копим?", {"sum": 1000000, "term": False})
+
+    monkeypatch.setattr("app.api.routes_dialog.stream_llm", fake_stream_llm)
+
+    response = client.post(
+        "/dialog/chat/stream", data={"user_id": "1", "message": "Хочу накопить"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0], json.loads(block.split("\n")[1][len("data: ") :]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert events[:2] == [
+        ("event: token", {"text": "Сколько "}),
+        ("event: token", {"text": "лет копим?"}),
+    ]
+    assert events[2] == (
+        "event: done",
+        {
+            "response": "Сколько лет копим?",
+            "term": False,
+            "sum": True,
+            "reason": False,
+            "capital": False,
+        },
+    )
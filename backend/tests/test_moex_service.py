@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import time
+
+from benchmarks.iss_stub import StubStats, run_stub_iss
+
+from app.services.moex_service import (
+    MoexClient,
+    fetch_all_prices_data_async,
+    find_nearest_trading_date,
+    pick_nearest_trading_date,
+)
+
+TICKERS = [(f"T{i:02d}", "акция", f"Тикер {i}") for i in range(20)]
+
+
+def _fetch(stats: StubStats, concurrency: int, latency: float = 0.05):
+    async def run():
+        async with run_stub_iss(latency=latency, stats=stats) as (base_url, _):
+            async with MoexClient(
+                base_url=base_url, max_concurrency=concurrency, retry_backoff=0.01
+            ) as client:
+                started = time.perf_counter()
+                data = await fetch_all_prices_data_async(TICKERS, client)
+                return data, time.perf_counter() - started
+
+    return asyncio.run(run())
+
+
+def test_fetch_all_prices_runs_tickers_concurrently():
+    stats = StubStats()
+    data, elapsed = _fetch(stats, concurrency=20)
+
+    assert set(data) == {ticker for ticker, _, _ in TICKERS}
+    assert all(item["current_price"] > 0 for item in data.values())
+    assert all(item["historical_prices_series"] for item in data.values())
+    assert all(item["historical_price"] > 0 for item in data.values())
+    # Последовательно это заняло бы requests * latency
+    assert elapsed < stats.requests * 0.05 / 4
+    assert stats.max_in_flight <= 20
+
+
+def test_fetch_retries_transient_errors():
+    stats = StubStats(failures_left={"T00": 2})
+    data, _ = _fetch(stats, concurrency=4, latency=0.0)
+
+    assert data["T00"]["current_price"] > 0
+    assert stats.failures_left["T00"] == 0
+
+
+def test_pick_nearest_trading_date_prefers_later_day_on_tie():
+    target = datetime.date(2023, 1, 7)  # суббота
+    prices = [
+        (datetime.date(2023, 1, 6), 10.0),
+        (datetime.date(2023, 1, 8), 12.0),
+        (datetime.date(2023, 1, 9), 0.0),
+    ]
+
+    assert pick_nearest_trading_date(prices, target) == (
+        12.0,
+        datetime.date(2023, 1, 8),
+    )
+    assert pick_nearest_trading_date([], target) is None
+
+
+def test_find_nearest_trading_date_uses_single_ranged_request():
+    stats = StubStats()
+    target = datetime.date(2022, 1, 1)  # суббота
+
+    async def run():
+        async with run_stub_iss(latency=0.0, stats=stats) as (base_url, _):
+            async with MoexClient(base_url=base_url) as client:
+                return await find_nearest_trading_date(
+                    client, "SBER", "stock", "shares", target, days_range=60
+                )
+
+    price, day = asyncio.run(run())
+
+    assert price > 0
+    assert day == datetime.date(2021, 12, 31)
+    # ±60 дней — меньше одной страницы ISS
+    assert stats.requests == 1
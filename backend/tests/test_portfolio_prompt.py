@@ -0,0 +1,75 @@
+import json
+
+from benchmarks.bench_portfolio_prompt import representative_portfolios
+
+from app.services.chat_history import estimate_tokens
+from app.services.portfolio_prompt import encode_portfolio
+
+
+def test_compact_prompt_keeps_portfolio_facts_in_fewer_tokens():
+    for _, _, payload in representative_portfolios():
+        prompt = encode_portfolio(payload)
+        recommendation = payload["recommendation"]
+
+        assert estimate_tokens(prompt) < 0.5 * estimate_tokens(
+            json.dumps(payload, ensure_ascii=False)
+        )
+        assert f"срок {payload['investment_term_months']} мес." in prompt
+        for comp in recommendation["composition"]:
+            assert f"{comp['asset_type']}|" in prompt
+            for asset in comp["assets"]:
+                assert (
+                    f"{asset['ticker']}|{comp['asset_type']}|{asset['name']}|" in prompt
+                )
+                assert f"|{asset['quantity']}|" in prompt
+        assert "Купить" not in prompt
+        assert prompt.count("\n") < 40
+
+
+def test_asset_listed_once_and_missing_sections_skipped():
+    asset = {
+        "name": "FinEx золото",
+        "type": "золото",
+        "ticker": "GOLD",
+        "quantity": 10,
+        "price": 2.345,
+        "weight": 1.0,
+        "amount": 23.45,
+        "expected_return": None,
+    }
+    payload = {
+        "target_amount": 100000.4,
+        "initial_capital": 0,
+        "investment_term_months": 12,
+        "annual_inflation_rate": 0.08,
+        "future_value_with_inflation": 108000.0,
+        "recommendation": {
+            "composition": [
+                {
+                    "asset_type": "золото",
+                    "target_weight": 0.5,
+                    "actual_weight": 0.5,
+                    "amount": 23.45,
+                    "assets": [asset],
+                },
+                {
+                    "asset_type": "прочее",
+                    "target_weight": 0.5,
+                    "actual_weight": 0.5,
+                    "amount": 23.45,
+                    "assets": [asset],
+                },
+            ],
+        },
+    }
+
+    prompt = encode_portfolio(payload)
+
+    assert prompt.count("GOLD|") == 1
+    assert "GOLD|золото|FinEx золото|10|2.35|100|-" in prompt
+    assert (
+        "сумма цели 100000 | с инфляцией 108000 | капитал 0 | "
+        "срок 12 мес. | инфляция 8/год" in prompt
+    )
+    assert "риск-профиль - | горизонт - |" in prompt
+    assert "План" not in prompt
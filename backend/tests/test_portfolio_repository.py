@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from app.core.database import Base
+from app.models.asset import Asset
+from app.models.portfolio import (
+    AssetAllocation,
+    MonthlyPayment,
+    PlanStep,
+    Portfolio,
+    PortfolioComposition,
+    StepAction,
+    StepByStepPlan,
+)
+from app.models.user import User  # noqa: F401 — нужен для relationship("User")
+from app.repositories.portfolio_repository import PortfolioRepository
+from app.schemas.portfolio import PortfolioCalculationResponse
+
+pytest.importorskip("aiosqlite")
+
+TABLES = [
+    Asset.__table__,
+    Portfolio.__table__,
+    MonthlyPayment.__table__,
+    PortfolioComposition.__table__,
+    AssetAllocation.__table__,
+    StepByStepPlan.__table__,
+    PlanStep.__table__,
+    StepAction.__table__,
+]
+TICKERS = ["SBER", "GAZP", "OFZ1", "OFZ2", "OFZ3", "TMOS"]
+
+
+def portfolio_data(compositions: dict, steps: dict) -> PortfolioCalculationResponse:
+    """compositions — {тип актива: [тикеры]}, steps — {заголовок: [действия]}"""
+    return PortfolioCalculationResponse(
+        target_amount=1_000_000,
+        initial_capital=100_000,
+        investment_term_months=36,
+        annual_inflation_rate=8.0,
+        future_value_with_inflation=1_260_000,
+        recommendation={
+            "target_amount": 1_000_000,
+            "initial_capital": 100_000,
+            "investment_term_months": 36,
+            "annual_inflation_rate": 8.0,
+            "future_value_with_inflation": 1_260_000,
+            "risk_profile": "Умеренный",
+            "time_horizon": "3–7 лет",
+            "smart_goal": "Накопить 1 млн",
+            "total_investment": 100_000,
+            "expected_portfolio_return": 12.0,
+            "composition": [
+                {
+                    "asset_type": asset_type,
+                    "target_weight": 0.5,
+                    "actual_weight": 0.5,
+                    "amount": 50_000,
+                    "assets": [
+                        {
+                            "name": ticker,
+                            "type": asset_type,
+                            "ticker": ticker,
+                            "quantity": i + 1,
+                            "price": 100.0,
+                            "weight": 0.1,
+                            "amount": 100.0 * (i + 1),
+                        }
+                        for i, ticker in enumerate(tickers)
+                    ],
+                }
+                for asset_type, tickers in compositions.items()
+            ],
+            "monthly_payment_detail": {
+                "monthly_payment": 20_000,
+                "future_capital": 1_000_000,
+                "total_months": 36,
+                "monthly_rate": 0.01,
+                "annuity_factor": 43.0,
+            },
+            "step_by_step_plan": {
+                "steps": [
+                    {
+                        "step_number": n,
+                        "title": title,
+                        "description": "",
+                        "actions": actions,
+                    }
+                    for n, (title, actions) in enumerate(steps.items(), 1)
+                ],
+                "generated_at": "2024-01-01T00:00:00",
+                "total_steps": len(steps),
+            },
+        },
+    )
+
+
+def test_create_portfolio_links_children_to_their_parents():
+    compositions = {
+        "облигации": ["OFZ1", "OFZ2", "OFZ3"],
+        "акции": ["SBER", "GAZP"],
+        "фонды": ["TMOS"],
+    }
+    steps = {
+        "Открыть счет": ["Выбрать брокера", "Подать заявку"],
+        "Купить": [],
+        "Пополнять": ["Раз в месяц"],
+    }
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=TABLES)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            session.add_all([Asset(name=t, ticker=t, type="акция") for t in TICKERS])
+            await session.commit()
+            repo = PortfolioRepository(session)
+            # Первый портфель сдвигает id, чтобы они не совпадали с позициями
+            await repo.create_portfolio(
+                portfolio_data({"фонды": ["TMOS"]}, {"Старт": ["Шаг"]}), 1
+            )
+            created = await repo.create_portfolio(
+                portfolio_data(compositions, steps), 1
+            )
+
+        async with session_factory() as session:
+            portfolio = (
+                await session.execute(
+                    select(Portfolio)
+                    .where(Portfolio.id == created.id)
+                    .options(
+                        selectinload(Portfolio.portfolio_compositions)
+                        .selectinload(PortfolioComposition.asset_allocations)
+                        .selectinload(AssetAllocation.asset),
+                        selectinload(Portfolio.step_by_step_plan)
+                        .selectinload(StepByStepPlan.plan_steps)
+                        .selectinload(PlanStep.step_actions),
+                    )
+                )
+            ).scalar_one()
+            saved_compositions = {
+                comp.asset_type: [
+                    (a.asset.ticker, a.quantity)
+                    for a in sorted(comp.asset_allocations, key=lambda a: a.id)
+                ]
+                for comp in portfolio.portfolio_compositions
+            }
+            plan = portfolio.step_by_step_plan
+            saved_steps = {
+                step.title: [
+                    a.action_text
+                    for a in sorted(step.step_actions, key=lambda a: a.action_order)
+                ]
+                for step in sorted(plan.plan_steps, key=lambda s: s.step_number)
+            }
+        await engine.dispose()
+        return saved_compositions, saved_steps
+
+    saved_compositions, saved_steps = asyncio.run(run())
+
+    assert saved_compositions == {
+        asset_type: [(ticker, i + 1) for i, ticker in enumerate(tickers)]
+        for asset_type, tickers in compositions.items()
+    }
+    assert list(saved_steps.items()) == list(steps.items())
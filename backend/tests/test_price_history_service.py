@@ -0,0 +1,83 @@
+import asyncio
+import datetime
+import math
+
+from benchmarks.iss_stub import StubStats, run_stub_iss
+
+from app.services import price_history_service
+from app.services.moex_service import MoexClient
+from app.services.price_history_service import (
+    BACKFILL_DAYS,
+    fetch_price_history_delta,
+    parse_history_rows,
+)
+
+COLUMNS = ["TRADEDATE", "BOARDID", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
+
+
+def test_parse_history_rows_keeps_most_liquid_board_per_day():
+    rows = [
+        ["2024-01-10", "SMAL", 101.0, 102.0, 100.0, 101.5, 10],
+        ["2024-01-10", "TQBR", 100.0, 103.0, 99.0, 102.0, 5000],
+        ["2024-01-09", "TQBR", None, None, None, None, 0],
+        ["2024-01-08", "TQBR", 98.0, 99.0, 97.0, 98.5, 4000],
+    ]
+
+    candles = parse_history_rows(COLUMNS, rows, asset_id=7)
+
+    assert [c["date"] for c in candles] == [
+        datetime.date(2024, 1, 8),
+        datetime.date(2024, 1, 10),
+    ]
+    assert candles[1]["open_price"] == 100.0
+    assert candles[1]["volume"] == 5000
+    assert all(c["asset_id"] == 7 for c in candles)
+
+
+def test_backfill_pages_through_cursor_and_delta_is_one_request():
+    stats = StubStats()
+    today = datetime.date.today()
+
+    async def run():
+        async with run_stub_iss(latency=0.0, stats=stats) as (base_url, _):
+            async with MoexClient(base_url=base_url) as client:
+                backfill = await fetch_price_history_delta(
+                    client,
+                    "SBER",
+                    "акция",
+                    1,
+                    today - datetime.timedelta(days=BACKFILL_DAYS),
+                )
+                backfill_requests = stats.requests
+                delta = await fetch_price_history_delta(
+                    client, "SBER", "акция", 1, today - datetime.timedelta(days=7)
+                )
+                return backfill, backfill_requests, delta
+
+    backfill, backfill_requests, delta = asyncio.run(run())
+
+    assert len(backfill) > 700
+    assert backfill_requests == math.ceil(len(backfill) / 100)
+    assert 0 < len(delta) <= 6
+    assert stats.requests == backfill_requests + 1
+
+
+def test_unexpected_iss_columns_skip_only_that_ticker(monkeypatch):
+    async def fake_rows(client, ticker, engine, market, params):
+        if ticker == "BROKEN":
+            return ["TRADEDATE", "CLOSE"], [["2024-01-10", 100.0]]
+        return COLUMNS, [["2024-01-10", "TQBR", 100.0, 103.0, 99.0, 102.0, 5000]]
+
+    monkeypatch.setattr(price_history_service, "fetch_history_rows", fake_rows)
+    since = datetime.date(2024, 1, 1)
+
+    async def run():
+        return await asyncio.gather(
+            fetch_price_history_delta(None, "BROKEN", "акция", 1, since),
+            fetch_price_history_delta(None, "SBER", "акция", 2, since),
+        )
+
+    broken, sber = asyncio.run(run())
+
+    assert broken == []
+    assert [c["asset_id"] for c in sber] == [2]
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+import redis
+
+from app.core.redis_cache import (
+    AsyncRedisCache,
+    MemoryStore,
+    RedisCache,
+    async_cache,
+    cache,
+    user_index_key,
+)
+
+
+def test_user_index_key():
+    assert user_index_key("user:42:portfolio") == "user:42:keys"
+    assert user_index_key("user:42:keys") is None
+    assert user_index_key("assets:universe:version") is None
+    assert user_index_key("user:42") is None
+
+
+def test_clear_user_cache_removes_only_own_keys():
+    user_id = uuid.uuid4().hex
+    other_id = uuid.uuid4().hex
+    cache.set_json(f"user:{user_id}:llm_goal", {"goal": 1})
+    cache.append_to_list(f"user:{user_id}:chat_history", {"role": "user"})
+    cache.set_json(f"user:{other_id}:llm_goal", {"goal": 2})
+
+    async def run():
+        await async_cache.set_json(f"user:{user_id}:portfolio", {"id": 1})
+        return await async_cache.clear_user_cache(user_id)
+
+    assert asyncio.run(run()) == 3
+    assert cache.get_json(f"user:{user_id}:llm_goal") is None
+    assert cache.get_list(f"user:{user_id}:chat_history") == []
+    assert cache.get_json(f"user:{other_id}:llm_goal") == {"goal": 2}
+    cache.clear_user_cache(other_id)
+
+
+@pytest.mark.skipif(not cache.enabled, reason="нужен Redis")
+def test_delete_pattern_scans_in_batches(monkeypatch):
+    monkeypatch.setattr("app.core.redis_cache.SCAN_BATCH_SIZE", 7)
+    prefix = f"test:{uuid.uuid4().hex}"
+    for i in range(25):
+        cache.client.set(f"{prefix}:{i}", i)
+
+    assert cache.delete_pattern(f"{prefix}:*") == 25
+    assert cache.client.keys(f"{prefix}:*") == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_expires_keys():
+    clock = FakeClock()
+    store = MemoryStore(clock=clock)
+    store.set("a", {"x": 1}, expire=10)
+    store.append("chat", {"role": "user"}, expire=5)
+
+    clock.now = 6
+    assert store.get("a") == {"x": 1}
+    assert store.get("chat") is None
+
+    clock.now = 11
+    assert store.get("a") is None
+    assert len(store) == 0 and store.nbytes == 0
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_items=2)
+    store.set("a", 1, expire=60)
+    store.set("b", 2, expire=60)
+    store.get("a")
+    store.set("c", 3, expire=60)
+
+    assert store.get("b") is None
+    assert store.get("a") == 1 and store.get("c") == 3
+
+
+def test_memory_store_respects_byte_budget():
+    store = MemoryStore(max_bytes=200)
+    for i in range(50):
+        store.append("chat", {"content": "x" * 20, "i": i}, expire=60)
+        store.set(f"key:{i}", "y" * 30, expire=60)
+
+    assert store.nbytes <= 200
+    store.set("huge", "z" * 500, expire=60)
+    assert store.get("huge") is None
+
+
+@pytest.mark.skipif(not cache.enabled, reason="нужен Redis")
+def test_cache_falls_back_and_reconnects(monkeypatch):
+    monkeypatch.setattr("app.core.redis_cache.REDIS_RECONNECT_INTERVAL", 0)
+    fallback = RedisCache()
+    live_client = fallback.client
+    fallback.client = redis.Redis.from_url(
+        "redis://localhost:1/0", socket_connect_timeout=0.2
+    )
+    key = f"test:{uuid.uuid4().hex}"
+
+    fallback.set_json(key, {"v": 1})
+    assert fallback.get_json(key) == {"v": 1}
+    assert live_client.get(key) is None
+
+    fallback.client = live_client
+    assert fallback.enabled
+    fallback.set_json(key, {"v": 2})
+    assert json.loads(live_client.get(key)) == {"v": 2}
+    live_client.delete(key)
+
+
+class BlockingClient:
+    def ping(self):
+        raise AssertionError("синхронный PING в event loop")
+
+
+@pytest.mark.skipif(not cache.enabled, reason="нужен Redis")
+def test_async_cache_reconnects_in_background(monkeypatch):
+    monkeypatch.setattr("app.core.redis_cache.REDIS_RECONNECT_INTERVAL", 0)
+    fallback = RedisCache()
+    fallback.mark_unavailable(ConnectionError("down"))
+    fallback.client = BlockingClient()
+    async_fallback = AsyncRedisCache(fallback)
+
+    async def run():
+        # Флаг читается сразу, PING уходит фоновой задачей
+        assert not async_fallback.enabled
+        await async_fallback._reconnect
+        return async_fallback.enabled
+
+    assert asyncio.run(run())
@@ -0,0 +1,146 @@
+import random
+import time
+
+import numpy as np
+
+from app.schemas.risk_profile import RiskAnswer
+from app.services.risk_profile_engine import (
+    N_COLUMNS,
+    PROFILES,
+    ProfileEngine,
+    encode_answers,
+    engine,
+)
+from app.services.risk_profile_service import (
+    calculate_profile_v2,
+    calculate_profile_v2_with_clarifications,
+    check_all_contradictions,
+)
+
+
+def legacy_profile(answers_map: dict, llm_data: dict = None) -> tuple:
+    """Прежний расчет calculate_profile_v2 на if-цепочках"""
+    scores = {"A": [2, 0, 0], "B": [0, 1, 0], "C": [0, 0, 3]}
+    cons = mod = agr = 0
+    for question_id, answer in answers_map.items():
+        if 1 <= question_id <= 11 and answer in scores:
+            c, m, a = scores[answer]
+            cons, mod, agr = cons + c, mod + m, agr + a
+
+    r_cons, r_mod, r_agr = cons, mod, agr
+    if answers_map.get(1) == "A":
+        r_agr = min(r_agr, r_mod)
+    if answers_map.get(6) == "A" or (
+        answers_map.get(9) == "A" and answers_map.get(7) == "A"
+    ):
+        r_agr, r_mod, r_cons = 0, 0, max(r_cons, 8)
+    if r_agr >= 15:
+        profile = "Агрессивный"
+    elif r_cons >= 12:
+        profile = "Консервативный"
+    else:
+        profile = "Умеренный"
+
+    horizons = {"A": "До 3 лет", "B": "3–7 лет", "C": "Более 7 лет"}
+    horizon = (
+        horizons.get(llm_data.get("horizon"))
+        if llm_data
+        else horizons.get(answers_map.get(1))
+    )
+    return profile, cons, mod, agr, horizon
+
+
+def random_questionnaire(rng: random.Random) -> tuple:
+    answers_map = {
+        question_id: rng.choice("ABC")
+        for question_id in range(1, 12)
+        if rng.random() > 0.1
+    }
+    llm_data = None
+    if rng.random() > 0.3:
+        llm_data = {"horizon": rng.choice("ABC"), "capital_size": rng.choice("ABC")}
+    return answers_map, llm_data
+
+
+def test_engine_matches_legacy_rules():
+    rng = random.Random(7)
+    for _ in range(3000):
+        answers_map, llm_data = random_questionnaire(rng)
+        answers = [
+            RiskAnswer(question_id=q, answer=f"{a}) вариант")
+            for q, a in answers_map.items()
+        ]
+
+        result = calculate_profile_v2(answers, llm_data)
+
+        assert (
+            result.profile,
+            result.conservative_score,
+            result.moderate_score,
+            result.aggressive_score,
+            result.investment_horizon,
+        ) == legacy_profile(answers_map, llm_data)
+        codes = encode_answers(answers_map, llm_data)
+        assert engine.contradictions(codes) == [
+            c["code"] for c in check_all_contradictions(answers_map, llm_data)
+        ]
+
+
+def test_batch_matches_single_questionnaires():
+    rng = random.Random(11)
+    questionnaires = [random_questionnaire(rng) for _ in range(500)]
+    codes = np.array([encode_answers(a, llm) for a, llm in questionnaires])
+
+    batch = engine.score_batch(codes)
+
+    for i, (answers_map, llm_data) in enumerate(questionnaires):
+        profile, cons, mod, agr, _ = legacy_profile(answers_map, llm_data)
+        assert PROFILES[batch["profile"][i]] == profile
+        assert (
+            batch["conservative"][i],
+            batch["moderate"][i],
+            batch["aggressive"][i],
+        ) == (cons, mod, agr)
+
+
+def test_clarifications_change_answers_before_scoring():
+    answers = [RiskAnswer(question_id=q, answer="C") for q in range(1, 12)]
+    answers[5] = RiskAnswer(question_id=6, answer="A")
+    llm_data = {"horizon": "C", "capital_size": "B"}
+
+    result = calculate_profile_v2_with_clarifications(
+        answers,
+        [{"code": "low_risk_buy_dip", "answer": "B) Готов к умеренному риску"}],
+        llm_data,
+    )
+
+    # Вопрос 8 стал B: из агрессивных баллов ушли 3, добавился 1 умеренный
+    assert (
+        result.conservative_score,
+        result.moderate_score,
+        result.aggressive_score,
+    ) == (2, 1, 27)
+    # Просадка до -10% ограничивает профиль, но 8 баллов меньше порога 12
+    assert result.profile == "Умеренный"
+    assert result.investment_horizon == "Более 7 лет"
+
+
+def test_custom_tables_compile_for_backtesting():
+    lenient = ProfileEngine(restrictions=[])
+    codes = encode_answers({q: "C" for q in range(1, 12)} | {6: "A"})
+
+    assert engine.profile(codes).profile == "Умеренный"
+    assert lenient.profile(codes).profile == "Агрессивный"
+
+
+def test_batch_scores_100k_questionnaires_per_second():
+    codes = np.random.default_rng(0).integers(
+        0, 4, size=(200_000, N_COLUMNS), dtype=np.int8
+    )
+    engine.score_batch(codes[:1000])
+
+    started = time.perf_counter()
+    engine.score_batch(codes)
+    elapsed = time.perf_counter() - started
+
+    assert len(codes) / elapsed > 100_000
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.whisper_batcher import WhisperBatcher
+
+
+class FakeModel:
+    """Батч обрабатывается за фиксированное время, результаты — item * 10"""
+
+    def __init__(self, duration=0.1, fail=False):
+        self.duration = duration
+        self.fail = fail
+        self.batches = []
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.duration)
+        if self.fail:
+            raise RuntimeError("воркер упал")
+        return [item * 10 for item in items]
+
+
+def test_concurrent_items_share_batches_and_get_own_results():
+    model = FakeModel()
+    batcher = WhisperBatcher(model, max_batch=4, max_wait=0.05)
+
+    async def run():
+        return await asyncio.gather(*[batcher.submit(i) for i in range(10)])
+
+    results = asyncio.run(run())
+
+    assert results == [i * 10 for i in range(10)]
+    assert [len(batch) for batch in model.batches] == [4, 4, 2]
+
+
+def test_single_item_waits_at_most_max_wait():
+    model = FakeModel(duration=0)
+    batcher = WhisperBatcher(model, max_batch=8, max_wait=0.05)
+
+    async def run():
+        started = time.perf_counter()
+        result = await batcher.submit(1)
+        return result, time.perf_counter() - started
+
+    result, latency = asyncio.run(run())
+
+    assert result == 10
+    assert 0.04 < latency < 0.15
+
+
+def test_items_arriving_while_worker_busy_form_next_batch():
+    model = FakeModel(duration=0.2)
+    batcher = WhisperBatcher(model, max_batch=8, max_wait=0.01)
+
+    async def run():
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.05)
+        later = []
+        for i in range(1, 4):
+            later.append(asyncio.ensure_future(batcher.submit(i)))
+            await asyncio.sleep(0.03)
+        return await asyncio.gather(first, *later)
+
+    results = asyncio.run(run())
+
+    assert results == [0, 10, 20, 30]
+    assert model.batches == [[0], [1, 2, 3]]
+
+
+def test_failed_batch_fails_its_items_only():
+    model = FakeModel(fail=True)
+    batcher = WhisperBatcher(model, max_batch=2, max_wait=0.01)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    model.fail = False
+    assert asyncio.run(batcher.submit(3)) == 30
+
+
+def test_cancelled_item_is_not_sent_to_model():
+    model = FakeModel()
+    batcher = WhisperBatcher(model, max_batch=8, max_wait=0.05)
+
+    async def run():
+        gone = asyncio.ensure_future(batcher.submit(1))
+        kept = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        return await kept
+
+    assert asyncio.run(run()) == 20
+    assert model.batches == [[2]]
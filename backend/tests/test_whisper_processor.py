@@ -0,0 +1,384 @@
+import asyncio
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.services.audio_stream import SAMPLE_RATE
+from app.services.whisper_processor import WhisperProcessor, spool_upload
+
+
+def fake_init(model_type, int8):
+    pass
+
+
+def slow_init(model_type, int8):
+    time.sleep(1.0)
+
+
+def fake_warm_up():
+    return "cpu"
+
+
+def failing_warm_up():
+    raise RuntimeError("модель не загрузилась")
+
+
+def tone_decoder(path):
+    """Вместо ffmpeg: файл «1 2» — фразы по 1 и 2 с тона через секунду тишины"""
+    with open(path) as f:
+        seconds = [int(word) for word in f.read().split() if word.isdigit()]
+    audio = [np.zeros(SAMPLE_RATE, dtype=np.float32)]
+    for length in seconds:
+        t = np.arange(length * SAMPLE_RATE) / SAMPLE_RATE
+        audio += [(0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), audio[0]]
+    audio = np.concatenate(audio)
+    for start in range(0, len(audio), SAMPLE_RATE // 2):
+        yield audio[start : start + SAMPLE_RATE // 2]
+
+
+def phrase_texts(segments):
+    # Фраза с отступами тишины по краям: 1 с тона — около 1.4 с
+    return [f"{len(segment) // SAMPLE_RATE}с" for segment in segments]
+
+
+def fast_transcribe(segments, language):
+    return {"texts": [""] * len(segments), "device_used": "cpu"}
+
+
+def fake_transcribe(segments, language):
+    time.sleep(0.5)
+    return {"texts": phrase_texts(segments), "device_used": "cpu"}
+
+
+def phrase_transcribe(segments, language):
+    time.sleep(0.2)
+    return {"texts": phrase_texts(segments), "device_used": "cpu"}
+
+
+def batch_size_transcribe(segments, language):
+    time.sleep(0.1)
+    return {"texts": [str(len(segments))] * len(segments), "device_used": "cpu"}
+
+
+def upload(text: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(text.encode()), filename="voice.ogg")
+
+
+def test_api_process_does_not_import_torch():
+    code = (
+        "import sys, app.main; "
+        "print('torch' in sys.modules or 'whisper' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip().endswith("False")
+
+
+def test_saturated_queue_answers_503_without_waiting():
+    processor = WhisperProcessor(
+        workers=1,
+        max_queue=1,
+        task=fake_transcribe,
+        initializer=fake_init,
+        decoder=tone_decoder,
+        use_cache=False,
+    )
+
+    async def run():
+        first = asyncio.create_task(processor.transcribe_audio_file(upload("1")))
+        second = asyncio.create_task(processor.transcribe_audio_file(upload("2")))
+        await asyncio.sleep(0)
+        while processor.pending < 2:
+            await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as rejected:
+            await processor.transcribe_audio_file(upload("3"))
+        rejected_after = time.perf_counter() - started
+
+        return await asyncio.gather(first, second), rejected.value, rejected_after
+
+    try:
+        results, rejected, rejected_after = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    assert [r["text"] for r in results] == ["1с", "2с"]
+    assert results[0]["filename"] == "voice.ogg"
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"]
+    assert rejected_after < 0.1
+    assert processor.pending == 0
+
+
+def test_warm_up_loads_workers_before_first_request():
+    processor = WhisperProcessor(
+        workers=1,
+        task=fast_transcribe,
+        initializer=slow_init,
+        warm_up_task=fake_warm_up,
+        decoder=tone_decoder,
+        use_cache=False,
+    )
+
+    async def run():
+        await processor.warm_up()
+        started = time.perf_counter()
+        await processor.transcribe_audio_file(upload("1"))
+        return time.perf_counter() - started
+
+    try:
+        first_request = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    assert first_request < 0.5
+
+
+def test_failed_warm_up_drops_pool():
+    processor = WhisperProcessor(
+        workers=1,
+        task=fast_transcribe,
+        initializer=fake_init,
+        warm_up_task=failing_warm_up,
+        decoder=tone_decoder,
+        use_cache=False,
+    )
+
+    async def run():
+        await processor.warm_up()
+        dropped = processor._pool is None
+        result = await processor.transcribe_audio_file(upload("1"))
+        return dropped, result
+
+    try:
+        dropped, result = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    assert dropped
+    assert result["device_used"] == "cpu"
+
+
+def test_int8_quantisation_replaces_whisper_linear_layers():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("whisper")
+    from whisper.model import ModelDimensions, Whisper
+
+    from app.services.whisper_worker import quantize_int8
+
+    dims = ModelDimensions(
+        n_mels=80,
+        n_audio_ctx=1500,
+        n_audio_state=64,
+        n_audio_head=2,
+        n_audio_layer=1,
+        n_vocab=51865,
+        n_text_ctx=448,
+        n_text_state=64,
+        n_text_head=2,
+        n_text_layer=1,
+    )
+    model = Whisper(dims).eval()
+    mel = torch.randn(1, 80, 3000)
+    with torch.no_grad():
+        expected = model.encoder(mel)
+        quantized = quantize_int8(model)
+        actual = quantized.encoder(mel)
+
+    linear = quantized.encoder.blocks[0].mlp[0]
+    assert type(linear).__module__.startswith("torch.ao.nn.quantized.dynamic")
+    assert (
+        torch.nn.functional.cosine_similarity(
+            expected.flatten(), actual.flatten(), dim=0
+        )
+        > 0.99
+    )
+
+
+def test_stream_file_yields_phrases_before_result():
+    processor = WhisperProcessor(
+        workers=1,
+        max_batch=1,
+        task=phrase_transcribe,
+        initializer=fake_init,
+        decoder=tone_decoder,
+        use_cache=False,
+    )
+
+    async def run():
+        path, _ = await spool_upload(upload("1 2 3"))
+        events = []
+        async for kind, payload in processor.stream_file(path, "voice.ogg"):
+            events.append((kind, payload, time.perf_counter()))
+        return path, events
+
+    try:
+        path, events = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    assert [(kind, payload) for kind, payload, _ in events[:3]] == [
+        ("partial", "1с"),
+        ("partial", "2с"),
+        ("partial", "3с"),
+    ]
+    assert events[-1][0] == "done"
+    assert events[-1][1] == {
+        "text": "1с 2с 3с",
+        "device_used": "cpu",
+        "filename": "voice.ogg",
+    }
+    # Первая фраза пришла заметно раньше результата
+    assert events[-1][2] - events[0][2] > 0.3
+    assert processor.pending == 0
+    assert not os.path.exists(path)
+
+
+def test_concurrent_requests_share_worker_batches():
+    processor = WhisperProcessor(
+        workers=1,
+        max_queue=8,
+        max_batch=8,
+        max_wait=0.05,
+        task=batch_size_transcribe,
+        initializer=fake_init,
+        decoder=tone_decoder,
+        use_cache=False,
+    )
+
+    async def run():
+        await processor.transcribe_audio_file(upload("1"))  # поднимаем пул
+        return await asyncio.gather(
+            *[processor.transcribe_audio_file(upload("1 1")) for _ in range(4)]
+        )
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    sizes = [int(size) for r in results for size in r["text"].split()]
+    assert len(sizes) == 8
+    # Восемь фраз четырех запросов ушли меньше чем восемью прогонами
+    assert processor.batcher.batches - 1 < 8
+    assert max(sizes) > 1
+    assert processor.pending == 0
+
+
+def test_spool_upload_reads_in_bounded_chunks():
+    size = 32 * 1024 * 1024
+    source = io.BytesIO(os.urandom(1024) * (size // 1024))
+    reads = []
+
+    class TrackingUpload(UploadFile):
+        async def read(self, size=-1):
+            reads.append(size)
+            return await super().read(size)
+
+    tracemalloc.start()
+    try:
+        path, audio_hash = asyncio.run(
+            spool_upload(TrackingUpload(file=source, filename="long.ogg"))
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    try:
+        assert os.path.getsize(path) == size
+        assert audio_hash == hashlib.sha256(source.getvalue()).hexdigest()
+        assert path.endswith(".ogg")
+        assert max(reads) <= 1024 * 1024 and -1 not in reads
+        assert peak < 4 * 1024 * 1024
+    finally:
+        os.unlink(path)
+
+
+def test_repeated_upload_is_served_from_transcript_cache():
+    processor = WhisperProcessor(
+        workers=1, task=fake_transcribe, initializer=fake_init, decoder=tone_decoder
+    )
+    other_tier = WhisperProcessor(
+        int8=True,
+        workers=1,
+        task=fake_transcribe,
+        initializer=fake_init,
+        decoder=tone_decoder,
+    )
+    content = f"1 2 {uuid.uuid4().hex}"
+
+    async def run():
+        first = await processor.transcribe_audio_file(upload(content))
+        batches = processor.batcher.batches
+        started = time.perf_counter()
+        events = []
+        path, audio_hash = await spool_upload(upload(content))
+        async for event in processor.stream_file(path, "voice.ogg", audio_hash):
+            events.append(event)
+        repeated_after = time.perf_counter() - started
+        assert processor.batcher.batches == batches
+        assert not os.path.exists(path)
+        # Та же запись другой моделью распознается заново
+        other = await other_tier.transcribe_audio_file(upload(content))
+        return first, events, repeated_after, other
+
+    try:
+        first, events, repeated_after, other = asyncio.run(run())
+    finally:
+        processor.shutdown()
+        other_tier.shutdown()
+
+    assert first["text"] == "1с 2с"
+    assert first["device_used"] == "cpu"
+    assert events == [
+        ("partial", "1с"),
+        ("partial", "2с"),
+        ("done", {"text": "1с 2с", "device_used": "cache", "filename": "voice.ogg"}),
+    ]
+    assert repeated_after < 0.2
+    assert other["device_used"] == "cpu"
+
+
+def test_cached_upload_is_served_when_workers_are_busy():
+    processor = WhisperProcessor(
+        workers=1,
+        max_queue=0,
+        task=fake_transcribe,
+        initializer=fake_init,
+        decoder=tone_decoder,
+    )
+    content = f"1 {uuid.uuid4().hex}"
+
+    async def run():
+        await processor.transcribe_audio_file(upload(content))
+        busy = asyncio.create_task(
+            processor.transcribe_audio_file(upload(f"2 {uuid.uuid4().hex}"))
+        )
+        while processor.pending < 1:
+            await asyncio.sleep(0.01)
+
+        repeated = await processor.transcribe_audio_file(upload(content))
+        with pytest.raises(HTTPException) as rejected:
+            await processor.transcribe_audio_file(upload(f"3 {uuid.uuid4().hex}"))
+        await busy
+        return repeated, rejected.value
+
+    try:
+        repeated, rejected = asyncio.run(run())
+    finally:
+        processor.shutdown()
+
+    assert repeated["device_used"] == "cache"
+    assert rejected.status_code == 503
@@ -224,20 +224,48 @@ export async function calculatePortfolio(userId: string) {
   return handleResponse<PortfolioCalculationResponse>(res);
 }
 
+export type PortfolioAnalysisJob = {
+  job_id: string;
+  portfolio_id: string;
+  status: "queued" | "running" | "done" | "failed";
+  analysis?: string | null;
+  error?: string | null;
+};
+
+const ANALYSIS_POLL_INTERVAL_MS = 1500;
+// Дольше анализ не ждем: задача могла потеряться вместе с воркером
+const ANALYSIS_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
 export async function fetchPortfolioAnalysis(
   token: string,
   portfolioId: string | number,
 ) {
+  const headers = {
+    "Content-Type": "application/json",
+    Authorization: `Bearer ${token}`,
+  };
+  // Анализ выполняется в фоне: получаем job_id и опрашиваем статус
   const res = await fetch(buildUrl("/portfolios/analyze"), {
     method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      Authorization: `Bearer ${token}`,
-    },
-    body: JSON.stringify({ portfolio_id: portfolioId }),
+    headers,
+    body: JSON.stringify({ portfolio_id: String(portfolioId) }),
   });
-  const data = await handleResponse<PortfolioAnalysisResponse>(res); // Исправлено с PortfolioAnalysisReponse на PortfolioAnalysisResponse
-  return data.analysis;
+  let job = await handleResponse<PortfolioAnalysisJob>(res);
+  const deadline = Date.now() + ANALYSIS_POLL_TIMEOUT_MS;
+  while (job.status === "queued" || job.status === "running") {
+    if (Date.now() >= deadline) {
+      throw new Error("Анализ портфеля занимает слишком много времени, попробуйте позже");
+    }
+    await new Promise((resolve) => setTimeout(resolve, ANALYSIS_POLL_INTERVAL_MS));
+    const statusRes = await fetch(buildUrl(`/portfolios/analyze/${job.job_id}`), {
+      headers,
+    });
+    job = await handleResponse<PortfolioAnalysisJob>(statusRes);
+  }
+  if (job.status === "failed") {
+    throw new Error(job.error || "Не удалось проанализировать портфель");
+  }
+  return job.analysis ?? "";
 }
 
 export const analyzePortfolio = async (userId: string): Promise<PortfolioAnalysisResponse> => {